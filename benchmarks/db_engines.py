@@ -0,0 +1,103 @@
+"""
+Benchmark for the database engines selectable with MF_METADATA_DB_ENGINE.
+
+Runs the same read queries on an aiopg and an asyncpg backed database adapter:
+  - get_tasks: tasks of a step, as served by the metadata service
+  - get_artifacts_in_runs: artifacts of a run, as served by the metadata service
+  - ui_task_list: tasks of a run with the status and duration joins, as served by the UI service
+
+Requires a database configured through the MF_METADATA_DB_* environment variables,
+and the asyncpg package to be installed.
+
+    python -m benchmarks.db_engines --tasks 500 --artifacts 10 --iterations 50
+"""
+import asyncio
+
+import click
+
+from services.data import TaskRow
+from services.ui_backend_service.data.db import AsyncPostgresDB as UIAsyncPostgresDB
+
+from .utils import cleanup, init_db, measure, print_results, setup_task
+
+ENGINES = ["aiopg", "asyncpg"]
+
+
+async def seed(db, task, tasks: int, artifacts: int):
+    "Add tasks with artifacts to the step of the given task"
+    created = (await db.task_table_postgres.add_tasks([
+        TaskRow(task["flow_id"], task["run_number"], task["run_id"], "benchmark", task["step_name"])
+        for _ in range(tasks)
+    ])).body
+    for created_task in created + [task]:
+        await db.artifact_table_postgres.add_artifacts([{
+            "flow_id": task["flow_id"],
+            "run_number": task["run_number"],
+            "run_id": task["run_id"],
+            "step_name": task["step_name"],
+            "task_id": created_task["task_id"],
+            "task_name": None,
+            "name": "artifact_{}".format(i),
+            "location": "s3://benchmark/{}/{}".format(created_task["task_id"], i),
+            "ds_type": "s3",
+            "sha": "sha",
+            "type": "metaflow.artifact",
+            "content_type": "gzip+pickle-v2",
+            "user_name": "benchmark",
+            "attempt_id": 0,
+            "tags": [],
+            "system_tags": [],
+        } for i in range(artifacts)])
+
+
+async def run_benchmark(tasks: int, artifacts: int, iterations: int):
+    setup_db = await init_db("benchmark:setup", engine="aiopg")
+    try:
+        task = await setup_task(setup_db)
+        await seed(setup_db, task, tasks, artifacts)
+
+        results = {}
+        for engine in ENGINES:
+            db = await init_db("benchmark:{}".format(engine), engine=engine)
+            ui_db = await init_db("benchmark:ui:{}".format(engine), engine=engine, db_class=UIAsyncPostgresDB)
+            try:
+                # warm up connections and statement caches
+                await db.task_table_postgres.get_tasks(task["flow_id"], task["run_number"], task["step_name"])
+
+                with measure(db, results, "{} get_tasks".format(engine)):
+                    for _ in range(iterations):
+                        await db.task_table_postgres.get_tasks(task["flow_id"], task["run_number"], task["step_name"])
+
+                with measure(db, results, "{} get_artifacts_in_runs".format(engine)):
+                    for _ in range(iterations):
+                        await db.artifact_table_postgres.get_artifacts_in_runs(
+                            task["flow_id"], task["run_number"], latest_attempt=True)
+
+                with measure(ui_db, results, "{} ui_task_list".format(engine)):
+                    for _ in range(iterations):
+                        await ui_db.task_table_postgres.find_records(
+                            conditions=["flow_id = %s", "run_number = %s"],
+                            values=[task["flow_id"], task["run_number"]],
+                            order=["ts_epoch DESC"], limit=1000, enable_joins=True, expanded=True)
+            finally:
+                for adapter in [db, ui_db]:
+                    adapter.pool.close()
+                    await adapter.pool.wait_closed()
+
+        print("{} tasks with {} artifacts each, {} iterations".format(tasks + 1, artifacts, iterations))
+        print_results(results, iterations)
+    finally:
+        await cleanup(setup_db)
+
+
+@click.command()
+@click.option('--tasks', default=500, help='number of tasks in the benchmarked run')
+@click.option('--artifacts', default=10, help='artifacts per task')
+@click.option('--iterations', default=50, help='number of times each query is run per engine')
+def main(tasks, artifacts, iterations):
+    """Compare query latency of the aiopg and asyncpg database engines"""
+    asyncio.get_event_loop().run_until_complete(run_benchmark(tasks, artifacts, iterations))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Benchmark for the metadata ingest path of the metadata service.
+
+Replays the work done by MetadataApi.create_metadata for a number of requests,
+comparing inserting metadata row by row against the batched add_metadata_many(),
+and reports database round-trips and latency per request.
+
+Requires a database configured through the MF_METADATA_DB_* environment variables.
+
+    python -m benchmarks.metadata_ingest --requests 200 --fields 8
+"""
+import asyncio
+
+import click
+
+from .utils import cleanup, init_db, measure, print_results, setup_task
+
+
+def metadata_payload(task, fields: int):
+    return [{
+        "flow_id": task["flow_id"],
+        "run_number": task["run_number"],
+        "run_id": task["run_id"],
+        "step_name": task["step_name"],
+        "task_id": task["task_id"],
+        "task_name": task["task_name"],
+        "field_name": "benchmark-field-{}".format(i),
+        "value": str(i),
+        "type": "benchmark",
+        "user_name": "benchmark",
+        "tags": ["attempt_id:0"],
+        "system_tags": ["runtime:benchmark"],
+    } for i in range(fields)]
+
+
+async def run_benchmark(requests: int, fields: int):
+    db = await init_db()
+    try:
+        task = await setup_task(db)
+        payload = metadata_payload(task, fields)
+
+        async def resolve_ids():
+            await db.get_run_ids(task["flow_id"], task["run_number"])
+            await db.get_task_ids(task["flow_id"], task["run_number"], task["step_name"], task["task_id"])
+
+        results = {}
+        with measure(db, results, "add_metadata"):
+            for _ in range(requests):
+                await resolve_ids()
+                for datum in payload:
+                    await db.metadata_table_postgres.add_metadata(**datum)
+
+        with measure(db, results, "add_metadata_many"):
+            for _ in range(requests):
+                await resolve_ids()
+                await db.metadata_table_postgres.add_metadata_many(payload)
+
+        print("{} requests with {} metadata fields each".format(requests, fields))
+        print_results(results, requests)
+    finally:
+        await cleanup(db)
+
+
+@click.command()
+@click.option('--requests', default=100, help='number of simulated POST requests')
+@click.option('--fields', default=8, help='metadata fields per request')
+def main(requests, fields):
+    """Compare round-trips per request of row by row and batched metadata ingest"""
+    asyncio.get_event_loop().run_until_complete(run_benchmark(requests, fields))
+
+
+if __name__ == "__main__":
+    main()
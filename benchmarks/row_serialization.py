@@ -0,0 +1,83 @@
+"""
+Benchmark for serializing large query results.
+
+Fetches all tasks and all artifacts of a run, and serializes them in two ways:
+  - dict_cursor: DictCursor rows, a row object per row, and serialize() on each of them
+  - tuple_cursor: tuple rows mapped by column position into the serialized dicts, as done by execute_sql()
+
+Reports throughput and the peak memory allocated while fetching and serializing, as traced by tracemalloc.
+Requires a database configured through the MF_METADATA_DB_* environment variables.
+
+    python -m benchmarks.row_serialization --tasks 20000 --artifacts 5 --iterations 5
+"""
+import asyncio
+import time
+import tracemalloc
+
+import click
+import psycopg2.extras
+
+from .db_engines import seed
+from .utils import cleanup, init_db, setup_task
+
+
+async def dict_cursor(table, sql: str, values):
+    with (await table.db.pool.cursor(cursor_factory=psycopg2.extras.DictCursor)) as cur:
+        await cur.execute(sql, values)
+        records = await cur.fetchall()
+        cur.close()
+    return [table._row_type(**record).serialize() for record in records]
+
+
+async def tuple_cursor(table, sql: str, values):
+    response, _ = await table.execute_sql(select_sql=sql, values=values)
+    return response.body
+
+
+async def run_benchmark(tasks: int, artifacts: int, iterations: int):
+    db = await init_db("benchmark")
+    try:
+        task = await setup_task(db)
+        await seed(db, task, tasks - 1, artifacts)
+
+        queries = [
+            (db.task_table_postgres, "tasks"),
+            (db.artifact_table_postgres, "artifacts"),
+        ]
+        print("{:<24} {:>10} {:>14} {:>14} {:>16}".format("mode", "rows", "ms/query", "rows/s", "peak memory MB"))
+        for table, label in queries:
+            sql = "SELECT {keys} FROM {table_name} WHERE flow_id = %s AND run_number = %s".format(
+                keys=", ".join(table.select_columns), table_name=table.table_name)
+            values = (task["flow_id"], task["run_number"])
+
+            for mode, fetch in [("dict_cursor", dict_cursor), ("tuple_cursor", tuple_cursor)]:
+                # warm up
+                rows = await fetch(table, sql, values)
+
+                start = time.perf_counter()
+                for _ in range(iterations):
+                    await fetch(table, sql, values)
+                seconds = (time.perf_counter() - start) / iterations
+
+                tracemalloc.start()
+                rows = await fetch(table, sql, values)
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+
+                print("{:<24} {:>10} {:>14.1f} {:>14.0f} {:>16.1f}".format(
+                    "{} {}".format(label, mode), len(rows), seconds * 1000, len(rows) / seconds, peak / 1024 / 1024))
+    finally:
+        await cleanup(db)
+
+
+@click.command()
+@click.option('--tasks', default=20000, help='number of tasks in the benchmarked run')
+@click.option('--artifacts', default=5, help='artifacts per task')
+@click.option('--iterations', default=5, help='number of times each query is run per mode')
+def main(tasks, artifacts, iterations):
+    """Compare throughput and memory of serializing query results from dict and tuple cursors"""
+    asyncio.get_event_loop().run_until_complete(run_benchmark(tasks, artifacts, iterations))
+
+
+if __name__ == "__main__":
+    main()
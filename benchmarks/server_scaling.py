@@ -0,0 +1,142 @@
+"""
+Load benchmark for serving the metadata service with multiple workers.
+
+Starts the metadata service with each of the given numbers of workers, and drives it with metadata ingest requests
+from several load generating processes for a fixed duration. Reports throughput and latency per number of workers,
+and the speedup over the first one.
+
+The service and the load generators run on the same host, so leave cores for the load generators, eg. benchmark
+up to 4 workers on an 8 core host. Requires a database configured through the MF_METADATA_DB_* environment variables.
+
+    python -m benchmarks.server_scaling --workers 1,2,4 --clients 4 --concurrency 32 --duration 20
+"""
+import asyncio
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+
+import aiohttp
+import click
+
+from .metadata_ingest import metadata_payload
+from .utils import cleanup, init_db, setup_task
+
+
+def start_service(workers: int, port: int) -> subprocess.Popen:
+    env = dict(os.environ, MF_METADATA_WORKERS=str(workers), MF_METADATA_PORT=str(port))
+    return subprocess.Popen([sys.executable, "-m", "services.metadata_service.server"], env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+async def wait_for_service(url: str, workers: int, timeout: float = 60):
+    "Wait until all workers are serving"
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() < deadline:
+            try:
+                async with session.get(url + "/ping") as response:
+                    if response.status == 200:
+                        if workers == 1:
+                            return
+                        async with session.get(url + "/healthcheck") as health:
+                            status = await health.json(content_type=None)
+                            # The health is encoded as a JSON string
+                            status = status if isinstance(status, dict) else json.loads(status)
+                            if sum(worker["status"] == "UP" for worker in status.get("workers", [])) >= workers:
+                                return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.2)
+    raise TimeoutError("Service with {} workers did not start".format(workers))
+
+
+async def generate_load(url: str, payload, concurrency: int, duration: float):
+    latencies = []
+    errors = 0
+    deadline = time.monotonic() + duration
+
+    async def client(session):
+        nonlocal errors
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            try:
+                async with session.post(url, json=payload) as response:
+                    await response.read()
+                    if response.status != 200:
+                        errors += 1
+                        continue
+            except aiohttp.ClientError:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        await asyncio.gather(*[client(session) for _ in range(concurrency)])
+    return latencies, errors
+
+
+def load_process(args):
+    url, payload, concurrency, duration = args
+    return asyncio.new_event_loop().run_until_complete(generate_load(url, payload, concurrency, duration))
+
+
+def percentile(values, fraction: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0
+
+
+async def run_benchmark(workers, clients: int, concurrency: int, duration: float, fields: int, port: int):
+    db = await init_db("benchmark")
+    try:
+        task = await setup_task(db)
+        payload = [{key: datum[key] for key in ["field_name", "value", "type", "user_name", "tags", "system_tags"]}
+                   for datum in metadata_payload(task, fields)]
+        base_url = "http://127.0.0.1:{}".format(port)
+        url = base_url + "/flows/{flow_id}/runs/{run_number}/steps/{step_name}/tasks/{task_id}/metadata".format(**task)
+
+        print("{} load processes with {} concurrent requests each, {} metadata fields per request, {}s per run".format(
+            clients, concurrency, fields, duration))
+        print("{:>8} {:>12} {:>12} {:>10} {:>10} {:>10}".format(
+            "workers", "requests", "requests/s", "p50 ms", "p99 ms", "speedup"))
+        baseline = None
+        for count in workers:
+            service = start_service(count, port)
+            try:
+                await wait_for_service(base_url, count)
+                with multiprocessing.get_context("spawn").Pool(clients) as pool:
+                    results = pool.map(load_process, [(url, payload, concurrency, duration)] * clients)
+            finally:
+                service.terminate()
+                service.wait()
+
+            latencies = [latency for result, _ in results for latency in result]
+            errors = sum(errors for _, errors in results)
+            throughput = len(latencies) / duration
+            baseline = baseline or throughput
+            print("{:>8} {:>12} {:>12.0f} {:>10.1f} {:>10.1f} {:>9.2f}x{}".format(
+                count, len(latencies), throughput, percentile(latencies, 0.5) * 1000,
+                percentile(latencies, 0.99) * 1000, throughput / baseline,
+                "  ({} errors)".format(errors) if errors else ""))
+    finally:
+        await cleanup(db)
+
+
+@click.command()
+@click.option('--workers', default="1,2,4", help='comma separated numbers of workers to benchmark')
+@click.option('--clients', default=4, help='number of load generating processes')
+@click.option('--concurrency', default=32, help='concurrent requests per load generating process')
+@click.option('--duration', default=20.0, help='seconds of load per number of workers')
+@click.option('--fields', default=8, help='metadata fields per request')
+@click.option('--port', default=18080, help='port to run the benchmarked service on')
+def main(workers, clients, concurrency, duration, fields, port):
+    """Compare ingest throughput of the metadata service served by different numbers of workers"""
+    asyncio.get_event_loop().run_until_complete(run_benchmark(
+        [int(count) for count in workers.split(",")], clients, concurrency, duration, fields, port))
+
+
+if __name__ == "__main__":
+    main()
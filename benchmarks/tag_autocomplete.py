@@ -0,0 +1,93 @@
+"""
+Benchmark for the tag autocomplete of the UI.
+
+Generates distinct synthetic tags, and looks up pages of tags in two ways:
+  - scan: filter all sorted tags with operators_to_filters and slice the page, as the autocomplete used to
+  - index: TagIndex lookups, with bisect for prefix (sw) and n-grams for contains (co) terms
+
+Reports the latency per query type, the time to build the index and to add tags of a new run to it.
+Runs in memory, no database is required.
+
+    python -m benchmarks.tag_autocomplete --tags 300000 --queries 200
+"""
+import random
+import string
+import time
+
+import click
+
+from services.ui_backend_service.api.utils import operators_to_filters
+from services.ui_backend_service.data.tag_index import TagIndex
+
+PREFIXES = ["user", "project", "branch", "team", "env", "run", "model", "dataset", "metaflow_version", "runtime"]
+
+
+def synthetic_tags(count: int, seed: int = 0):
+    rng = random.Random(seed)
+    tags = set()
+    while len(tags) < count:
+        value = "".join(rng.choices(string.ascii_lowercase + string.digits + "-_", k=rng.randint(4, 20)))
+        tags.add("{}:{}".format(rng.choice(PREFIXES), value))
+    return list(tags)
+
+
+def scan(tags, operator, term, limit, offset):
+    filter_func = operators_to_filters[operator]
+    return [tag for tag in tags if filter_func(tag, term)][offset:(offset + limit)]
+
+
+def percentile(values, fraction: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0
+
+
+def measure(lookup, queries):
+    latencies = []
+    for operator, term in queries:
+        start = time.perf_counter()
+        lookup(operator, term)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+@click.command()
+@click.option('--tags', default=300000, help='number of distinct tags')
+@click.option('--queries', default=200, help='lookups per query type')
+@click.option('--limit', default=10, help='tags per page')
+def main(tags, queries, limit):
+    """Compare latency of tag autocomplete lookups scanning all tags vs. the tag index"""
+    rng = random.Random(1)
+    all_tags = synthetic_tags(tags)
+    sorted_tags = sorted(all_tags)
+
+    start = time.perf_counter()
+    index = TagIndex(sorted_tags)
+    print("indexed {} tags in {:.2f}s".format(len(index), time.perf_counter() - start))
+
+    new_tags = ["user:new-{}".format(i) for i in range(5)]
+    start = time.perf_counter()
+    index.add(new_tags)
+    print("added the {} tags of a run in {:.3f}ms".format(len(new_tags), (time.perf_counter() - start) * 1000))
+
+    def terms(length):
+        samples = rng.sample(all_tags, queries)
+        return [tag[len(tag) - length:] if length < len(tag) else tag for tag in samples]
+
+    query_types = [
+        ("sw prefix", [("sw", tag.split(":", 1)[0] + ":" + tag.split(":", 1)[1][:2]) for tag in rng.sample(all_tags, queries)]),
+        ("co 2 chars", [("co", term) for term in terms(2)]),
+        ("co 5 chars", [("co", term) for term in terms(5)]),
+    ]
+    print("{:<12} {:>8} {:>12} {:>12}".format("query", "mode", "p50 ms", "p99 ms"))
+    for label, query in query_types:
+        for mode, lookup in [
+            ("scan", lambda operator, term: scan(sorted_tags, operator, term, limit, 0)),
+            ("index", lambda operator, term: index.find(operator, term, limit=limit)),
+        ]:
+            latencies = measure(lookup, query)
+            print("{:<12} {:>8} {:>12.3f} {:>12.3f}".format(
+                label, mode, percentile(latencies, 0.5) * 1000, percentile(latencies, 0.99) * 1000))
+
+
+if __name__ == "__main__":
+    main()
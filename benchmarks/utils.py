@@ -0,0 +1,91 @@
+import time
+from contextlib import contextmanager
+
+from services.data import FlowRow, RunRow, StepRow, TaskRow
+from services.data.postgres_async_db import _AsyncPostgresDB
+from services.utils import DBConfiguration
+
+BENCHMARK_FLOW_ID = "MetaflowServiceBenchmarkFlow"
+
+
+class CountingPool(object):
+    """
+    Proxy for an aiopg pool that counts cursor checkouts.
+    Every table operation checks out a cursor for a single statement, so this equals database round-trips.
+    """
+
+    def __init__(self, pool):
+        self._pool = pool
+        self.count = 0
+
+    def cursor(self, *args, **kwargs):
+        self.count += 1
+        return self._pool.cursor(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._pool, name)
+
+
+async def init_db(name="benchmark", engine: str = None, db_class=_AsyncPostgresDB) -> _AsyncPostgresDB:
+    "Initialize a database adapter with a round-trip counting pool, configured from the environment."
+    db_conf = DBConfiguration()
+    if engine:
+        db_conf.engine = engine
+    db = db_class(name)
+    await db._init(db_conf, create_triggers=False)
+    db.pool = CountingPool(db.pool)
+    return db
+
+
+async def setup_task(db: _AsyncPostgresDB, step_name="benchmark_step"):
+    "Create a flow, run, step and task to benchmark against, returning the created task."
+    await db.flow_table_postgres.add_flow(FlowRow(BENCHMARK_FLOW_ID, "benchmark"))
+    run = (await db.run_table_postgres.add_run(RunRow(BENCHMARK_FLOW_ID, "benchmark"))).body
+    await db.step_table_postgres.add_step(
+        StepRow(BENCHMARK_FLOW_ID, run["run_number"], None, "benchmark", step_name))
+    task = (await db.task_table_postgres.add_task(
+        TaskRow(BENCHMARK_FLOW_ID, run["run_number"], None, "benchmark", step_name))).body
+    return (await db.task_table_postgres.get_task(
+        BENCHMARK_FLOW_ID, run["run_number"], step_name, task["task_id"], expanded=True)).body
+
+
+async def cleanup(db: _AsyncPostgresDB):
+    "Remove all rows created by the benchmarks and close the pool. Order is important due to foreign keys."
+    tables = [
+        db.run_summary_table_postgres,
+        db.task_attempt_table_postgres,
+        db.metadata_table_postgres,
+        db.artifact_table_postgres,
+        db.task_table_postgres,
+        db.step_table_postgres,
+        db.run_table_postgres,
+        db.flow_table_postgres
+    ]
+    with (await db.pool.cursor()) as cur:
+        for table in tables:
+            await cur.execute(
+                "DELETE FROM {} WHERE flow_id = %s".format(table.table_name), (BENCHMARK_FLOW_ID,))
+    db.pool.close()
+    await db.pool.wait_closed()
+
+
+@contextmanager
+def measure(db: _AsyncPostgresDB, results: dict, label: str):
+    "Record elapsed time and round-trips of the wrapped block under results[label]"
+    start_count = db.pool.count
+    start = time.perf_counter()
+    yield
+    results[label] = {
+        "seconds": time.perf_counter() - start,
+        "round_trips": db.pool.count - start_count
+    }
+
+
+def print_results(results: dict, requests: int):
+    print("{:<32} {:>12} {:>20} {:>16}".format("mode", "total (s)", "round-trips/request", "ms/request"))
+    for label, result in results.items():
+        print("{:<32} {:>12.3f} {:>20.1f} {:>16.2f}".format(
+            label,
+            result["seconds"],
+            result["round_trips"] / requests,
+            result["seconds"] * 1000 / requests))
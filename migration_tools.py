@@ -1,3 +1,5 @@
+import time
+
 import click
 import requests
 
@@ -43,6 +45,71 @@ def metadata_service_version(base_url):
     print(response.text)
 
 
+@tools.command()
+@click.option('--base-url',
+              default=None,
+              required=True,
+              help='url to migration service ex: http://localhost:8082')
+@click.option('--older-than-days',
+              default=None,
+              type=float,
+              help='archive runs older than this many days, defaults to MF_ARCHIVE_OLDER_THAN_DAYS of the service')
+@click.option('--batch-size',
+              default=None,
+              type=int,
+              help='number of runs moved per transaction')
+@click.option('--max-runs-per-second',
+              default=None,
+              type=float,
+              help='upper limit for the archival rate, 0 for no limit')
+@click.option('--wait/--no-wait',
+              default=False,
+              help='print progress until the archival job has finished')
+def archive(base_url, older_than_days, batch_size, max_runs_per_second, wait):
+    """Move old runs to the archive tables"""
+    params = {
+        "older_than_days": older_than_days,
+        "batch_size": batch_size,
+        "max_runs_per_second": max_runs_per_second
+    }
+    url = base_url + "/archive"
+    response = requests.post(url, params={k: v for k, v in params.items() if v is not None})
+    print(response.json())
+    if not wait or response.status_code != 202:
+        return
+
+    progress = response.json()
+    while progress["state"] == "running":
+        time.sleep(5)
+        progress = requests.get(url).json()
+        print("{state}: {runs_archived}/{runs_total} runs archived".format(**progress))
+    print(progress)
+
+
+@tools.command()
+@click.option('--base-url',
+              default=None,
+              required=True,
+              help='url to migration service ex: http://localhost:8082')
+def archive_status(base_url):
+    """get progress of the latest archival job"""
+    url = base_url + "/archive"
+    response = requests.get(url)
+    print(response.json())
+
+
+@tools.command()
+@click.option('--base-url',
+              default=None,
+              required=True,
+              help='url to migration service ex: http://localhost:8082')
+def archive_cancel(base_url):
+    """stop the running archival job"""
+    url = base_url + "/archive"
+    response = requests.delete(url)
+    print(response.json())
+
+
 cli = click.CommandCollection(sources=[tools])
 
 
@@ -1 +1,2 @@
-from .models import FlowRow, RunRow, StepRow, TaskRow, ArtifactRow, MetadataRow
+from .models import FlowRow, RunRow, StepRow, TaskRow, ArtifactRow, MetadataRow, TaskAttemptRow, RunSummaryRow, \
+    RunTagRow
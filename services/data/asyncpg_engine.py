@@ -0,0 +1,279 @@
+"""
+asyncpg backed database engine.
+
+Exposes the subset of the aiopg pool and cursor interface used by the table classes in
+services.data.postgres_async_db, so that the same queries can run on either engine.
+asyncpg uses the binary protocol, prepares every statement and returns lightweight record objects,
+which support both key and index access similar to rows from a psycopg2 DictCursor.
+
+Queries keep using psycopg2 style %s placeholders. Parameters are converted to the types Postgres
+expects for the prepared statement, and errors are re-raised as the corresponding psycopg2 errors,
+so that error handling is identical for both engines.
+"""
+import asyncio
+import collections
+import contextlib
+import json
+import re
+from typing import Dict, List
+
+import psycopg2
+import psycopg2.errors
+import psycopg2.extensions
+
+from .db_utils import LRUCache, numbered_placeholders
+
+# Maximum number of prepared statements kept per connection
+STATEMENT_CACHE_SIZE = 1000
+
+status_rowcount_match = re.compile(r'(\d+)$')
+
+try:
+    import asyncpg
+except ImportError:
+    asyncpg = None
+
+StatementInfo = collections.namedtuple("StatementInfo", "parameters columns")
+
+# Same fields as the notifications received through aiopg connections
+Notify = collections.namedtuple("Notify", "pid channel payload")
+
+listen_match = re.compile(r'^\s*LISTEN\s+(\w+)\s*;?\s*$', re.IGNORECASE)
+
+
+async def create_pool(dsn: str, minsize: int = 1, maxsize: int = 10, timeout: int = 60) -> "AsyncpgPool":
+    """
+    Create an asyncpg connection pool, wrapped to provide the aiopg pool interface.
+
+    Parameters
+    ----------
+    dsn : str
+        libpq connection string, as provided by DBConfiguration.dsn
+    minsize : int
+        minimum number of connections in the pool
+    maxsize : int
+        maximum number of connections in the pool
+    timeout : int
+        seconds to wait when establishing a connection
+    """
+    if asyncpg is None:
+        raise Exception("The asyncpg database engine requires the 'asyncpg' package to be installed.")
+
+    pool = await asyncpg.create_pool(
+        min_size=minsize,
+        max_size=maxsize,
+        timeout=timeout,
+        init=_init_connection,
+        statement_cache_size=STATEMENT_CACHE_SIZE,
+        **_connect_kwargs(dsn))
+    return AsyncpgPool(pool, minsize, maxsize)
+
+
+def _connect_kwargs(dsn: str) -> Dict:
+    "Translate a libpq connection string to asyncpg.connect() arguments"
+    params = psycopg2.extensions.parse_dsn(dsn)
+    kwargs = {
+        "host": params.get("host"),
+        "port": int(params["port"]) if "port" in params else None,
+        "user": params.get("user"),
+        "password": params.get("password"),
+        "database": params.get("dbname"),
+    }
+    if "sslmode" in params:
+        kwargs["ssl"] = params["sslmode"]
+    return {key: value for key, value in kwargs.items() if value is not None}
+
+
+async def _init_connection(conn):
+    # Decode json columns to Python objects like psycopg2 does.
+    # Values are serialized by the table classes before inserting, so strings are passed through as is.
+    for type_name in ["json", "jsonb"]:
+        await conn.set_type_codec(
+            type_name,
+            encoder=lambda value: value if isinstance(value, str) else json.dumps(value),
+            decoder=json.loads,
+            schema="pg_catalog")
+
+
+class AsyncpgPool(object):
+    "aiopg pool interface for an asyncpg pool"
+
+    def __init__(self, pool, minsize: int, maxsize: int):
+        self._pool = pool
+        self.minsize = minsize
+        self.maxsize = maxsize
+        self._closing = None
+        # Parameter types and result shape of each query. These do not depend on the connection.
+        self.statements = LRUCache(STATEMENT_CACHE_SIZE)
+
+    @property
+    def size(self) -> int:
+        return self._pool.get_size()
+
+    @property
+    def freesize(self) -> int:
+        return self._pool.get_idle_size()
+
+    async def cursor(self, cursor_factory=None) -> "AsyncpgCursor":
+        conn = await self._pool.acquire()
+        return AsyncpgCursor(self, conn)
+
+    async def release(self, conn):
+        await self._pool.release(conn)
+
+    @contextlib.asynccontextmanager
+    async def acquire(self):
+        conn = await self._pool.acquire()
+        try:
+            yield AsyncpgConnection(self, conn)
+        finally:
+            await self._pool.release(conn)
+
+    async def statement_info(self, conn, query: str) -> StatementInfo:
+        info = self.statements.get(query)
+        if info is None:
+            statement = await conn.prepare(query)
+            info = StatementInfo(statement.get_parameters(), [attribute.name for attribute in statement.get_attributes()])
+            self.statements.set(query, info)
+        return info
+
+    def close(self):
+        self._closing = asyncio.ensure_future(self._pool.close())
+
+    async def wait_closed(self):
+        if self._closing is not None:
+            await self._closing
+
+
+class AsyncpgConnection(object):
+    """
+    aiopg connection interface for a connection acquired from an asyncpg pool.
+    Notifications for channels subscribed to with 'LISTEN channel' are put on the notifies queue.
+    """
+
+    def __init__(self, pool: AsyncpgPool, conn):
+        self._pool = pool
+        self._conn = conn
+        self.notifies = asyncio.Queue()
+
+    def cursor(self) -> "AsyncpgCursor":
+        return AsyncpgCursor(self._pool, self._conn, notifies=self.notifies, release=False)
+
+
+class AsyncpgCursor(object):
+    """
+    aiopg cursor interface for a connection acquired from an asyncpg pool.
+    The connection is returned to the pool when the cursor context is exited.
+    """
+    # asyncpg prepares every statement, there is no need to PREPARE them explicitly.
+    prepares_statements = True
+
+    def __init__(self, pool: AsyncpgPool, conn, notifies: asyncio.Queue = None, release: bool = True):
+        self._pool = pool
+        self.connection = conn
+        self.rowcount = -1
+        # Same as DB API cursors: a 7-item sequence per result column, starting with its name
+        self.description = None
+        self.closed = False
+        self._records = None
+        self._notifies = notifies
+        self._release = release
+
+    async def execute(self, sql: str, values=None):
+        listen = listen_match.match(sql)
+        if listen and self._notifies is not None:
+            await self.connection.add_listener(listen.group(1), self._notify)
+            return
+        try:
+            if values is None:
+                # Same as psycopg2, SQL is sent as is when no parameters are given.
+                # This can also be a script of multiple statements, which can not be prepared.
+                if ";" in sql.strip().rstrip(";"):
+                    status = await self.connection.execute(sql)
+                    self._set_result(None, status)
+                    return
+                query, values = sql, []
+            else:
+                query = numbered_placeholders(sql)
+
+            info = await self._pool.statement_info(self.connection, query)
+            args = [_convert(value, param) for value, param in zip(values, info.parameters)]
+            # Statements are prepared and cached per connection by asyncpg.
+            if info.columns:
+                records = await self.connection.fetch(query, *args)
+                self._records = records
+                self.rowcount = len(records)
+                self.description = [(column, None, None, None, None, None, None) for column in info.columns]
+            else:
+                self._set_result(None, await self.connection.execute(query, *args))
+        except asyncpg.PostgresError as error:
+            raise _psycopg2_error(error) from error
+
+    def _notify(self, conn, pid, channel, payload):
+        self._notifies.put_nowait(Notify(pid, channel, payload))
+
+    def _set_result(self, records, status: str):
+        self._records = records
+        self.description = None
+        match = status_rowcount_match.search(status or "")
+        self.rowcount = int(match.group(1)) if match else -1
+
+    async def fetchall(self) -> List:
+        if self._records is None:
+            raise psycopg2.ProgrammingError("no results to fetch")
+        return list(self._records)
+
+    async def fetchone(self):
+        if self._records is None:
+            raise psycopg2.ProgrammingError("no results to fetch")
+        return self._records[0] if self._records else None
+
+    def close(self):
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        if self._release:
+            asyncio.ensure_future(self._pool.release(self.connection))
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self.close()
+        if self._release:
+            await self._pool.release(self.connection)
+
+
+def _convert(value, param):
+    "Convert a query parameter to the Python type asyncpg expects for the parameter type"
+    if param.kind == "array" and value is not None:
+        # array type names are the element type name prefixed with an underscore
+        return [_convert_scalar(item, param.name[1:]) for item in value]
+    return _convert_scalar(value, param.name)
+
+
+def _convert_scalar(value, type_name: str):
+    if value is None:
+        return None
+    if type_name in ("int2", "int4", "int8"):
+        return int(value)
+    if type_name in ("float4", "float8"):
+        return float(value)
+    if type_name == "bool":
+        return value if isinstance(value, bool) else str(value).lower() in ("t", "true", "1")
+    if type_name in ("text", "varchar", "bpchar", "name", "unknown"):
+        return value if isinstance(value, str) else str(value)
+    return value
+
+
+def _psycopg2_error(error):
+    "Translate an asyncpg error to the psycopg2 error for the same SQLSTATE"
+    try:
+        error_class = psycopg2.errors.lookup(error.sqlstate)
+    except KeyError:
+        error_class = psycopg2.DatabaseError
+    return error_class(str(error))
@@ -1,14 +1,59 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 import psycopg2
 import collections
 import datetime
 import time
+import itertools
 import json
+import re
 
 
 DBResponse = collections.namedtuple("DBResponse", "response_code body")
 
-DBPagination = collections.namedtuple("DBPagination", "limit offset count page")
+# last_key holds the keyset pagination columns and values of the last row on the page, when available.
+DBPagination = collections.namedtuple("DBPagination", "limit offset count page last_key", defaults=[None])
+
+
+class LRUCache(object):
+    """
+    Bounded in-memory cache that evicts the least recently used entries first.
+    Keeps count of cache hits and misses.
+
+    Parameters
+    ----------
+    maxsize : int
+        maximum number of entries to keep. A maxsize of 0 disables caching.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+
+    def get(self, key, default=None):
+        try:
+            value = self._entries[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
 
 
 def aiopg_exception_handling(exception):
@@ -29,6 +74,16 @@ def aiopg_exception_handling(exception):
         return DBResponse(response_code=500, body=json.dumps(body))
 
 
+placeholder_match = re.compile('%%|%s')
+
+
+def numbered_placeholders(sql: str) -> str:
+    "Convert psycopg2 %s placeholders to the numbered $1, $2, ... parameters used by prepared statements"
+    counter = itertools.count(1)
+    return placeholder_match.sub(
+        lambda match: "%" if match.group(0) == "%%" else "${}".format(next(counter)), sql)
+
+
 def get_db_ts_epoch_str():
     return str(int(round(time.time() * 1000)))
 
@@ -59,6 +114,29 @@ def get_exposed_task_id(task_id, task_name):
     return task_id
 
 
+ATTEMPT_ID_TAG = re.compile(r"attempt_id:(\d{1,9})")
+ATTEMPT_ID_VALUE = re.compile(r"\d{1,9}")
+
+
+def parse_attempt_id(field_name: str, value, tags) -> Optional[int]:
+    """
+    Attempt that a metadata row was recorded for.
+
+    Read from the 'attempt_id:<n>' tag, or from the value of 'attempt' and 'attempt-done' metadata when
+    the tag is missing. Values may be plain text or JSON encoded for older clients, eg. '1', '"1"' or '[1]'.
+    Returns None for metadata that does not belong to an attempt, eg. run-level metadata.
+    """
+    for tag in tags or []:
+        match = ATTEMPT_ID_TAG.search(str(tag))
+        if match:
+            return int(match.group(1))
+    if field_name in ("attempt", "attempt-done") and value is not None:
+        value = str(value).strip('[]" ')
+        if ATTEMPT_ID_VALUE.fullmatch(value):
+            return int(value)
+    return None
+
+
 def get_latest_attempt_id_for_tasks(artifacts):
     attempt_ids = {}
     for artifact in artifacts:
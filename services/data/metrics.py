@@ -0,0 +1,189 @@
+"""
+Prometheus metrics for the database layer shared by the metadata and UI services.
+
+Exposes
+    - latency histograms per pool, table and operation
+    - a histogram of the time spent waiting for a pooled connection, per pool
+    - in use, free and maximum connections of each pool, collected when scraped
+    - error counters per pool, table, operation and error type
+    - depth of the ingest queue and sizes of the batches it commits, per pool and table
+
+Pools are identified by the name of the database adapter owning them, eg. 'global', 'ui' or 'ui:cache'.
+
+With PROMETHEUS_MULTIPROC_DIR set, eg. for a metadata service serving from several worker processes, every process
+writes its metrics to files in that directory, and a scrape of any process reports the metrics of all of them.
+"""
+import asyncio
+import functools
+import glob
+import os
+import time
+import weakref
+from typing import Tuple
+
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry,
+                               Counter, Gauge, Histogram, generate_latest, multiprocess)
+from prometheus_client.core import GaugeMetricFamily
+
+MULTIPROCESS_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+
+# Seconds between samples of the connection counts of the pools of a process, in multiprocess mode
+POOL_SAMPLE_INTERVAL_SECONDS = 1.0
+
+QUERY_LATENCY = Histogram(
+    "metaflow_db_query_duration_seconds",
+    "Duration of database operations, including waiting for a pooled connection",
+    ["pool", "table", "operation"])
+
+POOL_ACQUIRE_LATENCY = Histogram(
+    "metaflow_db_pool_acquire_duration_seconds",
+    "Time spent waiting for a connection from the pool",
+    ["pool"])
+
+ERRORS = Counter(
+    "metaflow_db_errors_total",
+    "Database operations that failed with an exception",
+    ["pool", "table", "operation", "error"])
+
+INGEST_QUEUE_DEPTH = Gauge(
+    "metaflow_db_ingest_queue_depth",
+    "Inserts waiting in the ingest queue to be committed with the next batch",
+    ["pool", "table"],
+    multiprocess_mode="livesum")
+
+INGEST_BATCH_SIZE = Histogram(
+    "metaflow_db_ingest_batch_size",
+    "Number of inserts committed together in one transaction by the ingest queue",
+    ["pool", "table"],
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500))
+
+
+# Connection counts summed over the live processes in multiprocess mode, where they are sampled by each process instead
+# of being collected at scrape time. Not registered, the PoolCollector reports them for a single process.
+POOL_CONNECTIONS_IN_USE = Gauge(
+    "metaflow_db_pool_connections_in_use", "Connections currently checked out from the pool", ["pool"],
+    registry=None, multiprocess_mode="livesum")
+POOL_CONNECTIONS_FREE = Gauge(
+    "metaflow_db_pool_connections_free", "Idle connections in the pool", ["pool"],
+    registry=None, multiprocess_mode="livesum")
+POOL_CONNECTIONS_MAX = Gauge(
+    "metaflow_db_pool_connections_max", "Maximum number of connections in the pool", ["pool"],
+    registry=None, multiprocess_mode="livesum")
+
+
+class PoolCollector(object):
+    "Reports the connection counts of all registered pools at scrape time"
+
+    def __init__(self):
+        self.pools = weakref.WeakValueDictionary()
+
+    def register(self, name: str, pool):
+        self.pools[name] = pool
+
+    def collect(self):
+        in_use = GaugeMetricFamily("metaflow_db_pool_connections_in_use",
+                                   "Connections currently checked out from the pool", labels=["pool"])
+        free = GaugeMetricFamily("metaflow_db_pool_connections_free",
+                                 "Idle connections in the pool", labels=["pool"])
+        maximum = GaugeMetricFamily("metaflow_db_pool_connections_max",
+                                    "Maximum number of connections in the pool", labels=["pool"])
+        for name, pool in list(self.pools.items()):
+            in_use.add_metric([name], pool.size - pool.freesize)
+            free.add_metric([name], pool.freesize)
+            maximum.add_metric([name], pool.maxsize)
+        yield in_use
+        yield free
+        yield maximum
+
+    def sample(self):
+        "Record the connection counts of all registered pools for multiprocess mode"
+        for name, pool in list(self.pools.items()):
+            POOL_CONNECTIONS_IN_USE.labels(name).set(pool.size - pool.freesize)
+            POOL_CONNECTIONS_FREE.labels(name).set(pool.freesize)
+            POOL_CONNECTIONS_MAX.labels(name).set(pool.maxsize)
+
+
+pool_collector = PoolCollector()
+REGISTRY.register(pool_collector)
+
+
+class InstrumentedPool(object):
+    """
+    Proxy for an aiopg compatible pool that records how long acquiring a cursor takes.
+    Every table operation checks out a cursor, so this is the time handlers spend waiting for a connection.
+
+    Parameters
+    ----------
+    pool : aiopg.Pool or AsyncpgPool
+        pool to wrap
+    name : str
+        name of the pool, used as the 'pool' label of the metrics
+    """
+
+    def __init__(self, pool, name: str):
+        self._pool = pool
+        self.name = name
+        pool_collector.register(name, self)
+
+    async def cursor(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await self._pool.cursor(*args, **kwargs)
+        finally:
+            POOL_ACQUIRE_LATENCY.labels(self.name).observe(time.perf_counter() - start)
+
+    def __getattr__(self, name):
+        return getattr(self._pool, name)
+
+
+def instrument(operation: str):
+    """
+    Decorator for table methods, recording their duration under the given operation name.
+
+    Labels are taken from the table instance: the name of its database adapter, and the table name.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(table, *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await func(table, *args, **kwargs)
+            finally:
+                QUERY_LATENCY.labels(table.db.name, table.table_name, operation).observe(
+                    time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def count_error(table, operation: str, error: Exception):
+    "Count a failed operation on a table by the type of the raised error"
+    ERRORS.labels(table.db.name, table.table_name, operation, type(error).__name__).inc()
+
+
+async def sample_pools_periodically(interval: float = POOL_SAMPLE_INTERVAL_SECONDS):
+    "Keep sampling the connection counts of the pools of this process, in multiprocess mode"
+    while True:
+        pool_collector.sample()
+        await asyncio.sleep(interval)
+
+
+def clear_multiprocess_metrics():
+    "Remove the metrics of processes of an earlier run from PROMETHEUS_MULTIPROC_DIR, before forking any process"
+    if MULTIPROCESS_DIR:
+        for path in glob.glob(os.path.join(MULTIPROCESS_DIR, "*.db")):
+            os.remove(path)
+
+
+def process_exited(pid: int):
+    "Stop reporting the gauges of an exited process, its counters and histograms are kept"
+    if MULTIPROCESS_DIR:
+        multiprocess.mark_process_dead(pid, MULTIPROCESS_DIR)
+
+
+def export_metrics() -> Tuple[bytes, str]:
+    "Current values of all metrics in the Prometheus text format, and the content type to serve them with"
+    if MULTIPROCESS_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry, MULTIPROCESS_DIR)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -1,11 +1,77 @@
+import operator
 import time
+from typing import Callable, Dict, Sequence
+
 from .db_utils import get_exposed_run_id, get_exposed_task_id
 
 
-class FlowRow(object):
-    flow_id: str = None
-    user_name: str = None
-    ts_epoch: int = 0
+class Row(object):
+    """
+    Base class of the row models.
+
+    Row models declare the fields of serialize() in _fields, and in _expanded_fields if expanded
+    serialization differs. A field is either the name of a column that is serialized as is,
+    or a (key, function, columns) tuple for a value computed from several columns.
+    This allows serializing rows from a tuple cursor without creating row objects, see tuple_serializer().
+    """
+    __slots__ = ()
+    _fields = ()
+    _expanded_fields = None
+
+    @classmethod
+    def tuple_serializer(cls, columns: Sequence[str], expanded: bool = False) -> Callable[[Sequence], Dict]:
+        """
+        Function that serializes a row returned by a tuple cursor to the same dict as serialize() would.
+
+        Values are mapped from their column positions into the serialized dict directly.
+        Raises KeyError if a serialized column is missing from the given columns.
+
+        Parameters
+        ----------
+        columns : Sequence[str]
+            names of the columns in the rows, as in the description of the cursor
+        expanded : bool
+            serialize rows as serialize(expanded=True)
+        """
+        fields = cls._expanded_fields if expanded and cls._expanded_fields is not None else cls._fields
+        positions = {column: index for index, column in enumerate(columns)}
+        keys = []
+        value_positions = []
+        computed = []
+        for field in fields:
+            if isinstance(field, str):
+                keys.append(field)
+                value_positions.append(positions[field])
+            else:
+                key, function, sources = field
+                # Keeps the position of the key in the dict, the value is replaced by the computed one
+                keys.append(key)
+                value_positions.append(positions[sources[0]])
+                computed.append((key, function, operator.itemgetter(*[positions[source] for source in sources])))
+        values = operator.itemgetter(*value_positions)
+
+        def serialize(row: Sequence) -> Dict:
+            serialized = dict(zip(keys, values(row)))
+            for key, function, sources in computed:
+                serialized[key] = function(*sources(row))
+            return serialized
+        return serialize
+
+
+def get_step_run_id(run_id, run_number):
+    "Run id of a step, which defaults to the run number"
+    if run_id is None:
+        return str(run_number)
+    return run_id
+
+
+EXPOSED_RUN_ID = ("run_number", get_exposed_run_id, ("run_number", "run_id"))
+EXPOSED_TASK_ID = ("task_id", get_exposed_task_id, ("task_id", "task_name"))
+
+
+class FlowRow(Row):
+    __slots__ = ("flow_id", "user_name", "ts_epoch", "tags", "system_tags")
+    _fields = ("flow_id", "user_name", "ts_epoch", "tags", "system_tags")
 
     def __init__(self, flow_id, user_name, ts_epoch=None, tags=None, system_tags=None):
         self.flow_id = flow_id
@@ -26,12 +92,11 @@ class FlowRow(object):
         }
 
 
-class RunRow(object):
-    flow_id: str = None
-    run_number: int = None
-    run_id: str = None
-    user_name: str = None
-    ts_epoch: int = 0
+class RunRow(Row):
+    __slots__ = ("flow_id", "run_number", "run_id", "user_name", "ts_epoch", "tags", "system_tags", "last_heartbeat_ts")
+    _fields = ("flow_id", EXPOSED_RUN_ID, "user_name", "ts_epoch", "tags", "system_tags", "last_heartbeat_ts")
+    _expanded_fields = ("flow_id", "run_number", "run_id", "user_name", "ts_epoch", "tags", "system_tags",
+                        "last_heartbeat_ts")
 
     def __init__(
         self,
@@ -80,15 +145,12 @@ class RunRow(object):
             }
 
 
-class StepRow(object):
-    flow_id: str = None
-    run_number: int = None
-    run_id: str = None
-    step_name: str = None
-    user_name: str = None
-    ts_epoch: int = 0
-    tags = None
-    system_tags = None
+class StepRow(Row):
+    __slots__ = ("flow_id", "run_number", "run_id", "step_name", "user_name", "ts_epoch", "tags", "system_tags")
+    _fields = ("flow_id", ("run_number", get_step_run_id, ("run_id", "run_number")), "step_name", "user_name",
+               "ts_epoch", "tags", "system_tags")
+    _expanded_fields = ("flow_id", "run_number", ("run_id", get_step_run_id, ("run_id", "run_number")), "step_name",
+                        "user_name", "ts_epoch", "tags", "system_tags")
 
     def __init__(
         self,
@@ -141,17 +203,13 @@ class StepRow(object):
             }
 
 
-class TaskRow(object):
-    flow_id: str = None
-    run_number: int = None
-    run_id: str = None
-    step_name: str = None
-    task_id: int = None
-    task_name: str = None
-    user_name: str = None
-    ts_epoch: int = 0
-    tags = None
-    system_tags = None
+class TaskRow(Row):
+    __slots__ = ("flow_id", "run_number", "run_id", "step_name", "task_id", "task_name", "user_name", "ts_epoch", "tags",
+                 "system_tags", "last_heartbeat_ts")
+    _fields = ("flow_id", EXPOSED_RUN_ID, "step_name", EXPOSED_TASK_ID, "user_name", "ts_epoch", "tags", "system_tags",
+               "last_heartbeat_ts")
+    _expanded_fields = ("flow_id", "run_number", "run_id", "step_name", "task_id", "task_name", "user_name", "ts_epoch",
+                        "tags", "system_tags", "last_heartbeat_ts")
 
     def __init__(
         self,
@@ -211,21 +269,11 @@ class TaskRow(object):
             }
 
 
-class MetadataRow(object):
-    flow_id: str = None
-    run_number: int = None
-    run_id: str = None
-    step_name: str = None
-    task_id: int = None
-    task_name: str = None
-    id: int = None  # autoincrement
-    field_name: str = None
-    value: dict = None
-    type: str = None
-    user_name: str = None
-    ts_epoch: int = 0
-    tags = None
-    system_tags = None
+class MetadataRow(Row):
+    __slots__ = ("flow_id", "run_number", "run_id", "step_name", "task_id", "task_name", "id", "field_name", "value",
+                 "type", "user_name", "ts_epoch", "tags", "system_tags", "attempt_id")
+    _fields = ("id", "flow_id", EXPOSED_RUN_ID, "step_name", EXPOSED_TASK_ID, "field_name", "value", "type", "user_name",
+               "ts_epoch", "tags", "system_tags")
 
     def __init__(
         self,
@@ -243,6 +291,7 @@ class MetadataRow(object):
         ts_epoch=None,
         tags=None,
         system_tags=None,
+        attempt_id=None,
     ):
         self.flow_id = flow_id
         self.run_number = run_number
@@ -261,6 +310,7 @@ class MetadataRow(object):
         self.id = id
         self.tags = tags
         self.system_tags = system_tags
+        self.attempt_id = attempt_id
 
     def serialize(self, expanded: bool = False):
         return {
@@ -279,21 +329,11 @@ class MetadataRow(object):
         }
 
 
-class ArtifactRow(object):
-    flow_id: str = None
-    run_number: int = None
-    run_id: str = None
-    step_name: str = None
-    task_id: int = None
-    task_name: str = None
-    name: str = None
-    location: str = None
-    sha: str = None
-    type: str = None
-    content_type: str = None
-    user_name: str = None
-    attempt_id: int = 0
-    ts_epoch: int = 0
+class ArtifactRow(Row):
+    __slots__ = ("flow_id", "run_number", "run_id", "step_name", "task_id", "task_name", "name", "location", "ds_type",
+                 "sha", "type", "content_type", "user_name", "attempt_id", "ts_epoch", "tags", "system_tags")
+    _fields = ("flow_id", EXPOSED_RUN_ID, "step_name", EXPOSED_TASK_ID, "name", "location", "ds_type", "sha", "type",
+               "content_type", "user_name", "attempt_id", "ts_epoch", "tags", "system_tags")
 
     def __init__(
         self,
@@ -354,3 +394,105 @@ class ArtifactRow(object):
             "tags": self.tags,
             "system_tags": self.system_tags,
         }
+
+
+class TaskAttemptRow(Row):
+    __slots__ = ("flow_id", "run_number", "step_name", "task_id", "attempt_id", "started_at", "attempt_finished_at",
+                 "attempt_ok", "task_ok_finished_at", "task_ok_location")
+    _fields = __slots__
+
+    def __init__(
+        self,
+        flow_id,
+        run_number,
+        step_name,
+        task_id,
+        attempt_id,
+        started_at=None,
+        attempt_finished_at=None,
+        attempt_ok=None,
+        task_ok_finished_at=None,
+        task_ok_location=None,
+    ):
+        self.flow_id = flow_id
+        self.run_number = run_number
+        self.step_name = step_name
+        self.task_id = task_id
+        self.attempt_id = attempt_id
+        self.started_at = started_at
+        self.attempt_finished_at = attempt_finished_at
+        self.attempt_ok = attempt_ok
+        self.task_ok_finished_at = task_ok_finished_at
+        self.task_ok_location = task_ok_location
+
+    def serialize(self, expanded: bool = False):
+        return {
+            "flow_id": self.flow_id,
+            "run_number": self.run_number,
+            "step_name": self.step_name,
+            "task_id": self.task_id,
+            "attempt_id": self.attempt_id,
+            "started_at": self.started_at,
+            "attempt_finished_at": self.attempt_finished_at,
+            "attempt_ok": self.attempt_ok,
+            "task_ok_finished_at": self.task_ok_finished_at,
+            "task_ok_location": self.task_ok_location,
+        }
+
+
+class RunSummaryRow(Row):
+    __slots__ = ("flow_id", "run_number", "started_at", "end_attempt_ok", "end_attempt_ok_ts", "end_attempt_ts",
+                 "status", "finished_at", "duration")
+    _fields = __slots__
+
+    def __init__(
+        self,
+        flow_id,
+        run_number,
+        started_at=None,
+        end_attempt_ok=None,
+        end_attempt_ok_ts=None,
+        end_attempt_ts=None,
+        status=None,
+        finished_at=None,
+        duration=None,
+    ):
+        self.flow_id = flow_id
+        self.run_number = run_number
+        self.started_at = started_at
+        self.end_attempt_ok = end_attempt_ok
+        self.end_attempt_ok_ts = end_attempt_ok_ts
+        self.end_attempt_ts = end_attempt_ts
+        self.status = status
+        self.finished_at = finished_at
+        self.duration = duration
+
+    def serialize(self, expanded: bool = False):
+        return {
+            "flow_id": self.flow_id,
+            "run_number": self.run_number,
+            "started_at": self.started_at,
+            "end_attempt_ok": self.end_attempt_ok,
+            "end_attempt_ok_ts": self.end_attempt_ok_ts,
+            "end_attempt_ts": self.end_attempt_ts,
+            "status": self.status,
+            "finished_at": self.finished_at,
+            "duration": self.duration,
+        }
+
+
+class RunTagRow(Row):
+    __slots__ = ("tag", "run_count", "last_seen_ts")
+    _fields = __slots__
+
+    def __init__(self, tag, run_count=0, last_seen_ts=None):
+        self.tag = tag
+        self.run_count = run_count
+        self.last_seen_ts = last_seen_ts
+
+    def serialize(self, expanded: bool = False):
+        return {
+            "tag": self.tag,
+            "run_count": self.run_count,
+            "last_seen_ts": self.last_seen_ts,
+        }
@@ -2,16 +2,25 @@ import psycopg2
 import psycopg2.extras
 import os
 import aiopg
+import asyncio
+import collections
+import hashlib
+import itertools
 import json
 import math
 import re
 import time
+import weakref
 from services.utils import logging
-from typing import List, Tuple
-
-from .db_utils import DBResponse, DBPagination, aiopg_exception_handling, \
-    get_db_ts_epoch_str, translate_run_key, translate_task_key, new_heartbeat_ts
-from .models import FlowRow, RunRow, StepRow, TaskRow, MetadataRow, ArtifactRow
+from typing import AsyncIterator, Callable, Dict, List, Tuple
+
+from .db_utils import DBResponse, DBPagination, LRUCache, aiopg_exception_handling, \
+    get_db_ts_epoch_str, translate_run_key, translate_task_key, new_heartbeat_ts, numbered_placeholders, \
+    parse_attempt_id
+from . import asyncpg_engine
+from .metrics import InstrumentedPool, count_error, instrument
+from .models import FlowRow, RunRow, StepRow, TaskRow, MetadataRow, ArtifactRow, TaskAttemptRow, RunSummaryRow, \
+    RunTagRow
 from services.utils import DBConfiguration
 
 from services.data.service_configs import max_connection_retires, \
@@ -25,6 +34,23 @@ WAIT_TIME = 10
 # Enable with env variable `DB_TRIGGER_CREATE=1`
 DB_TRIGGER_CREATE = os.environ.get("DB_TRIGGER_CREATE", 0) == "1"
 
+# Notify once per statement with the keys of all affected rows, instead of once per row.
+# Enable with env variable `DB_TRIGGER_STATEMENT_LEVEL=1`
+DB_TRIGGER_STATEMENT_LEVEL = os.environ.get("DB_TRIGGER_STATEMENT_LEVEL", 0) == "1"
+
+# Number of monthly partitions to create ahead of the current month, for tables partitioned on ts_epoch
+# by the migrations. Partitions are created when the services start up.
+DB_PARTITION_MONTHS_AHEAD = int(os.environ.get("DB_PARTITION_MONTHS_AHEAD", 3))
+
+# Look up runs, and their steps, tasks, metadata and artifacts, in the archive tables when they are not found
+# in the main tables. Runs are archived by the retention job of the migration service.
+# Enable with env variable `DB_ARCHIVE_READ_THROUGH=1`
+DB_ARCHIVE_READ_THROUGH = os.environ.get("DB_ARCHIVE_READ_THROUGH", 0) == "1"
+
+# Maximum size in bytes of the row keys batched in a single notification.
+# Postgres limits notification payloads to 8000 bytes, this leaves room for the rest of the payload.
+NOTIFY_BATCH_BYTES = 7000
+
 # Configure DB Table names. Custom names can be supplied through environment variables,
 # in case the deployment differs from the default naming scheme from the supplied migrations.
 FLOW_TABLE_NAME = os.environ.get("DB_TABLE_NAME_FLOWS", "flows_v3")
@@ -33,9 +59,44 @@ STEP_TABLE_NAME = os.environ.get("DB_TABLE_NAME_STEPS", "steps_v3")
 TASK_TABLE_NAME = os.environ.get("DB_TABLE_NAME_TASKS", "tasks_v3")
 METADATA_TABLE_NAME = os.environ.get("DB_TABLE_NAME_METADATA", "metadata_v3")
 ARTIFACT_TABLE_NAME = os.environ.get("DB_TABLE_NAME_ARTIFACT", "artifact_v3")
+TASK_ATTEMPT_TABLE_NAME = os.environ.get("DB_TABLE_NAME_TASK_ATTEMPTS", "task_attempts_v3")
+RUN_SUMMARY_TABLE_NAME = os.environ.get("DB_TABLE_NAME_RUN_SUMMARY", "run_summary_v3")
+RUN_TAG_TABLE_NAME = os.environ.get("DB_TABLE_NAME_RUN_TAGS", "run_tags_v3")
+
+# Maximum number of resolved run and task ids to keep in memory, for each of the two caches.
+# Set `DB_ID_CACHE_SIZE=0` to disable caching.
+ID_CACHE_SIZE = int(os.environ.get("DB_ID_CACHE_SIZE", 10000))
+
+# Number of rows fetched at a time when streaming query results from a server-side cursor, see stream_sql()
+STREAM_CHUNK_SIZE = int(os.environ.get("DB_STREAM_CHUNK_SIZE", 1000))
+
+# Maximum number of compiled find_records() query templates to keep per table.
+QUERY_CACHE_SIZE = int(os.environ.get("DB_QUERY_CACHE_SIZE", 1000))
+
+# Execute find_records() queries as server-side prepared statements, disabled by default.
+# Prepared statements live on a single database connection, so they do not work behind
+# connection poolers running in transaction mode. Enable with env variable `DB_PREPARED_STATEMENTS=1`
+DB_PREPARED_STATEMENTS = os.environ.get("DB_PREPARED_STATEMENTS", 0) == "1"
 
 operator_match = re.compile('([^:]*):([=><]+)$')
 
+# Tables, partitioning and triggers found in the database, see PostgresUtils.get_schema_state
+SchemaState = collections.namedtuple("SchemaState", "fingerprint tables")
+TableState = collections.namedtuple("TableState", "partitioned triggers")
+
+# Schema fingerprint, and the create_tables and create_triggers options, that tables have been set up with, per DSN.
+# Database adapters initialized later on for the same schema skip setting up tables.
+_verified_schemas: Dict[str, Tuple[str, bool, bool]] = {}
+# Locks that make adapters of the same database set up tables one at a time, per event loop and DSN
+_schema_locks = weakref.WeakKeyDictionary()
+
+
+def _schema_lock(dsn: str) -> asyncio.Lock:
+    locks = _schema_locks.setdefault(asyncio.get_event_loop(), {})
+    if dsn not in locks:
+        locks[dsn] = asyncio.Lock()
+    return locks[dsn]
+
 
 class _AsyncPostgresDB(object):
     connection = None
@@ -45,9 +106,15 @@ class _AsyncPostgresDB(object):
     task_table_postgres = None
     artifact_table_postgres = None
     metadata_table_postgres = None
+    task_attempt_table_postgres = None
+    run_summary_table_postgres = None
+    run_tag_table_postgres = None
 
     pool = None
     db_conf: DBConfiguration = None
+    # Queue that inserts are committed through in batches, instead of one by one.
+    # Set by the metadata service, see services.metadata_service.api.ingest_queue
+    ingest_queue = None
 
     def __init__(self, name='global'):
         self.name = name
@@ -60,42 +127,120 @@ class _AsyncPostgresDB(object):
         self.task_table_postgres = AsyncTaskTablePostgres(self)
         self.artifact_table_postgres = AsyncArtifactTablePostgres(self)
         self.metadata_table_postgres = AsyncMetadataTablePostgres(self)
+        self.task_attempt_table_postgres = AsyncTaskAttemptTablePostgres(self)
+        self.run_summary_table_postgres = AsyncRunSummaryTablePostgres(self)
+        self.run_tag_table_postgres = AsyncRunTagTablePostgres(self)
         tables.append(self.flow_table_postgres)
         tables.append(self.run_table_postgres)
         tables.append(self.step_table_postgres)
         tables.append(self.task_table_postgres)
         tables.append(self.artifact_table_postgres)
         tables.append(self.metadata_table_postgres)
+        # Maintained by triggers on the runs, metadata and artifact tables, which have to exist first
+        tables.append(self.task_attempt_table_postgres)
+        tables.append(self.run_summary_table_postgres)
+        tables.append(self.run_tag_table_postgres)
         self.tables = tables
 
+        self.run_ids_cache = LRUCache(ID_CACHE_SIZE)
+        self.task_ids_cache = LRUCache(ID_CACHE_SIZE)
+
+        self.replica_pools = []
+        self._read_pools = None
+        self.replica_fallback = True
+
     async def _init(self, db_conf: DBConfiguration, create_triggers=DB_TRIGGER_CREATE, create_tables=True):
         # todo make poolsize min and max configurable as well as timeout
         # todo add retry and better error message
+        # ids cached for a previous connection might point to rows that no longer exist
+        self.run_ids_cache.clear()
+        self.task_ids_cache.clear()
+
+        started = time.monotonic()
         retries = max_connection_retires
         for i in range(retries):
             try:
-                self.pool = await aiopg.create_pool(
-                    db_conf.dsn,
-                    minsize=db_conf.pool_min,
-                    maxsize=db_conf.pool_max,
-                    timeout=db_conf.timeout,
-                    echo=AIOPG_ECHO)
+                # Connect to the primary and all replicas concurrently
+                self.pool, *self.replica_pools = await asyncio.gather(
+                    self._create_pool(db_conf, db_conf.dsn, self.name),
+                    *[self._create_pool(db_conf, replica_dsn, "{}:replica:{}".format(self.name, index))
+                      for index, replica_dsn in enumerate(db_conf.replica_dsns)])
+                self._read_pools = itertools.cycle(self.replica_pools)
+                self.replica_fallback = db_conf.replica_fallback
 
-                for table in self.tables:
-                    await table._init(create_tables=create_tables, create_triggers=create_triggers)
+                await self._init_tables(db_conf.dsn, create_tables=create_tables, create_triggers=create_triggers)
 
                 self.logger.info(
                     "Connection established.\n"
-                    "   Pool min: {pool_min} max: {pool_max}\n".format(
+                    "   Engine: {engine}\n"
+                    "   Pool min: {pool_min} max: {pool_max}\n"
+                    "   Read replicas: {replicas}\n"
+                    "   Startup time: {startup:.3f}s\n".format(
+                        engine=db_conf.engine,
                         pool_min=self.pool.minsize,
-                        pool_max=self.pool.maxsize))
+                        pool_max=self.pool.maxsize,
+                        replicas=len(self.replica_pools),
+                        startup=time.monotonic() - started))
 
                 break  # Break the retry loop
             except Exception as e:
                 self.logger.exception("Exception occurred")
                 if retries - i <= 1:
                     raise e
-                time.sleep(connection_retry_wait_time_seconds)
+                await asyncio.sleep(connection_retry_wait_time_seconds)
+
+    async def _init_tables(self, dsn: str, create_tables: bool, create_triggers: bool):
+        """
+        Set up tables, partitions and notify triggers, based on a single lookup of the schema state.
+
+        Setup is skipped altogether when it has been done before in this process for the same schema fingerprint,
+        e.g. by another adapter of the same database. Adapters of the same database set up tables one at a time.
+        """
+        options = (create_tables, create_triggers)
+        table_names = [table.table_name for table in self.tables]
+        async with _schema_lock(dsn):
+            schema = await PostgresUtils.get_schema_state(self, table_names)
+            verified = _verified_schemas.get(dsn)
+            if verified and verified[0] == schema.fingerprint and \
+                    all(done or not requested for done, requested in zip(verified[1:], options)):
+                self.logger.info("Schema fingerprint {} matches, skipping table setup".format(schema.fingerprint))
+                return
+
+            for table in self.tables:
+                await table._init(create_tables=create_tables, create_triggers=create_triggers, schema=schema)
+
+            # Creating tables and triggers changes the fingerprint
+            schema = await PostgresUtils.get_schema_state(self, table_names)
+            _verified_schemas[dsn] = (schema.fingerprint,) + options
+            self.logger.info("Tables set up for schema fingerprint {}".format(schema.fingerprint))
+
+    async def _create_pool(self, db_conf: DBConfiguration, dsn: str, name: str):
+        if db_conf.engine == "asyncpg":
+            pool = await asyncpg_engine.create_pool(
+                dsn,
+                minsize=db_conf.pool_min,
+                maxsize=db_conf.pool_max,
+                timeout=db_conf.timeout)
+        else:
+            pool = await aiopg.create_pool(
+                dsn,
+                minsize=db_conf.pool_min,
+                maxsize=db_conf.pool_max,
+                timeout=db_conf.timeout,
+                echo=AIOPG_ECHO)
+        return InstrumentedPool(pool, name)
+
+    def read_pool(self):
+        "Pool to run read queries on: the next replica in turn, or the primary pool when there are no replicas."
+        if not self.replica_pools:
+            return self.pool
+        return next(self._read_pools)
+
+    async def create_partitions(self):
+        "Create upcoming partitions of all tables that are partitioned on a time range"
+        for table in self.tables:
+            if table.partition_key:
+                await PostgresUtils.create_partitions(self, table.table_name)
 
     def get_table_by_name(self, table_name: str):
         for table in self.tables:
@@ -104,18 +249,66 @@ class _AsyncPostgresDB(object):
         return None
 
     async def get_run_ids(self, flow_id: str, run_id: str):
+        cached = self.run_ids_cache.get((flow_id, str(run_id)))
+        if cached is not None:
+            return cached
+
         run = await self.run_table_postgres.get_run(flow_id, run_id,
                                                     expanded=True)
+        if run.response_code == 200:
+            self.cache_run_ids(run.body)
         return run.body['run_number'], run.body['run_id']
 
     async def get_task_ids(self, flow_id: str, run_id: str,
                            step_name: str, task_name: str):
+        cached = self.task_ids_cache.get((flow_id, str(run_id), step_name, str(task_name)))
+        if cached is not None:
+            return cached
 
         task = await self.task_table_postgres.get_task(flow_id, run_id,
                                                        step_name, task_name,
                                                        expanded=True)
+        if task.response_code == 200:
+            self.cache_task_ids(task.body)
         return task.body['task_id'], task.body['task_name']
 
+    def cache_run_ids(self, run: Dict):
+        """
+        Cache the resolved ids of a run under every key it can be referred to by.
+
+        Parameters
+        ----------
+        run : Dict
+            expanded serialization of a run row
+        """
+        ids = (run['run_number'], run['run_id'])
+        for run_key in _id_keys(*ids):
+            self.run_ids_cache.set((run['flow_id'], run_key), ids)
+
+    def cache_task_ids(self, task: Dict):
+        """
+        Cache the resolved ids of a task under every combination of run and task keys it can be referred to by.
+
+        Parameters
+        ----------
+        task : Dict
+            expanded serialization of a task row
+        """
+        ids = (task['task_id'], task['task_name'])
+        for run_key in _id_keys(task['run_number'], task['run_id']):
+            for task_key in _id_keys(*ids):
+                self.task_ids_cache.set((task['flow_id'], run_key, task['step_name'], task_key), ids)
+
+
+def with_limit_values(values, limit: int = 0, offset: int = 0) -> List:
+    "Query parameters followed by the LIMIT and OFFSET parameters, for the ones that are set."
+    return list(values) + ([int(limit)] if limit else []) + ([int(offset)] if offset else [])
+
+
+def _id_keys(number, name):
+    "String keys an entity can be looked up with: its generated number and optional user supplied name"
+    return [str(key) for key in (number, name) if key is not None]
+
 
 class AsyncPostgresDB(object):
     __instance = None
@@ -131,6 +324,9 @@ class AsyncPostgresDB(object):
     def __getattribute__(self, name):
         return getattr(AsyncPostgresDB.__instance, name)
 
+    def __setattr__(self, name, value):
+        setattr(AsyncPostgresDB.__instance, name, value)
+
 
 class AsyncPostgresTable(object):
     db = None
@@ -143,6 +339,14 @@ class AsyncPostgresTable(object):
     joins: List[str] = None
     select_columns: List[str] = keys
     join_columns: List[str] = None
+    # Column the table can be range partitioned on, see PostgresUtils.create_partitions
+    partition_key: str = None
+    # Table that archived rows are moved to, see DB_ARCHIVE_READ_THROUGH
+    archive_table_name: str = None
+    # Whether changes to the table are broadcast with notify triggers, see PostgresUtils.setup_trigger_notify
+    notify_changes: bool = True
+    # Whether the table is created by the migrations of the migration service only, instead of with _command
+    created_by_migrations: bool = False
     _command = None
     _insert_command = None
     _filters = None
@@ -151,36 +355,114 @@ class AsyncPostgresTable(object):
 
     def __init__(self, db: _AsyncPostgresDB = None):
         self.db = db
-        if self.table_name is None or self._command is None:
+        if self.table_name is None or (self._command is None and not self.created_by_migrations):
             raise NotImplementedError(
                 "need to specify table name and create command")
-
-    async def _init(self, create_tables: bool, create_triggers: bool):
-        if create_tables:
-            await PostgresUtils.create_if_missing(self.db, self.table_name, self._command)
-        if create_triggers:
+        self._query_cache = LRUCache(QUERY_CACHE_SIZE)
+        # Names of the statements prepared on each pooled connection
+        self._prepared_statements = weakref.WeakKeyDictionary()
+        self._unpreparable_statements = set()
+
+    async def _init(self, create_tables: bool, create_triggers: bool, schema: SchemaState = None):
+        # Without a schema state, every step looks up what already exists on its own
+        state = schema.tables.get(self.table_name) if schema else None
+        if create_tables and state is None:
+            if self.created_by_migrations:
+                self.db.logger.warning(
+                    "Table {} does not exist, apply the migrations of the migration service".format(self.table_name))
+            else:
+                await PostgresUtils.create_if_missing(self.db, self.table_name, self._command)
+        if self.partition_key and (state is None or state.partitioned):
+            await PostgresUtils.create_partitions(self.db, self.table_name,
+                                                  partitioned=state.partitioned if state else None)
+        trigger_name = PostgresUtils.notify_trigger_name(self.table_name, DB_TRIGGER_STATEMENT_LEVEL)
+        if create_triggers and self.notify_changes and (state is None or trigger_name not in state.triggers):
             self.db.logger.info(
-                "Setting up notify trigger for {table_name}\n   Keys: {keys}".format(
+                "Setting up {level} level notify trigger for {table_name}\n   Keys: {keys}".format(
+                    level="statement" if DB_TRIGGER_STATEMENT_LEVEL else "row",
                     table_name=self.table_name, keys=self.trigger_keys))
-            await PostgresUtils.setup_trigger_notify(db=self.db, table_name=self.table_name, keys=self.trigger_keys)
+            await PostgresUtils.setup_trigger_notify(db=self.db, table_name=self.table_name, keys=self.trigger_keys,
+                                                     statement_level=DB_TRIGGER_STATEMENT_LEVEL)
 
     async def get_records(self, filter_dict={}, fetch_single=False,
-                          ordering: List[str] = None, limit: int = 0, expanded=False) -> DBResponse:
+                          ordering: List[str] = None, limit: int = 0, expanded=False,
+                          since: int = None) -> DBResponse:
         conditions = []
         values = []
         for col_name, col_val in filter_dict.items():
             conditions.append("{} = %s".format(col_name))
             values.append(col_val)
+        if since is not None:
+            since_conditions, since_values = self.changed_since_conditions(since)
+            conditions += since_conditions
+            values += since_values
 
         response, _ = await self.find_records(
             conditions=conditions, values=values, fetch_single=fetch_single,
             order=ordering, limit=limit, expanded=expanded
         )
+        if since is None and self.read_through_archive(filter_dict, response):
+            archived, _ = await self.find_records(
+                conditions=conditions, values=values, fetch_single=fetch_single,
+                order=ordering, limit=limit, expanded=expanded, from_archive=True
+            )
+            if archived.response_code == 200:
+                return archived
         return response
 
+    def read_through_archive(self, filter_dict: Dict, response: DBResponse) -> bool:
+        """
+        Whether to repeat a lookup on the archive table, as nothing was found in the table itself.
+        Only lookups within a specific run are repeated, as runs are archived as a whole.
+        Lookups of changes are never repeated, as archived runs do not change anymore.
+        """
+        return DB_ARCHIVE_READ_THROUGH and self.archive_table_name is not None and \
+            ("run_number" in filter_dict or "run_id" in filter_dict) and \
+            (response.response_code == 404 or (response.response_code == 200 and response.body == []))
+
     async def find_records(self, conditions: List[str] = None, values=[], fetch_single=False,
                            limit: int = 0, offset: int = 0, order: List[str] = None, expanded=False,
-                           enable_joins=False) -> Tuple[DBResponse, DBPagination]:
+                           enable_joins=False, from_archive=False) -> Tuple[DBResponse, DBPagination]:
+        select_sql = self._find_records_sql(conditions, order, limit, offset, enable_joins, from_archive)
+        return await self.execute_sql(select_sql=select_sql, values=with_limit_values(values, limit, offset),
+                                      fetch_single=fetch_single, expanded=expanded, limit=limit, offset=offset,
+                                      prepare=True)
+
+    async def stream_records(self, filter_dict={}, ordering: List[str] = None,
+                             expanded=False, since: int = None) -> AsyncIterator[List[Dict]]:
+        """
+        Same rows as get_records(), read from a server-side cursor and yielded in chunks of serialized rows.
+        Archived rows are streamed instead when nothing is found, as with get_records().
+        """
+        conditions = ["{} = %s".format(col_name) for col_name in filter_dict]
+        values = list(filter_dict.values())
+        if since is not None:
+            since_conditions, since_values = self.changed_since_conditions(since)
+            conditions += since_conditions
+            values += since_values
+        for from_archive in [False, True]:
+            select_sql = self._find_records_sql(conditions, ordering, from_archive=from_archive)
+            found = False
+            async for rows in self.stream_sql(select_sql, values, expanded=expanded):
+                found = True
+                yield rows
+            if found or since is not None or \
+                    not self.read_through_archive(filter_dict, DBResponse(response_code=200, body=[])):
+                return
+
+    def changed_since_conditions(self, since: int) -> Tuple[List[str], List]:
+        """
+        Conditions and values selecting the rows inserted or updated at or after since, an epoch in milliseconds.
+
+        Rows are inserted with their ts_epoch in milliseconds. The only updates are heartbeats,
+        which set last_heartbeat_ts in seconds.
+        """
+        if "last_heartbeat_ts" in self.keys:
+            return ["(ts_epoch >= %s OR last_heartbeat_ts >= %s)"], [since, since // 1000]
+        return ["ts_epoch >= %s"], [since]
+
+    def _find_records_sql(self, conditions: List[str] = None, order: List[str] = None, limit: int = 0,
+                          offset: int = 0, enable_joins=False, from_archive=False) -> str:
         sql_template = """
         SELECT * FROM (
             SELECT
@@ -194,35 +476,51 @@ class AsyncPostgresTable(object):
         {offset}
         """
 
-        select_sql = sql_template.format(
+        shape = ("find_records", tuple(conditions or []), tuple(order or []), bool(limit), bool(offset), enable_joins,
+                 from_archive)
+        return self.compiled_query(shape, lambda: sql_template.format(
             keys=",".join(
                 self.select_columns + (self.join_columns if enable_joins and self.join_columns else [])),
-            table_name=self.table_name,
+            table_name=self.archive_table_name if from_archive else self.table_name,
             joins=" ".join(self.joins) if enable_joins and self.joins is not None else "",
             where="WHERE {}".format(" AND ".join(conditions)) if conditions else "",
             order_by="ORDER BY {}".format(", ".join(order)) if order else "",
-            limit="LIMIT {}".format(limit) if limit else "",
-            offset="OFFSET {}".format(offset) if offset else ""
-        ).strip()
+            limit="LIMIT %s" if limit else "",
+            offset="OFFSET %s" if offset else ""
+        ).strip())
 
-        return await self.execute_sql(select_sql=select_sql, values=values, fetch_single=fetch_single,
-                                      expanded=expanded, limit=limit, offset=offset)
+    def compiled_query(self, shape: Tuple, build: Callable[[], str]) -> str:
+        """
+        Get the SQL for a query shape, only compiling it on first use.
+
+        Parameters
+        ----------
+        shape : Tuple
+            hashable description of everything the SQL string depends on. Values must be passed as query parameters.
+        build : Callable[[], str]
+            builds the SQL string for the shape
+        """
+        select_sql = self._query_cache.get(shape)
+        if select_sql is None:
+            select_sql = build()
+            self._query_cache.set(shape, select_sql)
+        return select_sql
 
+    @instrument("execute_sql")
     async def execute_sql(self, select_sql: str, values=[], fetch_single=False,
-                          expanded=False, limit: int = 0, offset: int = 0) -> Tuple[DBResponse, DBPagination]:
+                          expanded=False, limit: int = 0, offset: int = 0,
+                          prepare: bool = False, primary: bool = False) -> Tuple[DBResponse, DBPagination]:
+        # Queries run on a read replica when configured, unless the primary is explicitly requested.
+        pool = self.db.pool if primary else self.db.read_pool()
         try:
-            with (
-                await self.db.pool.cursor(
-                    cursor_factory=psycopg2.extras.DictCursor
-                )
-            ) as cur:
-                await cur.execute(select_sql, values)
+            # Rows are fetched as tuples and serialized by column position, without creating row objects
+            with (await pool.cursor()) as cur:
+                await self._execute(cur, select_sql, values, prepare=prepare)
 
-                rows = []
                 records = await cur.fetchall()
-                for record in records:
-                    row = self._row_type(**record)  # pylint: disable=not-callable
-                    rows.append(row.serialize(expanded))
+                serialize = self._row_type.tuple_serializer(  # pylint: disable=no-member
+                    [column[0] for column in cur.description], expanded)
+                rows = [serialize(record) for record in records]
 
                 count = len(rows)
 
@@ -239,12 +537,86 @@ class AsyncPostgresTable(object):
                 cur.close()
                 return DBResponse(response_code=200, body=body), pagination
         except IndexError as error:
+            if pool is not self.db.pool and self.db.replica_fallback:
+                # The row might have been created on the primary but not replicated yet.
+                return await self.execute_sql(
+                    select_sql=select_sql, values=values, fetch_single=fetch_single, expanded=expanded,
+                    limit=limit, offset=offset, prepare=prepare, primary=True)
             return aiopg_exception_handling(error), None
         except (Exception, psycopg2.DatabaseError) as error:
             self.db.logger.exception("Exception occured")
+            count_error(self, "execute_sql", error)
             return aiopg_exception_handling(error), None
 
-    async def create_record(self, record_dict):
+    async def stream_sql(self, select_sql: str, values=[], expanded=False,
+                         chunk_size: int = None) -> AsyncIterator[List[Dict]]:
+        """
+        Execute a query on a server-side cursor, yielding the serialized rows in chunks of at most chunk_size,
+        which defaults to STREAM_CHUNK_SIZE.
+
+        Only one chunk of rows is held in memory at a time, regardless of the size of the result.
+        The cursor lives in a transaction on a pooled connection, which is held until the iteration
+        has finished or is closed.
+        """
+        pool = self.db.read_pool()
+        with (await pool.cursor()) as cur:
+            await cur.execute("BEGIN READ ONLY")
+            try:
+                await cur.execute("DECLARE mf_stream NO SCROLL CURSOR FOR {}".format(select_sql), values)
+                serialize = None
+                while True:
+                    await cur.execute("FETCH FORWARD {:d} FROM mf_stream".format(chunk_size or STREAM_CHUNK_SIZE))
+                    records = await cur.fetchall()
+                    if not records:
+                        break
+                    if serialize is None:
+                        serialize = self._row_type.tuple_serializer(  # pylint: disable=no-member
+                            [column[0] for column in cur.description], expanded)
+                    yield [serialize(record) for record in records]
+                await cur.execute("COMMIT")
+            except BaseException as error:
+                if isinstance(error, Exception):
+                    self.db.logger.exception("Exception occured")
+                    count_error(self, "stream_sql", error)
+                await cur.execute("ROLLBACK")
+                raise
+            finally:
+                cur.close()
+
+    async def _execute(self, cur, sql: str, values=[], prepare: bool = False):
+        """
+        Execute a query on the cursor, optionally as a server-side prepared statement.
+
+        Statements are prepared once per pooled connection, so that Postgres can skip parsing and planning
+        on subsequent executions. Only SQL with a bounded number of variations should be prepared,
+        such as the compiled templates of find_records(). Has no effect unless DB_PREPARED_STATEMENTS is enabled.
+        """
+        if not (prepare and DB_PREPARED_STATEMENTS) or getattr(cur, "prepares_statements", False):
+            await cur.execute(sql, values)
+            return
+
+        name = "mf_{}".format(hashlib.md5(sql.encode("utf-8")).hexdigest())
+        if name in self._unpreparable_statements:
+            await cur.execute(sql, values)
+            return
+
+        prepared = self._prepared_statements.setdefault(cur.connection, set())
+        if name not in prepared:
+            try:
+                await cur.execute("PREPARE {} AS {}".format(name, numbered_placeholders(sql)))
+            except psycopg2.DatabaseError:
+                # eg. parameter types could not be inferred. Keep executing the statement unprepared.
+                self.db.logger.warning("Could not prepare statement, executing without preparing:\n{}".format(sql))
+                self._unpreparable_statements.add(name)
+                await cur.execute(sql, values)
+                return
+            prepared.add(name)
+
+        params = "({})".format(", ".join(["%s"] * len(values))) if values else ""
+        await cur.execute("EXECUTE {}{}".format(name, params), values)
+
+    @instrument("create_record")
+    async def create_record(self, record_dict, expanded: bool = False):
         # note: need to maintain order
         cols = []
         values = []
@@ -270,28 +642,115 @@ class AsyncPostgresTable(object):
         )
 
         try:
-            response_body = {}
-            with (
-                await self.db.pool.cursor(
-                    cursor_factory=psycopg2.extras.DictCursor
-                )
-            ) as cur:
-
-                await cur.execute(insert_sql, tuple(values))
-                records = await cur.fetchall()
-                record = records[0]
-                filtered_record = {}
-                for key, value in record.items():
-                    if key in self.keys:
-                        filtered_record[key] = value
-                response_body = self._row_type(**filtered_record).serialize()  # pylint: disable=not-callable
-                # todo make sure connection is closed even with error
-                cur.close()
+            records = await self._execute_insert(insert_sql, tuple(values))
+            record = records[0]
+            filtered_record = {}
+            for key, value in record.items():
+                if key in self.keys:
+                    filtered_record[key] = value
+            response_body = self._row_type(**filtered_record).serialize(expanded)  # pylint: disable=not-callable
             return DBResponse(response_code=200, body=response_body)
         except (Exception, psycopg2.DatabaseError) as error:
             self.db.logger.exception("Exception occured")
+            count_error(self, "create_record", error)
             return aiopg_exception_handling(error)
 
+    @instrument("create_records")
+    async def create_records(self, records: List[Dict], match_keys: List[str] = None) -> List[DBResponse]:
+        """
+        Insert multiple records with a single multi-row INSERT statement.
+
+        Rows that would violate a unique constraint are skipped instead of failing the whole batch.
+        Returns one DBResponse per given record, in the same order: 200 with the created row,
+        or 409 if the row was not inserted due to a conflict.
+
+        Parameters
+        ----------
+        records : List[Dict]
+            records to insert. All records are expected to share the same columns.
+        match_keys : List[str] (optional)
+            columns used to match the created rows back to the given records. Defaults to primary_keys.
+        """
+        if not records:
+            return []
+
+        insert_sql, values = self._multi_row_insert(records, on_conflict="ON CONFLICT DO NOTHING")
+        try:
+            created = await self._execute_insert(insert_sql, tuple(values))
+        except (Exception, psycopg2.DatabaseError) as error:
+            # Fall back to inserting rows one by one, so that a single bad record does not fail the whole batch.
+            self.db.logger.exception("Bulk insert failed, falling back to single inserts")
+            count_error(self, "create_records", error)
+            return [await self.create_record(record) for record in records]
+
+        return self._match_created_records(records, created, match_keys or self.primary_keys)
+
+    async def _execute_insert(self, insert_sql: str, values: Tuple) -> List:
+        "Execute an INSERT ... RETURNING statement through the ingest queue, if any, and return the rows it returns."
+        if self.db.ingest_queue is not None:
+            return await self.db.ingest_queue.execute(self.table_name, insert_sql, values)
+        with (
+            await self.db.pool.cursor(
+                cursor_factory=psycopg2.extras.DictCursor
+            )
+        ) as cur:
+            await cur.execute(insert_sql, values)
+            records = await cur.fetchall()
+            cur.close()
+        return records
+
+    def _multi_row_insert(self, records: List[Dict], on_conflict: str = "") -> Tuple[str, List]:
+        "Build a single INSERT statement and its parameters for records that all share the same columns."
+        # note: need to maintain order
+        cols = list(records[0].keys())
+        ts_epoch = get_db_ts_epoch_str()
+        values = []
+        for record in records:
+            values.extend(record[col] for col in cols)
+            # add create ts
+            values.append(ts_epoch)
+        cols.append("ts_epoch")
+
+        row_format = "({})".format(", ".join(["%s"] * len(cols)))
+
+        insert_sql = """
+                    INSERT INTO {0}({1}) VALUES {2}
+                    {3}
+                    RETURNING *
+                    """.format(
+            self.table_name, ", ".join(cols), ", ".join([row_format] * len(records)), on_conflict
+        )
+        return insert_sql, values
+
+    def _match_created_records(self, records: List[Dict], created: List[Dict], match_keys: List[str]) -> List[DBResponse]:
+        "Pair rows returned by a bulk insert with the records that were requested to be inserted."
+        def _key(record):
+            return tuple(str(record.get(k)) for k in match_keys)
+
+        def _response(record):
+            filtered_record = {key: value for key, value in record.items() if key in self.keys}
+            return DBResponse(response_code=200,
+                              body=self._row_type(**filtered_record).serialize())  # pylint: disable=not-callable
+
+        if len(created) == len(records):
+            # Nothing conflicted, rows are returned in insertion order.
+            return [_response(record) for record in created]
+
+        created_by_key = {}
+        for record in created:
+            created_by_key.setdefault(_key(record), []).append(record)
+
+        responses = []
+        for record in records:
+            matches = created_by_key.get(_key(record))
+            if matches:
+                responses.append(_response(matches.pop(0)))
+            else:
+                responses.append(DBResponse(response_code=409,
+                                            body=json.dumps({"err_msg": "duplicate key"})))
+        return responses
+
+    @instrument("update_row")
     async def update_row(self, filter_dict={}, update_dict={}):
         # generate where clause
         filters = []
@@ -344,6 +803,57 @@ class AsyncPostgresTable(object):
                 return DBResponse(response_code=200, body=body)
         except (Exception, psycopg2.DatabaseError) as error:
             self.db.logger.exception("Exception occured")
+            count_error(self, "update_row", error)
+            return aiopg_exception_handling(error)
+
+    @instrument("update_heartbeats")
+    async def update_heartbeats(self, heartbeats: Dict[Tuple, int]) -> DBResponse:
+        """
+        Set last_heartbeat_ts of many rows with a single UPDATE ... FROM (VALUES ...) statement.
+        Heartbeats are only ever moved forward, an older timestamp does not overwrite a newer one.
+
+        Parameters
+        ----------
+        heartbeats : Dict[Tuple, int]
+            heartbeat timestamps keyed by a tuple of primary key values, in the order of primary_keys.
+
+        Returns
+        -------
+        DBResponse
+            200 with the number of updated rows as body, or an error response.
+        """
+        if not heartbeats:
+            return DBResponse(response_code=200, body={"rowcount": 0})
+
+        columns = self.primary_keys + ["last_heartbeat_ts"]
+        values = []
+        for key, heartbeat_ts in heartbeats.items():
+            values.extend(key)
+            values.append(heartbeat_ts)
+        # Column types of a VALUES list are inferred from its contents, make sure integer columns compare as such.
+        row_format = "({})".format(", ".join(
+            "%s::bigint" if isinstance(value, int) else "%s" for value in values[:len(columns)]))
+
+        update_sql = """
+                UPDATE {table_name} AS t SET last_heartbeat_ts = v.last_heartbeat_ts
+                FROM (VALUES {rows}) AS v({columns})
+                WHERE {conditions}
+                AND (t.last_heartbeat_ts IS NULL OR t.last_heartbeat_ts < v.last_heartbeat_ts)
+        """.format(
+            table_name=self.table_name,
+            rows=", ".join([row_format] * len(heartbeats)),
+            columns=", ".join(columns),
+            conditions=" AND ".join("t.{0} = v.{0}".format(key) for key in self.primary_keys)
+        )
+        try:
+            with (await self.db.pool.cursor()) as cur:
+                await cur.execute(update_sql, tuple(values))
+                body = {"rowcount": cur.rowcount}
+                cur.close()
+                return DBResponse(response_code=200, body=body)
+        except (Exception, psycopg2.DatabaseError) as error:
+            self.db.logger.exception("Exception occured")
+            count_error(self, "update_heartbeats", error)
             return aiopg_exception_handling(error)
 
 
@@ -361,7 +871,81 @@ class PostgresUtils(object):
                     await cur.execute(command)
             finally:
                 cur.close()
-    # todo add method to check schema version
+
+    @staticmethod
+    async def get_schema_state(db: _AsyncPostgresDB, table_names: List[str]) -> SchemaState:
+        """
+        Look up which of the tables exist in the current schema, with their partitioning and triggers, in one query.
+
+        The fingerprint is a checksum of the definitions of the tables: columns, constraints, indexes, triggers
+        and partitioning. It changes with any migration or setup step that alters the tables,
+        but not when partitions are added.
+        """
+        with (await db.pool.cursor()) as cur:
+            try:
+                await cur.execute(
+                    """
+                    SELECT c.relname::text AS table_name,
+                        c.relkind = 'p' AS partitioned,
+                        ARRAY(
+                            SELECT tgname::text FROM pg_trigger
+                            WHERE tgrelid = c.oid AND NOT tgisinternal ORDER BY tgname
+                        ) AS triggers,
+                        md5(concat_ws(';',
+                            (SELECT string_agg(attname || ' ' || format_type(atttypid, atttypmod) ||
+                                CASE WHEN attnotnull THEN ' NOT NULL' ELSE '' END, ',' ORDER BY attnum)
+                             FROM pg_attribute WHERE attrelid = c.oid AND attnum > 0 AND NOT attisdropped),
+                            (SELECT string_agg(pg_get_constraintdef(oid), ',' ORDER BY conname)
+                             FROM pg_constraint WHERE conrelid = c.oid),
+                            (SELECT string_agg(pg_get_indexdef(indexrelid), ',' ORDER BY pg_get_indexdef(indexrelid))
+                             FROM pg_index WHERE indrelid = c.oid)
+                        )) AS definition
+                    FROM pg_class c
+                    WHERE c.relname = ANY(%s) AND c.relkind IN ('r', 'p')
+                    AND c.relnamespace = to_regnamespace(current_schema())
+                    ORDER BY c.relname
+                    """,
+                    (list(table_names),),
+                )
+                rows = await cur.fetchall()
+            finally:
+                cur.close()
+
+        fingerprint = hashlib.md5(json.dumps(
+            [[row[0], row[1], list(row[2]), row[3]] for row in rows]).encode("utf-8")).hexdigest()
+        return SchemaState(
+            fingerprint=fingerprint,
+            tables={row[0]: TableState(partitioned=row[1], triggers=list(row[2])) for row in rows})
+
+    @staticmethod
+    async def create_partitions(db: _AsyncPostgresDB, table_name, months_ahead: int = DB_PARTITION_MONTHS_AHEAD,
+                                partitioned: bool = None):
+        """
+        Create monthly partitions for the current and upcoming months, if the table has been
+        partitioned on ts_epoch by the migrations. Tables that are not partitioned are left as is.
+        Whether the table is partitioned is looked up, unless already known from the schema state.
+        """
+        if partitioned is False:
+            return
+        with (await db.pool.cursor()) as cur:
+            try:
+                if partitioned is None:
+                    await cur.execute(
+                        """
+                        SELECT 1
+                        FROM pg_partitioned_table JOIN pg_class ON pg_class.oid = pg_partitioned_table.partrelid
+                        WHERE pg_class.relname = %s AND pg_class.relnamespace = to_regnamespace(current_schema())
+                        """,
+                        (table_name,),
+                    )
+                    if not cur.rowcount:
+                        return
+                await cur.execute("SELECT create_ts_epoch_partitions(%s, %s)", (table_name, months_ahead))
+                created = (await cur.fetchone())[0]
+                if created:
+                    db.logger.info("Created {} partitions for {}".format(created, table_name))
+            finally:
+                cur.close()
 
     @staticmethod
     async def create_trigger_if_missing(db: _AsyncPostgresDB, table_name, trigger_name, commands=[]):
@@ -385,13 +969,43 @@ class PostgresUtils(object):
                 cur.close()
 
     @staticmethod
-    async def setup_trigger_notify(db: _AsyncPostgresDB, table_name, keys: List[str] = None, schema="public"):
+    def notify_trigger_name(table_name, statement_level: bool = False) -> str:
+        "Name of the trigger that tells whether setup_trigger_notify has been run for the table in the given mode"
+        if statement_level:
+            return "notify_ui_{}_insert".format(table_name)
+        return "notify_ui_{}".format(table_name)
+
+    @staticmethod
+    async def setup_trigger_notify(db: _AsyncPostgresDB, table_name, keys: List[str] = None, schema="public",
+                                   statement_level: bool = False):
+        """
+        Broadcast inserts, updates and deletes on the table with pg_notify on channel 'notify'.
+        The payload 'data' contains the given keys of the changed row.
+
+        With statement_level, a single notification is sent per statement instead, where 'data' is a list
+        with the keys of all changed rows. Keys that do not fit in one payload are split over several notifications.
+        Switching between the modes replaces the triggers of the other mode.
+
+        The payload 'table' is always table_name, also for rows of a partition of a partitioned table.
+        """
         if not keys:
             pass
 
         name_prefix = "notify_ui"
         operations = ["INSERT", "UPDATE", "DELETE"]
-        _commands = ["""
+        if statement_level:
+            return await PostgresUtils._setup_statement_trigger_notify(
+                db, table_name, keys, schema, name_prefix, operations)
+
+        # Remove statement level triggers in case they were set up before
+        _commands = ["DROP TRIGGER IF EXISTS {prefix}_{table}_{operation} ON {schema}.{table};".format(
+            schema=schema,
+            prefix=name_prefix,
+            table=table_name,
+            operation=operation.lower()
+        ) for operation in operations]
+
+        _commands += ["""
         CREATE OR REPLACE FUNCTION {schema}.{prefix}_{table}() RETURNS trigger
             LANGUAGE plpgsql
             AS $$
@@ -409,7 +1023,7 @@ class PostgresUtils(object):
             END CASE;
 
             PERFORM pg_notify('notify', json_build_object(
-                            'table',     TG_TABLE_NAME,
+                            'table',     '{table}',
                             'schema',    TG_TABLE_SCHEMA,
                             'operation', TG_OP,
                             'data',      json_build_object({keys})
@@ -447,7 +1061,103 @@ class PostgresUtils(object):
         await PostgresUtils.create_trigger_if_missing(
             db=db,
             table_name=table_name,
-            trigger_name="{}_{}".format(name_prefix, table_name),
+            trigger_name=PostgresUtils.notify_trigger_name(table_name),
+            commands=_commands
+        )
+
+    @staticmethod
+    async def _setup_statement_trigger_notify(db: _AsyncPostgresDB, table_name, keys: List[str], schema: str,
+                                              name_prefix: str, operations: List[str]):
+        # Changed rows are read from the transition tables of the statement
+        _commands = ["DROP TRIGGER IF EXISTS {prefix}_{table} ON {schema}.{table};".format(
+            schema=schema,
+            prefix=name_prefix,
+            table=table_name
+        )]
+
+        _commands += ["""
+        CREATE OR REPLACE FUNCTION {schema}.{prefix}_{table}_batch() RETURNS trigger
+            LANGUAGE plpgsql
+            AS $$
+        DECLARE
+            affected refcursor;
+            rec RECORD;
+            done boolean;
+            item text;
+            items text[] := ARRAY[]::text[];
+            items_bytes integer := 0;
+            BEGIN
+
+            IF TG_OP = 'DELETE' THEN
+                OPEN affected FOR SELECT * FROM old_rows;
+            ELSE
+                OPEN affected FOR SELECT * FROM new_rows;
+            END IF;
+
+            LOOP
+                FETCH affected INTO rec;
+                done := NOT FOUND;
+                IF NOT done THEN
+                    item := json_build_object({keys})::text;
+                END IF;
+
+                -- Send the batch after the last row, or when the next row would not fit in it
+                IF cardinality(items) > 0 AND (done OR items_bytes + octet_length(item) > {batch_bytes}) THEN
+                    PERFORM pg_notify('notify', json_build_object(
+                                    'table',     '{table}',
+                                    'schema',    TG_TABLE_SCHEMA,
+                                    'operation', TG_OP,
+                                    'data',      ('[' || array_to_string(items, ',') || ']')::json
+                            )::text);
+                    items := ARRAY[]::text[];
+                    items_bytes := 0;
+                END IF;
+
+                EXIT WHEN done;
+                items := items || item;
+                items_bytes := items_bytes + octet_length(item) + 1;
+            END LOOP;
+
+            CLOSE affected;
+            RETURN NULL;
+            END;
+        $$;
+        """.format(
+            schema=schema,
+            prefix=name_prefix,
+            table=table_name,
+            keys=", ".join(map(lambda k: "'{0}', rec.{0}".format(k), keys)),
+            batch_bytes=NOTIFY_BATCH_BYTES
+        )]
+
+        # Transition tables can only be referenced by triggers for a single event
+        for operation in operations:
+            _commands += ["""
+                CREATE TRIGGER {prefix}_{table}_{name} AFTER {operation} ON {schema}.{table}
+                    REFERENCING {transition} TABLE AS {transition_name}
+                    FOR EACH STATEMENT EXECUTE PROCEDURE {schema}.{prefix}_{table}_batch();
+                """.format(
+                schema=schema,
+                prefix=name_prefix,
+                table=table_name,
+                name=operation.lower(),
+                operation=operation,
+                transition="OLD" if operation == "DELETE" else "NEW",
+                transition_name="old_rows" if operation == "DELETE" else "new_rows"
+            )]
+
+            # This enables trigger on both replica and non-replica mode
+            _commands += ["ALTER TABLE {schema}.{table} ENABLE ALWAYS TRIGGER {prefix}_{table}_{name};".format(
+                schema=schema,
+                prefix=name_prefix,
+                table=table_name,
+                name=operation.lower()
+            )]
+
+        await PostgresUtils.create_trigger_if_missing(
+            db=db,
+            table_name=table_name,
+            trigger_name=PostgresUtils.notify_trigger_name(table_name, statement_level=True),
             commands=_commands
         )
 
@@ -495,6 +1205,7 @@ class AsyncRunTablePostgres(AsyncPostgresTable):
     _current_count = 0
     _row_type = RunRow
     table_name = RUN_TABLE_NAME
+    archive_table_name = RUN_TABLE_NAME + "_archive"
     keys = ["flow_id", "run_number", "run_id",
             "user_name", "ts_epoch", "last_heartbeat_ts", "tags", "system_tags"]
     primary_keys = ["flow_id", "run_number"]
@@ -528,7 +1239,11 @@ class AsyncRunTablePostgres(AsyncPostgresTable):
             "run_id": run.run_id,
             "last_heartbeat_ts": str(new_heartbeat_ts()) if fill_heartbeat else None
         }
-        return await self.create_record(dict)
+        response = await self.create_record(dict, expanded=True)
+        if response.response_code != 200:
+            return response
+        self.db.cache_run_ids(response.body)
+        return DBResponse(response_code=200, body=RunRow(**response.body).serialize())
 
     async def get_run(self, flow_id: str, run_id: str, expanded: bool = False):
         key, value = translate_run_key(run_id)
@@ -536,9 +1251,9 @@ class AsyncRunTablePostgres(AsyncPostgresTable):
         return await self.get_records(filter_dict=filter_dict,
                                       fetch_single=True, expanded=expanded)
 
-    async def get_all_runs(self, flow_id: str):
+    async def get_all_runs(self, flow_id: str, since: int = None):
         filter_dict = {"flow_id": flow_id}
-        return await self.get_records(filter_dict=filter_dict)
+        return await self.get_records(filter_dict=filter_dict, since=since)
 
     async def update_heartbeat(self, flow_id: str, run_id: str):
         run_key, run_value = translate_run_key(run_id)
@@ -562,6 +1277,7 @@ class AsyncStepTablePostgres(AsyncPostgresTable):
     run_to_step_dict = {}
     _row_type = StepRow
     table_name = STEP_TABLE_NAME
+    archive_table_name = STEP_TABLE_NAME + "_archive"
     keys = ["flow_id", "run_number", "run_id", "step_name",
             "user_name", "ts_epoch", "tags", "system_tags"]
     primary_keys = ["flow_id", "run_number", "step_name"]
@@ -620,6 +1336,7 @@ class AsyncTaskTablePostgres(AsyncPostgresTable):
     _current_count = 0
     _row_type = TaskRow
     table_name = TASK_TABLE_NAME
+    archive_table_name = TASK_TABLE_NAME + "_archive"
     keys = ["flow_id", "run_number", "run_id", "step_name", "task_id",
             "task_name", "user_name", "ts_epoch", "last_heartbeat_ts", "tags", "system_tags"]
     primary_keys = ["flow_id", "run_number", "step_name", "task_id"]
@@ -647,8 +1364,53 @@ class AsyncTaskTablePostgres(AsyncPostgresTable):
     )
 
     async def add_task(self, task: TaskRow, fill_heartbeat=False):
+        response = await self.create_record(self._task_record(task, fill_heartbeat), expanded=True)
+        if response.response_code != 200:
+            return response
+        self.db.cache_task_ids(response.body)
+        return DBResponse(response_code=200, body=TaskRow(**response.body).serialize())
+
+    async def add_tasks(self, tasks: List[TaskRow], fill_heartbeat=False) -> DBResponse:
+        """
+        Register multiple tasks with a single INSERT statement.
+
+        The batch is inserted atomically: if any task can not be created, none of them are.
+
+        Parameters
+        ----------
+        tasks : List[TaskRow]
+            tasks to register
+        fill_heartbeat : bool
+            set an initial heartbeat for all tasks
+
+        Returns
+        -------
+        DBResponse
+            200 with the list of created tasks in the order they were given, or an error response.
+        """
+        if not tasks:
+            return DBResponse(response_code=200, body=[])
+
+        insert_sql, values = self._multi_row_insert(
+            [self._task_record(task, fill_heartbeat) for task in tasks])
+        try:
+            records = await self._execute_insert(insert_sql, tuple(values))
+        except (Exception, psycopg2.DatabaseError) as error:
+            self.db.logger.exception("Exception occured")
+            return aiopg_exception_handling(error)
+
+        # task_ids are assigned from a sequence in the order of the VALUES list
+        created = []
+        for record in sorted(records, key=lambda record: record["task_id"]):
+            task = TaskRow(**{key: value for key, value in record.items() if key in self.keys})
+            self.db.cache_task_ids(task.serialize(expanded=True))
+            created.append(task.serialize())
+        return DBResponse(response_code=200, body=created)
+
+    @staticmethod
+    def _task_record(task: TaskRow, fill_heartbeat=False):
         # todo backfill run_number if missing?
-        dict = {
+        return {
             "flow_id": task.flow_id,
             "run_number": str(task.run_number),
             "run_id": task.run_id,
@@ -659,16 +1421,26 @@ class AsyncTaskTablePostgres(AsyncPostgresTable):
             "system_tags": json.dumps(task.system_tags),
             "last_heartbeat_ts": str(new_heartbeat_ts()) if fill_heartbeat else None
         }
-        return await self.create_record(dict)
 
-    async def get_tasks(self, flow_id: str, run_id: str, step_name: str):
+    async def get_tasks(self, flow_id: str, run_id: str, step_name: str, since: int = None):
         run_id_key, run_id_value = translate_run_key(run_id)
         filter_dict = {
             "flow_id": flow_id,
             run_id_key: run_id_value,
             "step_name": step_name,
         }
-        return await self.get_records(filter_dict=filter_dict)
+        return await self.get_records(filter_dict=filter_dict, since=since)
+
+    def stream_tasks(self, flow_id: str, run_id: str, step_name: str,
+                     since: int = None) -> AsyncIterator[List[Dict]]:
+        "Same as get_tasks(), streamed in chunks, see stream_records()"
+        run_id_key, run_id_value = translate_run_key(run_id)
+        filter_dict = {
+            "flow_id": flow_id,
+            run_id_key: run_id_value,
+            "step_name": step_name,
+        }
+        return self.stream_records(filter_dict=filter_dict, since=since)
 
     async def get_task(self, flow_id: str, run_id: str, step_name: str,
                        task_id: str, expanded: bool = False):
@@ -711,8 +1483,10 @@ class AsyncMetadataTablePostgres(AsyncPostgresTable):
     _current_count = 0
     _row_type = MetadataRow
     table_name = METADATA_TABLE_NAME
+    archive_table_name = METADATA_TABLE_NAME + "_archive"
+    partition_key = "ts_epoch"
     keys = ["flow_id", "run_number", "run_id", "step_name", "task_id", "task_name", "id",
-            "field_name", "value", "type", "user_name", "ts_epoch", "tags", "system_tags"]
+            "field_name", "value", "type", "user_name", "ts_epoch", "tags", "system_tags", "attempt_id"]
     primary_keys = ["flow_id", "run_number",
                     "step_name", "task_id", "field_name"]
     trigger_keys = ["flow_id", "run_number",
@@ -734,6 +1508,7 @@ class AsyncMetadataTablePostgres(AsyncPostgresTable):
         ts_epoch BIGINT NOT NULL,
         tags JSONB,
         system_tags JSONB,
+        attempt_id INT,
         PRIMARY KEY(id, flow_id, run_number, step_name, task_id, field_name)
     )
     """.format(table_name)
@@ -753,7 +1528,43 @@ class AsyncMetadataTablePostgres(AsyncPostgresTable):
         tags,
         system_tags,
     ):
-        dict = {
+        return await self.create_record(self._metadata_record(
+            flow_id, run_number, run_id, step_name, task_id, task_name,
+            field_name, value, type, user_name, tags, system_tags))
+
+    async def add_metadata_many(self, metadata: List[Dict]) -> List[DBResponse]:
+        """
+        Insert a batch of metadata with a single statement.
+
+        Parameters
+        ----------
+        metadata : List[Dict]
+            list of metadata, each accepting the same keyword arguments as add_metadata()
+
+        Returns
+        -------
+        List[DBResponse]
+            one response per metadata item, in order.
+        """
+        return await self.create_records(
+            [self._metadata_record(**datum) for datum in metadata])
+
+    @staticmethod
+    def _metadata_record(
+        flow_id,
+        run_number,
+        run_id,
+        step_name,
+        task_id,
+        task_name,
+        field_name,
+        value,
+        type,
+        user_name,
+        tags,
+        system_tags,
+    ):
+        return {
             "flow_id": flow_id,
             "run_number": str(run_number),
             "run_id": run_id,
@@ -766,14 +1577,21 @@ class AsyncMetadataTablePostgres(AsyncPostgresTable):
             "user_name": user_name,
             "tags": json.dumps(tags),
             "system_tags": json.dumps(system_tags),
+            "attempt_id": parse_attempt_id(field_name, value, tags),
         }
-        return await self.create_record(dict)
 
-    async def get_metadata_in_runs(self, flow_id: str, run_id: str):
+    async def get_metadata_in_runs(self, flow_id: str, run_id: str, since: int = None):
         run_id_key, run_id_value = translate_run_key(run_id)
         filter_dict = {"flow_id": flow_id,
                        run_id_key: run_id_value}
-        return await self.get_records(filter_dict=filter_dict)
+        return await self.get_records(filter_dict=filter_dict, since=since)
+
+    def stream_metadata_in_runs(self, flow_id: str, run_id: str, since: int = None) -> AsyncIterator[List[Dict]]:
+        "Same as get_metadata_in_runs(), streamed in chunks, see stream_records()"
+        run_id_key, run_id_value = translate_run_key(run_id)
+        filter_dict = {"flow_id": flow_id,
+                       run_id_key: run_id_value}
+        return self.stream_records(filter_dict=filter_dict, since=since)
 
     async def get_metadata(
         self, flow_id: str, run_id: int, step_name: str, task_id: str
@@ -797,6 +1615,8 @@ class AsyncArtifactTablePostgres(AsyncPostgresTable):
     current_count = 0
     _row_type = ArtifactRow
     table_name = ARTIFACT_TABLE_NAME
+    archive_table_name = ARTIFACT_TABLE_NAME + "_archive"
+    partition_key = "ts_epoch"
     ordering = ["attempt_id DESC"]
     keys = ["flow_id", "run_number", "run_id", "step_name", "task_id", "task_name", "name", "location",
             "ds_type", "sha", "type", "content_type", "user_name", "attempt_id", "ts_epoch", "tags", "system_tags"]
@@ -848,7 +1668,47 @@ class AsyncArtifactTablePostgres(AsyncPostgresTable):
         tags,
         system_tags,
     ):
-        dict = {
+        return await self.create_record(self._artifact_record(
+            flow_id, run_number, run_id, step_name, task_id, task_name, name, location,
+            ds_type, sha, type, content_type, user_name, attempt_id, tags, system_tags))
+
+    async def add_artifacts(self, artifacts: List[Dict]) -> List[DBResponse]:
+        """
+        Insert a batch of artifacts with a single statement.
+
+        Parameters
+        ----------
+        artifacts : List[Dict]
+            list of artifacts, each accepting the same keyword arguments as add_artifact()
+
+        Returns
+        -------
+        List[DBResponse]
+            one response per artifact, in order. 200 if created, 409 if the artifact already exists.
+        """
+        return await self.create_records(
+            [self._artifact_record(**artifact) for artifact in artifacts])
+
+    @staticmethod
+    def _artifact_record(
+        flow_id,
+        run_number,
+        run_id,
+        step_name,
+        task_id,
+        task_name,
+        name,
+        location,
+        ds_type,
+        sha,
+        type,
+        content_type,
+        user_name,
+        attempt_id,
+        tags,
+        system_tags,
+    ):
+        return {
             "flow_id": flow_id,
             "run_number": str(run_number),
             "run_id": run_id,
@@ -866,29 +1726,45 @@ class AsyncArtifactTablePostgres(AsyncPostgresTable):
             "tags": json.dumps(tags),
             "system_tags": json.dumps(system_tags),
         }
-        return await self.create_record(dict)
 
-    async def get_artifacts_in_runs(self, flow_id: str, run_id: int):
+    async def get_artifacts_in_runs(self, flow_id: str, run_id: int, latest_attempt: bool = False,
+                                    since: int = None):
         run_id_key, run_id_value = translate_run_key(run_id)
         filter_dict = {
             "flow_id": flow_id,
             run_id_key: run_id_value,
         }
+        if latest_attempt:
+            return await self.get_latest_attempt_records(filter_dict, since=since)
         return await self.get_records(filter_dict=filter_dict,
-                                      ordering=self.ordering)
+                                      ordering=self.ordering, since=since)
+
+    def stream_artifacts_in_runs(self, flow_id: str, run_id: int, latest_attempt: bool = False,
+                                 since: int = None) -> AsyncIterator[List[Dict]]:
+        "Same as get_artifacts_in_runs(), streamed in chunks, see stream_records()"
+        run_id_key, run_id_value = translate_run_key(run_id)
+        filter_dict = {
+            "flow_id": flow_id,
+            run_id_key: run_id_value,
+        }
+        if latest_attempt:
+            return self.stream_latest_attempt_records(filter_dict, since=since)
+        return self.stream_records(filter_dict=filter_dict, ordering=self.ordering, since=since)
 
-    async def get_artifact_in_steps(self, flow_id: str, run_id: int, step_name: str):
+    async def get_artifact_in_steps(self, flow_id: str, run_id: int, step_name: str, latest_attempt: bool = False):
         run_id_key, run_id_value = translate_run_key(run_id)
         filter_dict = {
             "flow_id": flow_id,
             run_id_key: run_id_value,
             "step_name": step_name,
         }
+        if latest_attempt:
+            return await self.get_latest_attempt_records(filter_dict)
         return await self.get_records(filter_dict=filter_dict,
                                       ordering=self.ordering)
 
     async def get_artifact_in_task(
-        self, flow_id: str, run_id: int, step_name: str, task_id: int
+        self, flow_id: str, run_id: int, step_name: str, task_id: int, latest_attempt: bool = False
     ):
         run_id_key, run_id_value = translate_run_key(run_id)
         task_id_key, task_id_value = translate_task_key(task_id)
@@ -898,9 +1774,93 @@ class AsyncArtifactTablePostgres(AsyncPostgresTable):
             "step_name": step_name,
             task_id_key: task_id_value,
         }
+        if latest_attempt:
+            return await self.get_latest_attempt_records(filter_dict)
         return await self.get_records(filter_dict=filter_dict,
                                       ordering=self.ordering)
 
+    async def get_latest_attempt_records(self, filter_dict: Dict, from_archive=False,
+                                         since: int = None) -> DBResponse:
+        """
+        Get the artifacts of only the latest attempt of each task matching filter_dict.
+
+        The latest attempt of a task is the highest attempt_id among its artifacts, as in
+        filter_artifacts_for_latest_attempt(). Selecting it in the query avoids fetching and serializing
+        the artifacts of all earlier attempts.
+
+        With since, only the artifacts of latest attempts that have been added since are returned.
+        """
+        select_sql, values = self._latest_attempt_query(filter_dict, from_archive, since)
+
+        response, _ = await self.execute_sql(select_sql=select_sql, values=values, prepare=True)
+        if not from_archive and since is None and self.read_through_archive(filter_dict, response):
+            return await self.get_latest_attempt_records(filter_dict, from_archive=True)
+        return response
+
+    async def stream_latest_attempt_records(self, filter_dict: Dict, since: int = None) -> AsyncIterator[List[Dict]]:
+        "Same as get_latest_attempt_records(), streamed in chunks, see stream_records()"
+        for from_archive in [False, True]:
+            select_sql, values = self._latest_attempt_query(filter_dict, from_archive, since)
+            found = False
+            async for rows in self.stream_sql(select_sql, values):
+                found = True
+                yield rows
+            if found or since is not None or \
+                    not self.read_through_archive(filter_dict, DBResponse(response_code=200, body=[])):
+                return
+
+    def _latest_attempt_query(self, filter_dict: Dict, from_archive=False, since: int = None) -> Tuple[str, List]:
+        conditions = ["{} = %s".format(col_name) for col_name in filter_dict]
+        values = list(filter_dict.values())
+        order = self._latest_attempt_ordering(filter_dict)
+        if since is None:
+            return self._latest_attempt_sql(conditions, order, from_archive), values
+
+        since_conditions, since_values = self.changed_since_conditions(since)
+        select_sql = self._latest_attempt_sql(conditions, order, from_archive, since_conditions)
+        return select_sql, values + values + since_values + since_values
+
+    def _latest_attempt_ordering(self, filter_dict: Dict) -> List[str]:
+        """
+        Latest attempts first, with ties in the order the artifacts were listed in when filtered in Python:
+        the order of the primary key index, read backwards for the artifacts of a single task
+        and forwards for the artifacts of a step or a run.
+        """
+        single_task = "task_id" in filter_dict or "task_name" in filter_dict
+        direction = "DESC" if single_task else "ASC"
+        return self.ordering + ["{} {}".format(key, direction) for key in self.primary_keys if key != "attempt_id"]
+
+    def _latest_attempt_sql(self, conditions: List[str], order: List[str], from_archive=False,
+                            since_conditions: List[str] = None) -> str:
+        # With since, the latest attempts are only looked up for the tasks with artifacts added since,
+        # which are found on the ts_epoch index.
+        # Keys are only unique per partition, an artifact stored in several partitions is read once, from its earliest copy.
+        shape = ("latest_attempt", tuple(conditions), tuple(order), from_archive, tuple(since_conditions or []))
+        return self.compiled_query(shape, lambda: """
+            SELECT {keys} FROM (
+                SELECT
+                    {keys},
+                    MAX(attempt_id) OVER (PARTITION BY flow_id, run_number, step_name, task_id) AS latest_attempt_id,
+                    ROW_NUMBER() OVER (PARTITION BY {primary_keys} ORDER BY ts_epoch) AS key_row
+                FROM {table_name}
+                WHERE {where}
+                {changed_tasks}
+            ) T
+            WHERE attempt_id = latest_attempt_id AND key_row = 1
+            {changed}
+            ORDER BY {order_by}
+            """.format(
+            keys=", ".join(self.select_columns),
+            primary_keys=", ".join(self.primary_keys),
+            table_name=self.archive_table_name if from_archive else self.table_name,
+            where=" AND ".join(conditions),
+            changed_tasks="AND (step_name, task_id) IN (SELECT step_name, task_id FROM {table_name} WHERE {where})".format(
+                table_name=self.archive_table_name if from_archive else self.table_name,
+                where=" AND ".join(conditions + since_conditions)) if since_conditions else "",
+            changed="AND {}".format(" AND ".join(since_conditions)) if since_conditions else "",
+            order_by=", ".join(order)
+        ).strip())
+
     async def get_artifact(
         self, flow_id: str, run_id: int, step_name: str, task_id: int, name: str
     ):
@@ -946,3 +1906,65 @@ class AsyncArtifactTablePostgres(AsyncPostgresTable):
         }
         return await self.get_records(filter_dict=filter_dict,
                                       fetch_single=True, ordering=self.ordering)
+
+
+class AsyncTaskAttemptTablePostgres(AsyncPostgresTable):
+    """
+    Summary of each attempt of a task, for the task queries of the UI.
+
+    Rows are maintained by insert triggers on the metadata and artifact tables, from the 'attempt', 'attempt-done'
+    and 'attempt_ok' metadata and the '_task_ok' artifact of the attempt. Values are merged with GREATEST, so the
+    summary does not depend on the order in which the metadata and artifacts of an attempt are recorded.
+    The table, its triggers and the summary of existing attempts are created by the migration service.
+    """
+    _row_type = TaskAttemptRow
+    table_name = TASK_ATTEMPT_TABLE_NAME
+    archive_table_name = TASK_ATTEMPT_TABLE_NAME + "_archive"
+    # Changes are broadcast by the notify triggers of the metadata and artifact tables
+    notify_changes = False
+    created_by_migrations = True
+    keys = ["flow_id", "run_number", "step_name", "task_id", "attempt_id", "started_at",
+            "attempt_finished_at", "attempt_ok", "task_ok_finished_at", "task_ok_location"]
+    primary_keys = ["flow_id", "run_number", "step_name", "task_id", "attempt_id"]
+    select_columns = keys
+
+
+class AsyncRunSummaryTablePostgres(AsyncPostgresTable):
+    """
+    Terminal state of each run, for the run queries of the UI.
+
+    Rows are maintained by an insert trigger on the metadata table, from the 'attempt' and 'attempt_ok' metadata
+    of the end step. A run is completed or failed once its end step reports attempt_ok, and running again while
+    a later attempt of the end step is in progress. status, finished_at and duration are derived from the other
+    columns whenever a row changes, and indexed for the run listings of the UI.
+    The table, its triggers and the summary of existing runs are created by the migration service.
+    """
+    _row_type = RunSummaryRow
+    table_name = RUN_SUMMARY_TABLE_NAME
+    archive_table_name = RUN_SUMMARY_TABLE_NAME + "_archive"
+    # Changes are broadcast by the notify triggers of the metadata table
+    notify_changes = False
+    created_by_migrations = True
+    keys = ["flow_id", "run_number", "started_at", "end_attempt_ok", "end_attempt_ok_ts", "end_attempt_ts",
+            "status", "finished_at", "duration"]
+    primary_keys = ["flow_id", "run_number"]
+    select_columns = keys
+
+
+class AsyncRunTagTablePostgres(AsyncPostgresTable):
+    """
+    Dictionary of the tags and system tags of runs, for the tag listings of the UI.
+
+    Rows are maintained by a trigger on the runs table, on inserts, deletes and updates of the tags. Each tag
+    counts the runs it is set on, and the time it was last set on a run. Tags are removed once no run has them.
+    Tags are ordered by code point, as strings are sorted in Python.
+    The table, its trigger and the tags of existing runs are created by the migration service.
+    """
+    _row_type = RunTagRow
+    table_name = RUN_TAG_TABLE_NAME
+    # Runs are broadcast by the notify triggers of the runs table
+    notify_changes = False
+    created_by_migrations = True
+    keys = ["tag", "run_count", "last_seen_ts"]
+    primary_keys = ["tag"]
+    select_columns = keys
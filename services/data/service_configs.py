@@ -4,3 +4,10 @@ max_connection_retires = int(os.environ.get("MF_SERVICE_CONNECTION_RETRIES", 3))
 connection_retry_wait_time_seconds = int(os.environ.get("MF_SERVICE_CONNECTION_RETRY_WAITTIME_SECONDS", 1))
 max_startup_retries = int(os.environ.get("MF_SERVICE_STARTUP_RETRIES", 5))
 startup_retry_wait_time_seconds = int(os.environ.get("MF_SERVICE_STARTUP_WAITTIME_SECONDS", 1))
+heartbeat_flush_interval_seconds = float(os.environ.get("MF_HEARTBEAT_FLUSH_INTERVAL_SECONDS", 0))
+ingest_batch_window_ms = float(os.environ.get("MF_INGEST_BATCH_WINDOW_MS", 0))
+ingest_max_batch_size = int(os.environ.get("MF_INGEST_MAX_BATCH_SIZE", 100))
+metadata_workers = int(os.environ.get("MF_METADATA_WORKERS", 1))
+metadata_db_connection_budget = int(os.environ.get("MF_METADATA_DB_CONNECTION_BUDGET", 0))
+worker_health_timeout_seconds = float(os.environ.get("MF_METADATA_WORKER_HEALTH_TIMEOUT_SECONDS", 30))
+worker_shutdown_timeout_seconds = float(os.environ.get("MF_METADATA_WORKER_SHUTDOWN_TIMEOUT_SECONDS", 30))
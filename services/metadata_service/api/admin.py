@@ -7,6 +7,7 @@ import psycopg2.extras
 from multidict import MultiDict
 from aiohttp import web
 from botocore.client import Config
+from services.data.metrics import export_metrics
 from services.data.postgres_async_db import AsyncPostgresDB
 from services.utils import (
     get_traceback_str
@@ -16,12 +17,15 @@ from services.metadata_service.api.utils import METADATA_SERVICE_VERSION, \
 
 
 class AuthApi(object):
-    def __init__(self, app):
+    def __init__(self, app, worker=None):
+        # Worker process serving the app, when served by multiple workers
+        self._worker = worker
         app.router.add_route("GET", "/auth/token",
                              self.get_authorization_token)
         app.router.add_route("GET", "/ping", self.ping)
         app.router.add_route("GET", "/version", self.version)
         app.router.add_route("GET", "/healthcheck", self.healthcheck)
+        app.router.add_route("GET", "/metrics", self.metrics)
 
     async def version(self, request):
         """
@@ -56,11 +60,29 @@ class AuthApi(object):
         return web.Response(text="pong", headers=MultiDict(
             {METADATA_SERVICE_HEADER: METADATA_SERVICE_VERSION}))
 
+    async def metrics(self, request):
+        """
+        ---
+        description: Returns database latency, connection pool and error metrics in the Prometheus text format
+        tags:
+        - Admin
+        produces:
+        - 'text/plain'
+        responses:
+            "200":
+                description: successful operation. Return metrics
+            "405":
+                description: invalid HTTP Method
+        """
+        body, content_type = export_metrics()
+        return web.Response(body=body, headers={"Content-Type": content_type})
+
     async def healthcheck(self, request):
         """
         ---
         description: This end-point allow to test that service is up and
-            connected to the db
+            connected to the db. When served by multiple workers, it includes
+            the health of each worker.
         tags:
         - Admin
         produces:
@@ -90,6 +112,8 @@ class AuthApi(object):
                 status_code = 500
 
             cur.close()
+        if self._worker is not None:
+            status.update(self._worker.health())
         return web_response(status=status_code, body=json.dumps(status))
 
     async def get_authorization_token(self, request):
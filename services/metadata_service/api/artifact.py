@@ -1,14 +1,18 @@
 from aiohttp import web
 from services.data.postgres_async_db import AsyncPostgresDB
-from services.data.db_utils import (
-    filter_artifacts_for_latest_attempt,
-    filter_artifacts_by_attempt_id_for_tasks,
-)
+from services.data.db_utils import filter_artifacts_by_attempt_id_for_tasks
 from services.utils import read_body
 from services.metadata_service.api.utils import (
+    STREAM_RESPONSES,
+    InvalidChangeToken,
+    change_token_headers,
     format_response,
+    get_since,
     handle_exceptions,
     http_500,
+    invalid_change_token_response,
+    new_change_token,
+    stream_json_response,
 )
 import json
 
@@ -212,12 +216,11 @@ class ArtificatsApi(object):
         task_id = request.match_info.get("task_id")
 
         artifacts = await self._async_table.get_artifact_in_task(
-            flow_name, run_number, step_name, task_id
+            flow_name, run_number, step_name, task_id, latest_attempt=True
         )
         if artifacts.response_code == 200:
-            filtered_body = filter_artifacts_for_latest_attempt(artifacts.body)
             return web.Response(
-                status=artifacts.response_code, body=json.dumps(filtered_body)
+                status=artifacts.response_code, body=json.dumps(artifacts.body)
             )
         else:
             return web.Response(
@@ -327,12 +330,11 @@ class ArtificatsApi(object):
         step_name = request.match_info.get("step_name")
 
         artifacts = await self._async_table.get_artifact_in_steps(
-            flow_name, run_number, step_name
+            flow_name, run_number, step_name, latest_attempt=True
         )
         if artifacts.response_code == 200:
-            filtered_body = filter_artifacts_for_latest_attempt(artifacts.body)
             return web.Response(
-                status=artifacts.response_code, body=json.dumps(filtered_body)
+                status=artifacts.response_code, body=json.dumps(artifacts.body)
             )
         else:
             return web.Response(
@@ -357,22 +359,38 @@ class ArtificatsApi(object):
           description: "run_number"
           required: true
           type: "string"
+        - name: "since"
+          in: "query"
+          description: "change token of a previous response, to only get what has been added or updated since"
+          required: false
+          type: "integer"
         produces:
         - text/plain
         responses:
             "200":
-                description: successful operation
+                description: successful operation, with a change token in the METADATA_CHANGE_TOKEN header
+            "400":
+                description: invalid change token
             "405":
                 description: invalid HTTP Method
         """
         flow_name = request.match_info.get("flow_id")
         run_number = request.match_info.get("run_number")
+        try:
+            since = get_since(request)
+        except InvalidChangeToken as error:
+            return invalid_change_token_response(error)
 
-        artifacts = await self._async_table.get_artifacts_in_runs(flow_name, run_number)
+        change_token = new_change_token()
+        if STREAM_RESPONSES:
+            return await stream_json_response(
+                request, self._async_table.stream_artifacts_in_runs(flow_name, run_number, latest_attempt=True, since=since),
+                headers=change_token_headers(change_token))
+        artifacts = await self._async_table.get_artifacts_in_runs(flow_name, run_number, latest_attempt=True, since=since)
         if artifacts.response_code == 200:
-            filtered_body = filter_artifacts_for_latest_attempt(artifacts.body)
             return web.Response(
-                status=artifacts.response_code, body=json.dumps(filtered_body)
+                status=artifacts.response_code, body=json.dumps(artifacts.body),
+                headers=change_token_headers(change_token)
             )
         else:
             return web.Response(
@@ -463,7 +481,6 @@ class ArtificatsApi(object):
         step_name = request.match_info.get("step_name")
         task_id = request.match_info.get("task_id")
         body = await read_body(request.content)
-        count = 0
 
         try:
             run_number, run_id = await self._db.get_run_ids(flow_name, run_number)
@@ -478,9 +495,9 @@ class ArtificatsApi(object):
                 ),
             )
 
-        # todo change to bulk insert
+        artifacts = []
         for artifact in body:
-            values = {
+            artifacts.append({
                 "flow_id": flow_name,
                 "run_number": run_number,
                 "run_id": run_id,
@@ -497,10 +514,10 @@ class ArtificatsApi(object):
                 "user_name": artifact.get("user_name", " "),
                 "tags": artifact.get("tags"),
                 "system_tags": artifact.get("system_tags"),
-            }
-            artifact_response = await self._async_table.add_artifact(**values)
-            if artifact_response.response_code == 200:
-                count = count + 1
+            })
+
+        artifact_responses = await self._async_table.add_artifacts(artifacts)
+        count = sum(1 for response in artifact_responses if response.response_code == 200)
 
         result = {"artifacts_created": count}
 
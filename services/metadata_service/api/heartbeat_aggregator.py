@@ -0,0 +1,106 @@
+import asyncio
+import json
+from typing import Dict, Tuple
+
+from services.data.db_utils import DBResponse, new_heartbeat_ts
+from services.data.postgres_async_db import WAIT_TIME
+from services.utils import logging
+
+# Heartbeats older than HEARTBEAT_THRESHOLD (WAIT_TIME * 6) are considered expired by the UI service.
+# Flushing at least once every WAIT_TIME keeps buffered heartbeats well within that threshold.
+MAX_FLUSH_INTERVAL_SECONDS = WAIT_TIME
+
+
+class HeartbeatAggregator(object):
+    """
+    Coalesces run and task heartbeats in memory and writes them in batches.
+
+    Heartbeats are acknowledged as soon as the run or task has been resolved. Only the latest
+    timestamp per run and task is kept, and all buffered heartbeats are flushed periodically with
+    a single UPDATE statement per table.
+
+    Parameters
+    ----------
+    db : AsyncPostgresDB
+        initialized database adapter instance
+    flush_interval : float
+        seconds between flushes. Capped at MAX_FLUSH_INTERVAL_SECONDS.
+    """
+
+    def __init__(self, db, flush_interval: float):
+        self.db = db
+        self.logger = logging.getLogger("HeartbeatAggregator")
+        if flush_interval > MAX_FLUSH_INTERVAL_SECONDS:
+            self.logger.warning(
+                "Heartbeat flush interval of {} seconds is too long, using {} seconds instead".format(
+                    flush_interval, MAX_FLUSH_INTERVAL_SECONDS))
+            flush_interval = MAX_FLUSH_INTERVAL_SECONDS
+        self.flush_interval = flush_interval
+
+        self.run_heartbeats: Dict[Tuple, int] = {}
+        self.task_heartbeats: Dict[Tuple, int] = {}
+
+        self.loop = asyncio.get_event_loop()
+        self._flush_task = self.loop.create_task(self.periodic_flush())
+
+    async def run_heartbeat(self, flow_id: str, run_id: str) -> DBResponse:
+        "Buffer a heartbeat for a run, responding with 404 if the run does not exist."
+        try:
+            run_number, _ = await self.db.get_run_ids(flow_id, run_id)
+        except KeyError:
+            return _not_found_response()
+        self.run_heartbeats[(flow_id, run_number)] = new_heartbeat_ts()
+        return _heartbeat_response()
+
+    async def task_heartbeat(self, flow_id: str, run_id: str, step_name: str, task_id: str) -> DBResponse:
+        "Buffer a heartbeat for a task and its run, responding with 404 if either does not exist."
+        try:
+            run_number, _ = await self.db.get_run_ids(flow_id, run_id)
+        except KeyError:
+            return _not_found_response()
+        heartbeat_ts = new_heartbeat_ts()
+        self.run_heartbeats[(flow_id, run_number)] = heartbeat_ts
+
+        try:
+            task_id, _ = await self.db.get_task_ids(flow_id, run_id, step_name, task_id)
+        except KeyError:
+            return _not_found_response()
+        self.task_heartbeats[(flow_id, run_number, step_name, task_id)] = heartbeat_ts
+        return _heartbeat_response()
+
+    async def flush(self):
+        "Write all buffered heartbeats to the database"
+        run_heartbeats, self.run_heartbeats = self.run_heartbeats, {}
+        task_heartbeats, self.task_heartbeats = self.task_heartbeats, {}
+
+        for table, heartbeats, pending in [
+            (self.db.run_table_postgres, run_heartbeats, self.run_heartbeats),
+            (self.db.task_table_postgres, task_heartbeats, self.task_heartbeats)
+        ]:
+            result = await table.update_heartbeats(heartbeats)
+            if result.response_code != 200:
+                # Keep failed heartbeats around for the next flush, unless a newer one has arrived in the meantime.
+                for key, heartbeat_ts in heartbeats.items():
+                    pending[key] = max(heartbeat_ts, pending.get(key, 0))
+
+    async def periodic_flush(self):
+        "Async task that flushes buffered heartbeats every flush_interval seconds"
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception:
+                self.logger.exception("Flushing heartbeats failed")
+
+    async def close(self, app=None):
+        "Stop the periodic flush and write out any remaining heartbeats"
+        self._flush_task.cancel()
+        await self.flush()
+
+
+def _not_found_response():
+    return DBResponse(response_code=404, body={"msg": "could not find row"})
+
+
+def _heartbeat_response():
+    return DBResponse(response_code=200, body=json.dumps({"wait_time_in_seconds": WAIT_TIME}))
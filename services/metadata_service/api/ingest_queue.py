@@ -0,0 +1,120 @@
+import asyncio
+from typing import Dict, List, Tuple
+
+import psycopg2
+import psycopg2.extras
+
+from services.data.metrics import INGEST_BATCH_SIZE, INGEST_QUEUE_DEPTH
+from services.utils import logging
+
+
+class IngestQueue(object):
+    """
+    Group commit of inserts from concurrent requests.
+
+    Insert statements are queued per table. A batch is written once the window has passed since its
+    first statement was queued, or as soon as it holds max_batch_size statements. All statements of a
+    batch run on a single pooled connection and are committed in one transaction. Each statement runs
+    within a savepoint, so that a statement that fails only fails the request it belongs to.
+
+    Requests wait until their batch has been committed, and receive the rows returned by their own statement.
+
+    Parameters
+    ----------
+    db : AsyncPostgresDB
+        initialized database adapter instance
+    window : float
+        seconds to collect statements for before committing them
+    max_batch_size : int
+        maximum number of statements committed together
+    """
+
+    def __init__(self, db, window: float, max_batch_size: int = 100):
+        self.db = db
+        self.window = window
+        self.max_batch_size = max(1, max_batch_size)
+        self.logger = logging.getLogger("IngestQueue")
+
+        self.loop = asyncio.get_event_loop()
+        self._batches: Dict[str, List[Tuple]] = {}
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+        self._writes = set()
+
+    async def execute(self, table_name: str, sql: str, values) -> List:
+        """
+        Queue an INSERT ... RETURNING statement for the table.
+
+        Returns the rows returned by the statement once its batch has been committed,
+        or raises the error the statement failed with.
+        """
+        future = self.loop.create_future()
+        batch = self._batches.setdefault(table_name, [])
+        batch.append((sql, values, future))
+        INGEST_QUEUE_DEPTH.labels(self.db.name, table_name).inc()
+
+        if len(batch) >= self.max_batch_size:
+            self._flush(table_name)
+        elif len(batch) == 1:
+            self._timers[table_name] = self.loop.call_later(self.window, self._flush, table_name)
+        return await future
+
+    def _flush(self, table_name: str):
+        "Start writing the queued batch of the table"
+        timer = self._timers.pop(table_name, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self._batches.pop(table_name, None)
+        if not batch:
+            return
+        INGEST_QUEUE_DEPTH.labels(self.db.name, table_name).dec(len(batch))
+        INGEST_BATCH_SIZE.labels(self.db.name, table_name).observe(len(batch))
+
+        write = self.loop.create_task(self._write(batch))
+        self._writes.add(write)
+        write.add_done_callback(self._writes.discard)
+
+    async def _write(self, batch: List[Tuple]):
+        results = []
+        try:
+            with (
+                await self.db.pool.cursor(
+                    cursor_factory=psycopg2.extras.DictCursor
+                )
+            ) as cur:
+                await cur.execute("BEGIN")
+                try:
+                    for sql, values, _ in batch:
+                        await cur.execute("SAVEPOINT ingest")
+                        try:
+                            await cur.execute(sql, values)
+                            results.append((await cur.fetchall(), None))
+                            await cur.execute("RELEASE SAVEPOINT ingest")
+                        except psycopg2.DatabaseError as error:
+                            await cur.execute("ROLLBACK TO SAVEPOINT ingest")
+                            results.append((None, error))
+                    await cur.execute("COMMIT")
+                except BaseException:
+                    await cur.execute("ROLLBACK")
+                    raise
+                finally:
+                    cur.close()
+        except Exception as error:
+            # Nothing has been committed, fail all requests of the batch
+            self.logger.exception("Writing a batch of {} inserts failed".format(len(batch)))
+            results = [(None, error)] * len(batch)
+
+        for (rows, error), (_, _, future) in zip(results, batch):
+            if future.done():
+                # The request has been cancelled in the meantime
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(rows)
+
+    async def close(self, app=None):
+        "Write out all queued batches and wait for them to be committed"
+        for table_name in list(self._batches):
+            self._flush(table_name)
+        if self._writes:
+            await asyncio.gather(*self._writes, return_exceptions=True)
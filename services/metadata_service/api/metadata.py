@@ -2,7 +2,9 @@ from aiohttp import web
 import json
 from services.utils import read_body
 from services.metadata_service.api.utils import format_response, \
-    handle_exceptions
+    handle_exceptions, stream_json_response, STREAM_RESPONSES, get_since, \
+    new_change_token, change_token_headers, list_response, \
+    invalid_change_token_response, InvalidChangeToken
 import asyncio
 from services.data.postgres_async_db import AsyncPostgresDB
 
@@ -96,19 +98,36 @@ class MetadataApi(object):
           description: "run_number"
           required: true
           type: "string"
+        - name: "since"
+          in: "query"
+          description: "change token of a previous response, to only get what has been added or updated since"
+          required: false
+          type: "integer"
         produces:
         - text/plain
         responses:
             "200":
-                description: successful operation
+                description: successful operation, with a change token in the METADATA_CHANGE_TOKEN header
+            "400":
+                description: invalid change token
             "405":
                 description: invalid HTTP Method
         """
         flow_name = request.match_info.get("flow_id")
         run_number = request.match_info.get("run_number")
-        return await self._async_table.get_metadata_in_runs(
-            flow_name, run_number
-        )
+        try:
+            since = get_since(request)
+        except InvalidChangeToken as error:
+            return invalid_change_token_response(error)
+
+        change_token = new_change_token()
+        if STREAM_RESPONSES:
+            return await stream_json_response(
+                request, self._async_table.stream_metadata_in_runs(flow_name, run_number, since=since),
+                headers=change_token_headers(change_token))
+        return list_response(await self._async_table.get_metadata_in_runs(
+            flow_name, run_number, since=since
+        ), change_token)
 
     async def create_metadata(self, request):
         """
@@ -172,7 +191,6 @@ class MetadataApi(object):
         task_id = request.match_info.get("task_id")
 
         body = await read_body(request.content)
-        count = 0
         try:
             run_number, run_id = await self._db.get_run_ids(flow_name, run_number)
             task_id, task_name = await self._db.get_task_ids(flow_name, run_number,
@@ -181,8 +199,9 @@ class MetadataApi(object):
             return web.Response(status=400, body=json.dumps(
                 {"message": "need to register run_id and task_id first"}))
 
+        metadata = []
         for datum in body:
-            values = {
+            metadata.append({
                 "flow_id": flow_name,
                 "run_number": run_number,
                 "run_id": run_id,
@@ -195,10 +214,10 @@ class MetadataApi(object):
                 "user_name": datum.get("user_name"),
                 "tags": datum.get("tags"),
                 "system_tags": datum.get("system_tags"),
-            }
-            metadata_response = await self._async_table.add_metadata(**values)
-            if metadata_response.response_code == 200:
-                count = count + 1
+            })
+
+        metadata_responses = await self._async_table.add_metadata_many(metadata)
+        count = sum(1 for response in metadata_responses if response.response_code == 200)
 
         result = {"metadata_created": count}
 
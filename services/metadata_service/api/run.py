@@ -2,7 +2,8 @@ import asyncio
 from services.data.models import RunRow
 from services.utils import has_heartbeat_capable_version_tag, read_body
 from services.metadata_service.api.utils import format_response, \
-    handle_exceptions
+    handle_exceptions, get_since, new_change_token, list_response, \
+    invalid_change_token_response, InvalidChangeToken
 from services.data.postgres_async_db import AsyncPostgresDB
 
 
@@ -10,7 +11,7 @@ class RunApi(object):
     _run_table = None
     lock = asyncio.Lock()
 
-    def __init__(self, app):
+    def __init__(self, app, heartbeat_aggregator=None):
         app.router.add_route("GET", "/flows/{flow_id}/runs", self.get_all_runs)
         app.router.add_route(
             "GET", "/flows/{flow_id}/runs/{run_number}", self.get_run)
@@ -19,6 +20,7 @@ class RunApi(object):
                              "/flows/{flow_id}/runs/{run_number}/heartbeat",
                              self.runs_heartbeat)
         self._async_table = AsyncPostgresDB.get_instance().run_table_postgres
+        self._heartbeat_aggregator = heartbeat_aggregator
 
     @format_response
     @handle_exceptions
@@ -67,16 +69,29 @@ class RunApi(object):
           description: "flow_id"
           required: true
           type: "string"
+        - name: "since"
+          in: "query"
+          description: "change token of a previous response, to only get what has been added or updated since"
+          required: false
+          type: "integer"
         produces:
         - text/plain
         responses:
             "200":
-                description: Returned all runs of specified flow
+                description: Returned all runs of specified flow, with a change token in the METADATA_CHANGE_TOKEN header
+            "400":
+                description: invalid change token
             "405":
                 description: invalid HTTP Method
         """
         flow_name = request.match_info.get("flow_id")
-        return await self._async_table.get_all_runs(flow_name)
+        try:
+            since = get_since(request)
+        except InvalidChangeToken as error:
+            return invalid_change_token_response(error)
+
+        change_token = new_change_token()
+        return list_response(await self._async_table.get_all_runs(flow_name, since=since), change_token)
 
     @format_response
     @handle_exceptions
@@ -173,4 +188,6 @@ class RunApi(object):
         """
         flow_name = request.match_info.get("flow_id")
         run_number = request.match_info.get("run_number")
+        if self._heartbeat_aggregator:
+            return await self._heartbeat_aggregator.run_heartbeat(flow_name, run_number)
         return await self._async_table.update_heartbeat(flow_name, run_number)
@@ -1,8 +1,11 @@
 from services.data import TaskRow
+from services.data.db_utils import DBResponse
 from services.data.postgres_async_db import AsyncPostgresDB
 from services.utils import has_heartbeat_capable_version_tag, read_body
 from services.metadata_service.api.utils import format_response, \
-    handle_exceptions
+    handle_exceptions, stream_json_response, STREAM_RESPONSES, get_since, \
+    new_change_token, change_token_headers, list_response, \
+    invalid_change_token_response, InvalidChangeToken
 import json
 from aiohttp import web
 import asyncio
@@ -12,7 +15,7 @@ class TaskApi(object):
     _task_table = None
     lock = asyncio.Lock()
 
-    def __init__(self, app):
+    def __init__(self, app, heartbeat_aggregator=None):
         app.router.add_route(
             "GET",
             "/flows/{flow_id}/runs/{run_number}/steps/{step_name}/tasks",
@@ -28,12 +31,18 @@ class TaskApi(object):
             "/flows/{flow_id}/runs/{run_number}/steps/{step_name}/task",
             self.create_task,
         )
+        app.router.add_route(
+            "POST",
+            "/flows/{flow_id}/runs/{run_number}/steps/{step_name}/tasks",
+            self.create_tasks,
+        )
         app.router.add_route("POST",
                              "/flows/{flow_id}/runs/{run_number}/steps/{step_name}/tasks/{task_id}/heartbeat",
                              self.tasks_heartbeat)
         self._async_table = AsyncPostgresDB.get_instance().task_table_postgres
         self._async_run_table = AsyncPostgresDB.get_instance().run_table_postgres
         self._db = AsyncPostgresDB.get_instance()
+        self._heartbeat_aggregator = heartbeat_aggregator
 
     @format_response
     @handle_exceptions
@@ -59,19 +68,36 @@ class TaskApi(object):
           description: "step_name"
           required: true
           type: "string"
+        - name: "since"
+          in: "query"
+          description: "change token of a previous response, to only get what has been added or updated since"
+          required: false
+          type: "integer"
         produces:
         - text/plain
         responses:
             "200":
-                description: successful operation. Return tasks
+                description: successful operation. Return tasks, with a change token in the METADATA_CHANGE_TOKEN header
+            "400":
+                description: invalid change token
             "405":
                 description: invalid HTTP Method
         """
         flow_name = request.match_info.get("flow_id")
         run_number = request.match_info.get("run_number")
         step_name = request.match_info.get("step_name")
+        try:
+            since = get_since(request)
+        except InvalidChangeToken as error:
+            return invalid_change_token_response(error)
 
-        return await self._async_table.get_tasks(flow_name, run_number, step_name)
+        change_token = new_change_token()
+        if STREAM_RESPONSES:
+            return await stream_json_response(
+                request, self._async_table.stream_tasks(flow_name, run_number, step_name, since=since),
+                headers=change_token_headers(change_token))
+        return list_response(await self._async_table.get_tasks(flow_name, run_number, step_name, since=since),
+                             change_token)
 
     @format_response
     @handle_exceptions
@@ -200,6 +226,92 @@ class TaskApi(object):
             await self._async_run_table.update_heartbeat(flow_id, run_number)
         return result
 
+    @format_response
+    @handle_exceptions
+    async def create_tasks(self, request):
+        """
+        ---
+        description: Register multiple tasks for a step at once, e.g. for the splits of a foreach.
+        tags:
+        - Tasks
+        parameters:
+        - name: "flow_id"
+          in: "path"
+          description: "flow_id"
+          required: true
+          type: "string"
+        - name: "run_number"
+          in: "path"
+          description: "run_number"
+          required: true
+          type: "string"
+        - name: "step_name"
+          in: "path"
+          description: "step_name"
+          required: true
+          type: "string"
+        - name: "body"
+          in: "body"
+          description: "body"
+          required: true
+          schema:
+            type: array
+            items:
+                type: object
+                properties:
+                    user_name:
+                        type: string
+                    tags:
+                        type: object
+                    system_tags:
+                        type: object
+                    task_id:
+                        type: string
+        produces:
+        - 'text/plain'
+        responses:
+            "200":
+                description: successful operation. Return newly registered tasks in the order they were given
+            "400":
+                description: invalid HTTP Request
+            "405":
+                description: invalid HTTP Method
+            "409":
+                description: a task already exists, none of the tasks were registered
+        """
+        flow_id = request.match_info.get("flow_id")
+        run_number = request.match_info.get("run_number")
+        step_name = request.match_info.get("step_name")
+        body = await read_body(request.content)
+
+        for task in body:
+            task_name = task.get("task_id")
+            if task_name and task_name.isnumeric():
+                return DBResponse(response_code=400,
+                                  body={"message": "provided task_name may not be a numeric"})
+
+        client_supports_heartbeats = all(
+            has_heartbeat_capable_version_tag(task.get("system_tags")) for task in body)
+
+        run_number, run_id = await self._db.get_run_ids(flow_id, run_number)
+
+        tasks = [
+            TaskRow(
+                flow_id=flow_id,
+                run_number=run_number,
+                run_id=run_id,
+                step_name=step_name,
+                task_name=task.get("task_id"),
+                user_name=task.get("user_name"),
+                tags=task.get("tags"),
+                system_tags=task.get("system_tags"),
+            ) for task in body
+        ]
+        result = await self._async_table.add_tasks(tasks, fill_heartbeat=client_supports_heartbeats)
+        if client_supports_heartbeats and result.response_code == 200 and tasks:
+            await self._async_run_table.update_heartbeat(flow_id, run_number)
+        return result
+
     @format_response
     @handle_exceptions
     async def tasks_heartbeat(self, request):
@@ -249,6 +361,8 @@ class TaskApi(object):
         run_number = request.match_info.get("run_number")
         step_name = request.match_info.get("step_name")
         task_id = request.match_info.get("task_id")
+        if self._heartbeat_aggregator:
+            return await self._heartbeat_aggregator.task_heartbeat(flow_name, run_number, step_name, task_id)
         await self._async_run_table.update_heartbeat(flow_name, run_number)
         return await self._async_table.update_heartbeat(flow_name,
                                                         run_number, step_name,
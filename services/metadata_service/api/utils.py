@@ -1,12 +1,16 @@
 import json
+import os
+import time
 from functools import wraps
+from typing import AsyncIterator, Dict, List, Optional
 
 import pkg_resources
 import collections
 from aiohttp import web
 from multidict import MultiDict
 
-from services.utils import get_traceback_str
+from services.data.db_utils import aiopg_exception_handling
+from services.utils import get_traceback_str, logging
 
 version = pkg_resources.require("metadata_service")[0].version
 METADATA_SERVICE_VERSION = version
@@ -14,6 +18,58 @@ METADATA_SERVICE_HEADER = 'METADATA_SERVICE_VERSION'
 
 ServiceResponse = collections.namedtuple("ServiceResponse", "response_code body")
 
+# Stream the tasks, metadata and artifacts of a run from server-side cursors, instead of building
+# the whole response in memory. Enable with env variable `MF_METADATA_STREAM_RESPONSES=1`
+STREAM_RESPONSES = os.environ.get("MF_METADATA_STREAM_RESPONSES", "0") == "1"
+
+# List responses carry a change token in this header, to be passed as `since` to fetch only what changed afterwards.
+CHANGE_TOKEN_HEADER = 'METADATA_CHANGE_TOKEN'
+
+# Rows are timestamped when a request is received, and may only become visible when committed up to a few
+# seconds later (group commits, batched heartbeats, replica lag). Change tokens lag behind by this many
+# milliseconds, so that rows committed late are still returned by the next poll.
+CHANGE_TOKEN_GRACE_MS = int(os.environ.get("MF_METADATA_CHANGE_TOKEN_GRACE_MS", 5000))
+
+
+class InvalidChangeToken(ValueError):
+    "Raised for a `since` query parameter that is not a change token"
+
+
+def get_since(request) -> Optional[int]:
+    """
+    The change token of the `since` query parameter, an epoch in milliseconds, or None if not given.
+    Raises InvalidChangeToken if it is not a non-negative integer.
+    """
+    since = request.query.get("since")
+    if since is None or since == "":
+        return None
+    try:
+        since = int(since)
+    except ValueError:
+        since = -1
+    if since < 0:
+        raise InvalidChangeToken("since must be a change token, an epoch in milliseconds")
+    return since
+
+
+def new_change_token() -> int:
+    """
+    Change token for a list response, to be taken before querying the rows.
+    Every row that is not in the response has been timestamped at or after the token.
+    """
+    return int(round(time.time() * 1000)) - CHANGE_TOKEN_GRACE_MS
+
+
+def change_token_headers(change_token: int) -> Dict[str, str]:
+    return {CHANGE_TOKEN_HEADER: str(change_token)}
+
+
+def invalid_change_token_response(error: InvalidChangeToken) -> web.Response:
+    return web.Response(status=400,
+                        body=json.dumps({"message": str(error)}),
+                        headers=MultiDict(
+                            {METADATA_SERVICE_HEADER: METADATA_SERVICE_VERSION}))
+
 
 def format_response(func):
     """handle formatting"""
@@ -21,6 +77,9 @@ def format_response(func):
     @wraps(func)
     async def wrapper(*args, **kwargs):
         db_response = await func(*args, **kwargs)
+        if isinstance(db_response, web.StreamResponse):
+            # eg. a streamed response, which has been written already
+            return db_response
         return web.Response(status=db_response.response_code,
                             body=json.dumps(db_response.body),
                             headers=MultiDict(
@@ -29,6 +88,69 @@ def format_response(func):
     return wrapper
 
 
+def list_response(db_response, change_token: int) -> web.Response:
+    "Response for a list of rows, along with the change token to fetch later changes with"
+    headers = {METADATA_SERVICE_HEADER: METADATA_SERVICE_VERSION}
+    if db_response.response_code == 200:
+        headers.update(change_token_headers(change_token))
+    return web.Response(status=db_response.response_code,
+                        body=json.dumps(db_response.body),
+                        headers=MultiDict(headers))
+
+
+async def stream_json_response(request, chunks: AsyncIterator[List], headers: Dict[str, str] = None) -> web.StreamResponse:
+    """
+    Respond with a JSON array of the items yielded in chunks, writing each chunk as soon as it has been read.
+    Memory use is bounded by the size of a chunk instead of the size of the whole response.
+    Headers are only added to successful responses.
+
+    Errors while reading the first chunk result in an error response, as with format_response.
+    Once the response has started, the status can not be changed anymore, so later errors
+    abort the response instead, leaving it incomplete.
+    """
+    try:
+        try:
+            chunk = await chunks.__anext__()
+        except StopAsyncIteration:
+            chunk = []
+        except Exception as error:
+            db_response = aiopg_exception_handling(error)
+            return web.Response(status=db_response.response_code,
+                                body=json.dumps(db_response.body),
+                                headers=MultiDict(
+                                    {METADATA_SERVICE_HEADER: METADATA_SERVICE_VERSION}))
+
+        response = web.StreamResponse(status=200,
+                                      headers=MultiDict(
+                                          {"Content-Type": "application/json",
+                                           METADATA_SERVICE_HEADER: METADATA_SERVICE_VERSION,
+                                           **(headers or {})}))
+        response.enable_chunked_encoding()
+        await response.prepare(request)
+        try:
+            await response.write(b"[")
+            separator = b""
+            while True:
+                if chunk:
+                    # items of the chunk without the enclosing brackets
+                    await response.write(separator + json.dumps(chunk)[1:-1].encode("utf-8"))
+                    separator = b","
+                try:
+                    chunk = await chunks.__anext__()
+                except StopAsyncIteration:
+                    break
+            await response.write(b"]")
+            await response.write_eof()
+        except Exception:
+            logging.getLogger("StreamResponse").exception("Streaming response to {} failed".format(request.path))
+            # Close the connection before the end of the chunked body, so that clients can tell it is incomplete
+            if request.transport is not None:
+                request.transport.close()
+        return response
+    finally:
+        await chunks.aclose()
+
+
 def web_response(status: int, body):
     return web.Response(status=status,
                         body=json.dumps(body),
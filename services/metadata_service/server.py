@@ -1,5 +1,7 @@
 import asyncio
+import functools
 import os
+import signal
 
 from aiohttp import web
 from aiohttp_swagger import *
@@ -13,33 +15,104 @@ from .api.artifact import ArtificatsApi
 from .api.admin import AuthApi
 
 from .api.metadata import MetadataApi
+from .api.heartbeat_aggregator import HeartbeatAggregator
+from .api.ingest_queue import IngestQueue
+from .workers import Supervisor, Worker, worker_pool_max
+from services.data.metrics import MULTIPROCESS_DIR, sample_pools_periodically
 from services.data.postgres_async_db import AsyncPostgresDB
-from services.utils import DBConfiguration
+from services.data.service_configs import heartbeat_flush_interval_seconds, \
+    ingest_batch_window_ms, ingest_max_batch_size, metadata_workers, \
+    metadata_db_connection_budget, worker_shutdown_timeout_seconds
+from services.utils import DBConfiguration, logging
 
+# Seconds between checks for upcoming table partitions
+PARTITION_MAINTENANCE_INTERVAL_SECONDS = 24 * 60 * 60
 
-def app(loop=None, db_conf: DBConfiguration = None, middlewares=None):
+
+def app(loop=None, db_conf: DBConfiguration = None, middlewares=None, worker: Worker = None):
 
     loop = loop or asyncio.get_event_loop()
+    if worker is not None:
+        middlewares = list(middlewares or []) + [worker.middleware]
     app = web.Application(loop=loop, middlewares=middlewares)
     async_db = AsyncPostgresDB()
     loop.run_until_complete(async_db._init(db_conf))
+    heartbeat_aggregator = None
+    if heartbeat_flush_interval_seconds > 0:
+        heartbeat_aggregator = HeartbeatAggregator(async_db, heartbeat_flush_interval_seconds)
+        app.on_cleanup.append(heartbeat_aggregator.close)
+    if ingest_batch_window_ms > 0:
+        async_db.ingest_queue = IngestQueue(async_db, ingest_batch_window_ms / 1000, ingest_max_batch_size)
+        app.on_cleanup.append(async_db.ingest_queue.close)
+    partition_maintenance = loop.create_task(create_partitions_periodically(async_db))
+
+    async def stop_partition_maintenance(app):
+        partition_maintenance.cancel()
+    app.on_cleanup.append(stop_partition_maintenance)
+    if MULTIPROCESS_DIR:
+        # Pool metrics of all workers are reported from samples, as a scrape is answered by a single worker
+        pool_sampling = loop.create_task(sample_pools_periodically())
+
+        async def stop_pool_sampling(app):
+            pool_sampling.cancel()
+        app.on_cleanup.append(stop_pool_sampling)
     FlowApi(app)
-    RunApi(app)
+    RunApi(app, heartbeat_aggregator)
     StepApi(app)
-    TaskApi(app)
+    TaskApi(app, heartbeat_aggregator)
     MetadataApi(app)
     ArtificatsApi(app)
-    AuthApi(app)
+    AuthApi(app, worker)
     setup_swagger(app)
     return app
 
 
+async def create_partitions_periodically(db, interval: float = PARTITION_MAINTENANCE_INTERVAL_SECONDS):
+    "Keep creating partitions for upcoming months while the service is running"
+    logger = logging.getLogger("PartitionMaintenance")
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await db.create_partitions()
+        except Exception:
+            logger.exception("Exception when creating partitions")
+
+
+def serve_worker(host: str, port: int, worker: Worker):
+    "Serve requests in a worker forked by the supervisor, until the worker receives SIGTERM"
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    db_conf = DBConfiguration()
+    db_conf.pool_max = worker_pool_max(metadata_db_connection_budget, worker.workers, db_conf.pool_max)
+    db_conf.pool_min = min(db_conf.pool_min, db_conf.pool_max)
+
+    runner = web.AppRunner(app(loop, db_conf, worker=worker), shutdown_timeout=worker_shutdown_timeout_seconds)
+    loop.run_until_complete(runner.setup())
+    site = web.TCPSite(runner, host, int(port), reuse_port=True, shutdown_timeout=worker_shutdown_timeout_seconds)
+    loop.run_until_complete(site.start())
+    worker.started()
+    print("worker {} serving on {}".format(worker.index, site.name))
+
+    stopped = loop.create_future()
+    loop.add_signal_handler(signal.SIGTERM, lambda: stopped.done() or stopped.set_result(None))
+    reporting = loop.create_task(worker.report_periodically())
+    loop.run_until_complete(stopped)
+
+    # Stops accepting connections, waits for requests in flight and runs the cleanup of the app
+    reporting.cancel()
+    loop.run_until_complete(runner.cleanup())
+
+
 def main():
+    port = os.environ.get("MF_METADATA_PORT", 8080)
+    host = str(os.environ.get("MF_METADATA_HOST", "0.0.0.0"))
+    if metadata_workers > 1:
+        Supervisor(metadata_workers, functools.partial(serve_worker, host, port)).run()
+        return
+
     loop = asyncio.get_event_loop()
     the_app = app(loop, DBConfiguration())
     handler = the_app.make_handler()
-    port = os.environ.get("MF_METADATA_PORT", 8080)
-    host = str(os.environ.get("MF_METADATA_HOST", "0.0.0.0"))
     f = loop.create_server(handler, host, port)
 
     srv = loop.run_until_complete(f)
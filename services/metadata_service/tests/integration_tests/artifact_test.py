@@ -4,8 +4,15 @@ from .utils import (
     add_flow, add_run, add_step,
     add_task, add_artifact
 )
+from services.data import postgres_async_db
+from services.metadata_service.api import artifact as artifact_api
+from services.metadata_service.api import utils as api_utils
+import asyncio
 import pytest
 import json
+import time
+
+import psycopg2.errors
 pytestmark = [pytest.mark.integration_tests]
 
 # Fixtures begin
@@ -135,6 +142,66 @@ async def test_artifact_post(cli, db):
     )
 
 
+async def test_artifact_post_partial_conflicts(cli, db):
+    _flow = (await add_flow(db)).body
+    _run = (await add_run(db, flow_id=_flow["flow_id"])).body
+    _step = (await add_step(db, flow_id=_run["flow_id"], run_number=_run["run_number"])).body
+    _task = (await add_task(db, flow_id=_step["flow_id"], run_number=_step["run_number"], step_name=_step["step_name"])).body
+
+    path = "/flows/{flow_id}/runs/{run_number}/steps/{step_name}/tasks/{task_id}/artifact".format(**_task)
+
+    await assert_api_post_response(cli, path=path, payload=[ARTIFACT_A], status=200,
+                                   expected_body={"artifacts_created": 1})
+
+    # Only the rows that do not conflict with existing ones, or with earlier rows of the same batch, should be counted.
+    await assert_api_post_response(
+        cli,
+        path=path,
+        payload=[ARTIFACT_A, ARTIFACT_B, ARTIFACT_B],
+        status=200,
+        expected_body={"artifacts_created": 1}
+    )
+
+    responses = await db.artifact_table_postgres.add_artifacts([
+        dict(ARTIFACT_A, flow_id=_task["flow_id"], run_number=_task["run_number"], run_id=None,
+             step_name=_task["step_name"], task_id=_task["task_id"], task_name=None, attempt_id=attempt_id)
+        for attempt_id in [0, 1]
+    ])
+    assert [r.response_code for r in responses] == [409, 200]
+    compare_partial(responses[1].body, {"name": ARTIFACT_A["name"], "attempt_id": 1})
+
+
+async def test_artifacts_get_across_partitions(cli, db):
+    _flow = (await add_flow(db)).body
+    _run = (await add_run(db, flow_id=_flow["flow_id"])).body
+    _step = (await add_step(db, flow_id=_run["flow_id"], run_number=_run["run_number"])).body
+    _task = (await add_task(db, flow_id=_step["flow_id"], run_number=_step["run_number"], step_name=_step["step_name"])).body
+
+    path = "/flows/{flow_id}/runs/{run_number}/steps/{step_name}/tasks/{task_id}/artifact".format(**_task)
+
+    await assert_api_post_response(cli, path=path, payload=[ARTIFACT_A], status=200,
+                                   expected_body={"artifacts_created": 1})
+
+    # Move the artifact to the partition of two months from now, the primary key of the current one does not see it
+    future_ts_epoch = int(round(time.time() * 1000)) + 60 * 24 * 60 * 60 * 1000
+    with (await db.pool.cursor()) as cur:
+        await cur.execute("UPDATE {} SET ts_epoch = %s WHERE task_id = %s".format(db.artifact_table_postgres.table_name),
+                          [future_ts_epoch, _task["task_id"]])
+
+    await assert_api_post_response(cli, path=path, payload=[ARTIFACT_A, ARTIFACT_B], status=200,
+                                   expected_body={"artifacts_created": 2})
+
+    # The latest attempt lists the artifact stored in both partitions once, the copy with the earliest ts_epoch
+    for artifacts_path in ["/flows/{flow_id}/runs/{run_number}/steps/{step_name}/tasks/{task_id}/artifacts",
+                           "/flows/{flow_id}/runs/{run_number}/steps/{step_name}/artifacts",
+                           "/flows/{flow_id}/runs/{run_number}/artifacts"]:
+        response = await cli.get(artifacts_path.format(**_task))
+        assert response.status == 200
+        artifacts = json.loads(await response.text())
+        assert sorted((artifact["name"], artifact["ts_epoch"] < future_ts_epoch) for artifact in artifacts) == \
+            [(ARTIFACT_A["name"], True), (ARTIFACT_B["name"], True)]
+
+
 async def test_run_artifacts_get(cli, db):
     # create a flow, run, step and task for the test
     _flow = (await add_flow(db, "TestFlow", "test_user-1", ["a_tag", "b_tag"], ["runtime:test"])).body
@@ -207,6 +274,143 @@ async def test_task_artifacts_get(cli, db):
     await assert_api_get_response(cli, "/flows/{flow_id}/runs/{run_number}/steps/{step_name}/tasks/1234/artifacts".format(**_task), status=200, data=[])
 
 
+async def test_artifacts_get_latest_attempt(cli, db):
+    # create a flow, run, step and two tasks for the test
+    _flow = (await add_flow(db, "TestFlow", "test_user-1", ["a_tag", "b_tag"], ["runtime:test"])).body
+    _run = (await add_run(db, flow_id=_flow["flow_id"])).body
+    _step = (await add_step(db, flow_id=_run["flow_id"], run_number=_run["run_number"], step_name="first_step")).body
+    _task = (await add_task(db, flow_id=_step["flow_id"], run_number=_step["run_number"], step_name=_step["step_name"])).body
+    _other_task = (await add_task(db, flow_id=_step["flow_id"], run_number=_step["run_number"], step_name=_step["step_name"])).body
+
+    # the first task has artifacts for attempts 0 and 1, the other task only for attempt 0
+    for attempt_id in [0, 1]:
+        await add_artifact(db, flow_id=_task["flow_id"], run_number=_task["run_number"], step_name=_task["step_name"],
+                           task_id=_task["task_id"], artifact=dict(ARTIFACT_A, attempt_id=attempt_id))
+    await add_artifact(db, flow_id=_task["flow_id"], run_number=_task["run_number"], step_name=_task["step_name"],
+                       task_id=_task["task_id"], artifact=dict(ARTIFACT_B, attempt_id=1))
+    _other_artifact = (await add_artifact(db, flow_id=_other_task["flow_id"], run_number=_other_task["run_number"], step_name=_other_task["step_name"],
+                                          task_id=_other_task["task_id"], artifact=ARTIFACT_A)).body
+
+    async def get_latest_attempts(path):
+        response = await cli.get(path)
+        assert response.status == 200
+        return sorted((a["task_id"], a["name"], a["attempt_id"]) for a in json.loads(await response.text()))
+
+    expected = [
+        (_task["task_id"], ARTIFACT_A["name"], 1),
+        (_task["task_id"], ARTIFACT_B["name"], 1),
+        (_other_task["task_id"], ARTIFACT_A["name"], 0)
+    ]
+
+    # only artifacts of the latest attempt of each task should be returned
+    for path in ["/flows/{flow_id}/runs/{run_number}/artifacts", "/flows/{flow_id}/runs/{run_number}/steps/{step_name}/artifacts"]:
+        assert await get_latest_attempts(path.format(**_task)) == expected
+
+    assert await get_latest_attempts(
+        "/flows/{flow_id}/runs/{run_number}/steps/{step_name}/tasks/{task_id}/artifacts".format(**_task)) == expected[:2]
+
+    await assert_api_get_response(cli, "/flows/{flow_id}/runs/{run_number}/steps/{step_name}/tasks/{task_id}/artifacts".format(**_other_task), data=[_other_artifact])
+
+
+async def test_run_artifacts_get_streamed(cli, db, monkeypatch):
+    monkeypatch.setattr(artifact_api, "STREAM_RESPONSES", True)
+    monkeypatch.setattr(postgres_async_db, "STREAM_CHUNK_SIZE", 2)
+
+    _flow = (await add_flow(db, "TestFlow", "test_user-1", ["a_tag", "b_tag"], ["runtime:test"])).body
+    _run = (await add_run(db, flow_id=_flow["flow_id"])).body
+    _step = (await add_step(db, flow_id=_run["flow_id"], run_number=_run["run_number"], step_name="first_step")).body
+
+    # three tasks with an artifact for attempts 0 and 1 each
+    expected = []
+    for _ in range(3):
+        _task = (await add_task(db, flow_id=_step["flow_id"], run_number=_step["run_number"], step_name=_step["step_name"])).body
+        for attempt_id in [0, 1]:
+            await add_artifact(db, flow_id=_task["flow_id"], run_number=_task["run_number"], step_name=_task["step_name"],
+                               task_id=_task["task_id"], artifact=dict(ARTIFACT_A, attempt_id=attempt_id))
+        expected.append((_task["task_id"], ARTIFACT_A["name"], 1))
+
+    # only artifacts of the latest attempts are streamed, as a single JSON array
+    response = await cli.get("/flows/{flow_id}/runs/{run_number}/artifacts".format(**_step))
+    assert response.status == 200
+    assert response.headers["Transfer-Encoding"] == "chunked"
+    assert sorted((a["task_id"], a["name"], a["attempt_id"]) for a in json.loads(await response.text())) == expected
+
+    await assert_api_get_response(cli, "/flows/{flow_id}/runs/1234/artifacts".format(**_step), status=200, data=[])
+
+
+async def test_run_artifacts_get_since(cli, db, monkeypatch):
+    monkeypatch.setattr(api_utils, "CHANGE_TOKEN_GRACE_MS", 0)
+
+    _flow = (await add_flow(db, "TestFlow", "test_user-1", ["a_tag", "b_tag"], ["runtime:test"])).body
+    _run = (await add_run(db, flow_id=_flow["flow_id"])).body
+    _step = (await add_step(db, flow_id=_run["flow_id"], run_number=_run["run_number"], step_name="first_step")).body
+    _task = (await add_task(db, flow_id=_step["flow_id"], run_number=_step["run_number"], step_name=_step["step_name"])).body
+    _other_task = (await add_task(db, flow_id=_step["flow_id"], run_number=_step["run_number"], step_name=_step["step_name"])).body
+
+    for task in [_task, _other_task]:
+        await add_artifact(db, flow_id=task["flow_id"], run_number=task["run_number"], step_name=task["step_name"],
+                           task_id=task["task_id"], artifact=dict(ARTIFACT_A, attempt_id=0))
+    await asyncio.sleep(0.01)
+
+    path = "/flows/{flow_id}/runs/{run_number}/artifacts".format(**_run)
+    response = await cli.get(path)
+    assert response.status == 200
+    change_token = int(response.headers["METADATA_CHANGE_TOKEN"])
+
+    async def get_changes():
+        response = await cli.get(path, params={"since": change_token})
+        assert response.status == 200
+        return sorted((a["task_id"], a["name"], a["attempt_id"]) for a in json.loads(await response.text()))
+
+    assert await get_changes() == []
+
+    # a new attempt of the task replaces its artifacts, the other task has not changed
+    for artifact in [ARTIFACT_A, ARTIFACT_B]:
+        await add_artifact(db, flow_id=_task["flow_id"], run_number=_task["run_number"], step_name=_task["step_name"],
+                           task_id=_task["task_id"], artifact=dict(artifact, attempt_id=1))
+    assert await get_changes() == [
+        (_task["task_id"], ARTIFACT_A["name"], 1),
+        (_task["task_id"], ARTIFACT_B["name"], 1)
+    ]
+
+    # the same changes are streamed
+    monkeypatch.setattr(artifact_api, "STREAM_RESPONSES", True)
+    assert len(await get_changes()) == 2
+
+
+async def test_artifact_partitions(cli, db):
+    # create a flow, run, step and task for the test
+    _flow = (await add_flow(db, "TestFlow", "test_user-1", ["a_tag", "b_tag"], ["runtime:test"])).body
+    _run = (await add_run(db, flow_id=_flow["flow_id"])).body
+    _step = (await add_step(db, flow_id=_run["flow_id"], run_number=_run["run_number"], step_name="first_step")).body
+    _task = (await add_task(db, flow_id=_step["flow_id"], run_number=_step["run_number"], step_name=_step["step_name"])).body
+
+    table_name = db.artifact_table_postgres.table_name
+    # partitions for upcoming months already exist, creating them again is a no-op
+    await db.create_partitions()
+
+    # an artifact of two months from now is stored in a partition of its own
+    future_ts_epoch = int(round(time.time() * 1000)) + 60 * 24 * 60 * 60 * 1000
+    insert_sql = """
+        INSERT INTO {} (flow_id, run_number, step_name, task_id, attempt_id, name, location, ds_type, ts_epoch)
+        VALUES (%s, %s, %s, %s, 0, 'future', ' ', ' ', %s)
+        """.format(table_name)
+    values = [_task["flow_id"], _task["run_number"], _task["step_name"], _task["task_id"], future_ts_epoch]
+    with (await db.pool.cursor()) as cur:
+        await cur.execute(insert_sql, values)
+        await cur.execute("SELECT tableoid::regclass::text FROM {} WHERE name = 'future'".format(table_name))
+        partition = (await cur.fetchone())[0]
+        assert partition.startswith(table_name + "_p")
+
+        # primary keys are still enforced within the partition
+        with pytest.raises(psycopg2.errors.UniqueViolation):
+            await cur.execute(insert_sql, values)
+
+    _artifact = (await db.artifact_table_postgres.get_artifact(
+        _task["flow_id"], _task["run_number"], _task["step_name"], _task["task_id"], "future")).body
+    assert _artifact["ts_epoch"] == future_ts_epoch
+
+
 async def test_task_get(cli, db):
     # create flow, run, step and task for test
     _flow = (await add_flow(db, "TestFlow", "test_user-1", ["a_tag", "b_tag"], ["runtime:test"])).body
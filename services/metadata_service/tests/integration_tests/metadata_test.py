@@ -4,6 +4,8 @@ from .utils import (
     add_flow, add_run, add_step,
     add_task, add_metadata
 )
+from services.data import postgres_async_db
+from services.metadata_service.api import metadata as metadata_api
 import pytest
 import json
 pytestmark = [pytest.mark.integration_tests]
@@ -136,6 +138,28 @@ async def test_run_metadata_get(cli, db):
     await assert_api_get_response(cli, "/flows/{flow_id}/runs/1234/metadata".format(**_task), status=200, data=[])
 
 
+async def test_run_metadata_get_streamed(cli, db, monkeypatch):
+    monkeypatch.setattr(metadata_api, "STREAM_RESPONSES", True)
+    monkeypatch.setattr(postgres_async_db, "STREAM_CHUNK_SIZE", 2)
+
+    _flow = (await add_flow(db, "TestFlow", "test_user-1", ["a_tag", "b_tag"], ["runtime:test"])).body
+    _run = (await add_run(db, flow_id=_flow["flow_id"])).body
+    _step = (await add_step(db, flow_id=_run["flow_id"], run_number=_run["run_number"], step_name="first_step")).body
+    _task = (await add_task(db, flow_id=_step["flow_id"], run_number=_step["run_number"], step_name=_step["step_name"])).body
+
+    _metadata = []
+    for index in range(5):
+        _metadata.append((await add_metadata(db, flow_id=_task["flow_id"], run_number=_task["run_number"], step_name=_task["step_name"], task_id=_task["task_id"], metadata=dict(METADATA_A, field_name="field-{}".format(index)))).body)
+
+    # metadata is written in chunks, as a single JSON array
+    response = await cli.get("/flows/{flow_id}/runs/{run_number}/metadata".format(**_task))
+    assert response.status == 200
+    assert response.headers["Transfer-Encoding"] == "chunked"
+    assert sorted(json.loads(await response.text()), key=lambda datum: datum["id"]) == _metadata
+
+    await assert_api_get_response(cli, "/flows/{flow_id}/runs/1234/metadata".format(**_task), status=200, data=[])
+
+
 async def test_task_metadata_get(cli, db):
     # create a flow, run, step and task for the test
     _flow = (await add_flow(db, "TestFlow", "test_user-1", ["a_tag", "b_tag"], ["runtime:test"])).body
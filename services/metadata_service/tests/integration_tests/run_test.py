@@ -1,8 +1,12 @@
 from .utils import (
-    init_app, init_db, clean_db,
+    init_app, init_db, clean_db, get_test_dbconf,
     assert_api_get_response, assert_api_post_response, compare_partial,
-    add_flow, add_run
+    add_flow, add_run, add_step, add_task, add_artifact, add_metadata
 )
+from services.data import postgres_async_db
+from services.data.postgres_async_db import _AsyncPostgresDB
+from services.metadata_service.api import utils as api_utils
+import asyncio
 import pytest
 import json
 pytestmark = [pytest.mark.integration_tests]
@@ -149,6 +153,28 @@ async def test_runs_get(cli, db):
     await assert_api_get_response(cli, "/flows/NonExistentFlow/runs", status=200, data=[])
 
 
+async def test_runs_get_since(cli, db, monkeypatch):
+    monkeypatch.setattr(api_utils, "CHANGE_TOKEN_GRACE_MS", 0)
+
+    _flow = (await add_flow(db, "TestFlow", "test_user-1", ["a_tag", "b_tag"], ["runtime:test"])).body
+    _first_run = (await add_run(db, flow_id=_flow["flow_id"])).body
+    await asyncio.sleep(0.01)
+
+    response = await cli.get("/flows/{flow_id}/runs".format(**_flow))
+    change_token = int(response.headers["METADATA_CHANGE_TOKEN"])
+
+    _second_run = (await add_run(db, flow_id=_flow["flow_id"])).body
+    await assert_api_get_response(cli, "/flows/{flow_id}/runs?since={since}".format(since=change_token, **_flow),
+                                  data=[_second_run])
+
+    # a heartbeat updates the run
+    await assert_api_post_response(cli, path="/flows/{flow_id}/runs/{run_number}/heartbeat".format(**_first_run), status=200)
+    response = await cli.get("/flows/{flow_id}/runs".format(**_flow), params={"since": change_token})
+    assert sorted(run["run_number"] for run in json.loads(await response.text())) == [_first_run["run_number"], _second_run["run_number"]]
+
+    await assert_api_get_response(cli, "/flows/{flow_id}/runs?since=now".format(**_flow), status=400)
+
+
 async def test_run_get(cli, db):
     # create flow for test
     _flow = (await add_flow(db, "TestFlow", "test_user-1", ["a_tag", "b_tag"], ["runtime:test"])).body
@@ -162,3 +188,188 @@ async def test_run_get(cli, db):
     # non-existent flow or run should return 404
     await assert_api_get_response(cli, "/flows/{flow_id}/runs/1234".format(**_run), status=404)
     await assert_api_get_response(cli, "/flows/NonExistentFlow/runs/{run_number}".format(**_run), status=404)
+
+
+async def test_run_ids_cached(cli, db):
+    _flow = (await add_flow(db)).body
+
+    # runs created through the API populate the id cache under both run_number and run_id
+    _run = await assert_api_post_response(
+        cli,
+        path="/flows/{flow_id}/run".format(**_flow),
+        payload={"user_name": "test_user", "run_number": "custom-run-id", "tags": [], "system_tags": []},
+        status=200
+    )
+    _found = (await db.run_table_postgres.get_run(_flow["flow_id"], "custom-run-id", expanded=True)).body
+
+    misses = db.run_ids_cache.misses
+    assert await db.get_run_ids(_flow["flow_id"], "custom-run-id") == (_found["run_number"], "custom-run-id")
+    assert await db.get_run_ids(_flow["flow_id"], _found["run_number"]) == (_found["run_number"], "custom-run-id")
+    assert db.run_ids_cache.misses == misses
+
+    # runs not created through this instance are cached on first lookup
+    _other = (await add_run(db, flow_id=_flow["flow_id"])).body
+    await db.get_run_ids(_flow["flow_id"], _other["run_number"])
+    assert db.run_ids_cache.misses == misses + 1
+    hits = db.run_ids_cache.hits
+    assert await db.get_run_ids(_flow["flow_id"], _other["run_number"]) == (_other["run_number"], None)
+    assert db.run_ids_cache.hits == hits + 1
+
+
+async def test_run_get_prepared(cli, db, monkeypatch):
+    if get_test_dbconf().engine == "asyncpg":
+        pytest.skip("asyncpg prepares all statements by itself")
+    monkeypatch.setattr("services.data.postgres_async_db.DB_PREPARED_STATEMENTS", True)
+    _flow = (await add_flow(db)).body
+    _run = (await add_run(db, flow_id=_flow["flow_id"])).body
+
+    def prepared_statements():
+        prepared = set()
+        for statements in db.run_table_postgres._prepared_statements.values():
+            prepared.update(statements)
+        return prepared
+
+    await assert_api_get_response(cli, "/flows/{flow_id}/runs/{run_number}".format(**_run), data=_run)
+    compiled = len(db.run_table_postgres._query_cache)
+    prepared = prepared_statements()
+    assert len(prepared) > 0
+
+    # repeated requests of the same shape reuse the compiled and prepared query
+    await assert_api_get_response(cli, "/flows/{flow_id}/runs/{run_number}".format(**_run), data=_run)
+    await assert_api_get_response(cli, "/flows/{flow_id}/runs/1234".format(**_run), status=404)
+    assert len(db.run_table_postgres._query_cache) == compiled
+
+    with (await db.pool.cursor()) as cur:
+        await cur.execute("SELECT name FROM pg_prepared_statements")
+        names = set(row[0] for row in await cur.fetchall())
+    # statements are only visible to the connection that prepared them
+    assert names <= prepared_statements()
+
+
+async def test_run_ids_replica_fallback(cli, db):
+    # Simulate a lagging replica with empty copies of the tables in a separate schema.
+    with (await db.pool.cursor()) as cur:
+        await cur.execute("DROP SCHEMA IF EXISTS lagging_replica CASCADE")
+        await cur.execute("CREATE SCHEMA lagging_replica")
+        for table in [db.flow_table_postgres, db.run_table_postgres]:
+            await cur.execute("CREATE TABLE lagging_replica.{0} (LIKE public.{0})".format(table.table_name))
+
+    _flow = (await add_flow(db)).body
+    _run = (await add_run(db, flow_id=_flow["flow_id"])).body
+
+    db_conf = get_test_dbconf()
+    db_conf.replica_dsns = [db_conf.dsn + " options='-c search_path=lagging_replica'"]
+    replica_db = _AsyncPostgresDB("replica_test")
+    try:
+        await replica_db._init(db_conf, create_triggers=False, create_tables=False)
+
+        # list queries are served by the replica
+        flows, _ = await replica_db.flow_table_postgres.find_records()
+        assert flows.body == []
+
+        # lookups that find nothing on the replica fall back to the primary
+        assert await replica_db.get_run_ids(_run["flow_id"], _run["run_number"]) == \
+            await db.get_run_ids(_run["flow_id"], _run["run_number"])
+
+        replica_db.replica_fallback = False
+        replica_db.run_ids_cache.clear()
+        with pytest.raises(KeyError):
+            await replica_db.get_run_ids(_run["flow_id"], _run["run_number"])
+    finally:
+        for pool in [replica_db.pool] + replica_db.replica_pools:
+            pool.close()
+            await pool.wait_closed()
+        with (await db.pool.cursor()) as cur:
+            await cur.execute("DROP SCHEMA lagging_replica CASCADE")
+
+
+async def test_init_skips_table_setup_for_known_schema(cli, db, monkeypatch):
+    setup_calls = []
+
+    async def record_setup(db, table_name, *args, **kwargs):
+        setup_calls.append(table_name)
+
+    for name in ["create_if_missing", "create_partitions", "setup_trigger_notify"]:
+        monkeypatch.setattr(postgres_async_db.PostgresUtils, name, staticmethod(record_setup))
+
+    db_conf = get_test_dbconf()
+    other_db = _AsyncPostgresDB("fingerprint_test")
+    try:
+        # Tables have been set up by the db fixture for the same schema
+        await other_db._init(db_conf, create_triggers=False)
+        assert setup_calls == []
+        fingerprint = postgres_async_db._verified_schemas[db_conf.dsn][0]
+
+        # A changed table definition changes the fingerprint. Existing tables are not created again,
+        # but partitions are still looked after.
+        with (await db.pool.cursor()) as cur:
+            await cur.execute("ALTER TABLE {} ADD COLUMN fingerprint_test int".format(db.flow_table_postgres.table_name))
+        await other_db._init(db_conf, create_triggers=False)
+        assert setup_calls == [db.artifact_table_postgres.table_name, db.metadata_table_postgres.table_name]
+        assert postgres_async_db._verified_schemas[db_conf.dsn][0] != fingerprint
+    finally:
+        other_db.pool.close()
+        await other_db.pool.wait_closed()
+        with (await db.pool.cursor()) as cur:
+            await cur.execute("ALTER TABLE {} DROP COLUMN IF EXISTS fingerprint_test".format(
+                db.flow_table_postgres.table_name))
+
+
+async def test_run_archive_read_through(cli, db, monkeypatch):
+    _flow = (await add_flow(db)).body
+    _old_run = (await add_run(db, flow_id=_flow["flow_id"])).body
+    _run = (await add_run(db, flow_id=_flow["flow_id"])).body
+    _step = (await add_step(db, flow_id=_old_run["flow_id"], run_number=_old_run["run_number"])).body
+    _task = (await add_task(db, flow_id=_step["flow_id"], run_number=_step["run_number"], step_name=_step["step_name"])).body
+    await add_metadata(db, flow_id=_task["flow_id"], run_number=_task["run_number"], step_name=_task["step_name"],
+                       task_id=_task["task_id"], metadata={"field_name": "attempt", "value": "0", "type": "attempt"})
+    _artifact = (await add_artifact(db, flow_id=_task["flow_id"], run_number=_task["run_number"], step_name=_task["step_name"],
+                                    task_id=_task["task_id"], artifact={"name": "_task_ok"})).body
+
+    run_path = "/flows/{flow_id}/runs/{run_number}".format(**_old_run)
+    task_path = "/flows/{flow_id}/runs/{run_number}/steps/{step_name}/tasks/{task_id}".format(**_task)
+
+    with (await db.pool.cursor()) as cur:
+        await cur.execute(
+            "UPDATE {} SET ts_epoch = 0 WHERE run_number = %s".format(db.run_table_postgres.table_name),
+            [_old_run["run_number"]])
+
+    # Move the old run to the archive tables, by column name, the way the migration service archives runs
+    archived_tables = [db.run_summary_table_postgres, db.task_attempt_table_postgres, db.artifact_table_postgres,
+                       db.metadata_table_postgres, db.task_table_postgres, db.step_table_postgres,
+                       db.run_table_postgres]
+    try:
+        with (await db.pool.cursor()) as cur:
+            for table in archived_tables:
+                await cur.execute(
+                    """
+                    INSERT INTO {archive_table_name}
+                    SELECT (jsonb_populate_record(NULL::{archive_table_name}, to_jsonb(t))).*
+                    FROM {table_name} t WHERE flow_id = %s AND run_number = %s
+                    """.format(table_name=table.table_name, archive_table_name=table.archive_table_name),
+                    [_old_run["flow_id"], _old_run["run_number"]])
+                await cur.execute(
+                    "DELETE FROM {} WHERE flow_id = %s AND run_number = %s".format(table.table_name),
+                    [_old_run["flow_id"], _old_run["run_number"]])
+
+        # only the old run is archived
+        await assert_api_get_response(cli, "/flows/{flow_id}/runs/{run_number}".format(**_run), status=200)
+
+        await assert_api_get_response(cli, run_path, status=404)
+        await assert_api_get_response(cli, task_path, status=404)
+
+        # archived runs can be read back on request
+        monkeypatch.setattr(postgres_async_db, "DB_ARCHIVE_READ_THROUGH", True)
+        _archived_run = (await db.run_table_postgres.get_run(_old_run["flow_id"], _old_run["run_number"])).body
+        assert _archived_run["ts_epoch"] == 0
+        await assert_api_get_response(cli, run_path, status=200)
+        await assert_api_get_response(cli, task_path, status=200)
+        await assert_api_get_response(cli, "{}/artifacts".format(task_path), data=[_artifact])
+        await assert_api_get_response(cli, "{}/metadata".format(task_path), status=200)
+
+        # runs that are not archived are not looked up in the archive
+        await assert_api_get_response(cli, "/flows/{flow_id}/runs/1234".format(**_run), status=404)
+    finally:
+        with (await db.pool.cursor()) as cur:
+            for table in archived_tables:
+                await cur.execute("DELETE FROM {}".format(table.archive_table_name))
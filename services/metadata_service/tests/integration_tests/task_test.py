@@ -3,6 +3,13 @@ from .utils import (
     assert_api_get_response, assert_api_post_response, compare_partial,
     add_flow, add_run, add_step, add_task
 )
+from services.metadata_service.api.heartbeat_aggregator import HeartbeatAggregator
+from services.metadata_service.api.ingest_queue import IngestQueue
+from services.metadata_service.api import task as task_api
+from services.metadata_service.api import utils as api_utils
+from services.data import postgres_async_db
+from prometheus_client import REGISTRY
+import asyncio
 import pytest
 import json
 pytestmark = [pytest.mark.integration_tests]
@@ -115,6 +122,57 @@ async def test_task_post_has_initial_heartbeat_with_supported_version(cli, db):
     _found = (await db.run_table_postgres.get_run(_run["flow_id"], _run["run_number"])).body
     assert _found['last_heartbeat_ts'] is not None
 
+async def test_tasks_batch_post(cli, db):
+    # create flow, run and step to add tasks for.
+    _flow = (await add_flow(db)).body
+    _run = (await add_run(db, flow_id=_flow["flow_id"])).body
+    _step = (await add_step(db, flow_id=_run["flow_id"], run_number=_run["run_number"])).body
+
+    system_tags = ["runtime:test", "metaflow_version:2.2.12"]
+    payload = [
+        {"user_name": "test_user", "tags": ["a_tag"], "system_tags": system_tags},
+        {"user_name": "test_user", "tags": ["a_tag"], "system_tags": system_tags, "task_id": "named-task"},
+        {"user_name": "test_user", "tags": ["a_tag"], "system_tags": system_tags},
+    ]
+    _tasks = await assert_api_post_response(
+        cli,
+        path="/flows/{flow_id}/runs/{run_number}/steps/{step_name}/tasks".format(**_step),
+        payload=payload,
+        status=200
+    )
+
+    # tasks are returned in the order they were given
+    assert len(_tasks) == 3
+    assert _tasks[1]["task_id"] == "named-task"
+    assert int(_tasks[0]["task_id"]) < int(_tasks[2]["task_id"])
+    for _task in _tasks:
+        assert _task["last_heartbeat_ts"] is not None
+        _found = (await db.task_table_postgres.get_task(_task["flow_id"], _task["run_number"], _task["step_name"], _task["task_id"])).body
+        compare_partial(_found, payload[0])
+
+    # Run heartbeat should have been updated as well
+    _found = (await db.run_table_postgres.get_run(_run["flow_id"], _run["run_number"])).body
+    assert _found['last_heartbeat_ts'] is not None
+
+    # a conflicting task fails the whole batch
+    await assert_api_post_response(
+        cli,
+        path="/flows/{flow_id}/runs/{run_number}/steps/{step_name}/tasks".format(**_step),
+        payload=payload,
+        status=409
+    )
+    _found = (await db.task_table_postgres.get_tasks(_step["flow_id"], _step["run_number"], _step["step_name"])).body
+    assert len(_found) == 3
+
+    # numeric task names are not allowed
+    await assert_api_post_response(
+        cli,
+        path="/flows/{flow_id}/runs/{run_number}/steps/{step_name}/tasks".format(**_step),
+        payload=[{"user_name": "test_user", "task_id": "1234"}],
+        status=400
+    )
+
+
 async def test_task_heartbeat_post(cli, db):
     # create flow, run and step to add tasks for.
     _flow = (await add_flow(db)).body
@@ -162,6 +220,72 @@ async def test_task_heartbeat_post(cli, db):
     )
 
 
+async def test_task_heartbeat_aggregated(cli, db):
+    _flow = (await add_flow(db)).body
+    _run = (await add_run(db, flow_id=_flow["flow_id"])).body
+    _step = (await add_step(db, flow_id=_run["flow_id"], run_number=_run["run_number"])).body
+    _task = (await add_task(db, flow_id=_step["flow_id"], run_number=_step["run_number"], step_name=_step["step_name"])).body
+
+    aggregator = HeartbeatAggregator(db, flush_interval=60)
+    # flush interval is capped well below the heartbeat threshold
+    assert aggregator.flush_interval == 10
+
+    for _ in range(3):
+        response = await aggregator.task_heartbeat(_task["flow_id"], _task["run_number"], _task["step_name"], _task["task_id"])
+        assert response.response_code == 200
+    assert len(aggregator.run_heartbeats) == 1
+    assert len(aggregator.task_heartbeats) == 1
+
+    # heartbeats are only written on flush
+    _found = (await db.task_table_postgres.get_task(_task["flow_id"], _task["run_number"], _task["step_name"], _task["task_id"])).body
+    assert _found["last_heartbeat_ts"] is None
+
+    await aggregator.close()
+    assert not aggregator.run_heartbeats and not aggregator.task_heartbeats
+
+    _found = (await db.task_table_postgres.get_task(_task["flow_id"], _task["run_number"], _task["step_name"], _task["task_id"])).body
+    assert _found["last_heartbeat_ts"] is not None
+    _found = (await db.run_table_postgres.get_run(_run["flow_id"], _run["run_number"])).body
+    assert _found["last_heartbeat_ts"] is not None
+
+    # should get 404 for non-existent run and task
+    response = await aggregator.task_heartbeat(_task["flow_id"], "1234", _task["step_name"], _task["task_id"])
+    assert response.response_code == 404
+    response = await aggregator.task_heartbeat(_task["flow_id"], _task["run_number"], _task["step_name"], "1234")
+    assert response.response_code == 404
+
+
+async def test_task_post_group_commit(cli, db):
+    _flow = (await add_flow(db)).body
+    _run = (await add_run(db, flow_id=_flow["flow_id"])).body
+    _step = (await add_step(db, flow_id=_run["flow_id"], run_number=_run["run_number"])).body
+
+    labels = {"pool": db.name, "table": db.task_table_postgres.table_name}
+    batches = REGISTRY.get_sample_value("metaflow_db_ingest_batch_size_count", labels) or 0
+    batched = REGISTRY.get_sample_value("metaflow_db_ingest_batch_size_sum", labels) or 0
+
+    db.ingest_queue = IngestQueue(db, window=0.05)
+    try:
+        responses = await asyncio.gather(
+            *[add_task(db, flow_id=_step["flow_id"], run_number=_step["run_number"], step_name=_step["step_name"])
+              for _ in range(5)],
+            add_task(db, flow_id=_step["flow_id"], run_number=_step["run_number"], step_name="nonexistent"))
+    finally:
+        db.ingest_queue = None
+
+    # concurrent inserts are committed together, and each request receives its own result
+    assert REGISTRY.get_sample_value("metaflow_db_ingest_batch_size_count", labels) == batches + 1
+    assert REGISTRY.get_sample_value("metaflow_db_ingest_batch_size_sum", labels) == batched + 6
+    assert REGISTRY.get_sample_value("metaflow_db_ingest_queue_depth", labels) == 0
+    assert [response.response_code for response in responses] == [200] * 5 + [404]
+    assert len(set(response.body["task_id"] for response in responses[:5])) == 5
+
+    for response in responses[:5]:
+        _found = (await db.task_table_postgres.get_task(
+            _step["flow_id"], _step["run_number"], _step["step_name"], response.body["task_id"])).body
+        compare_partial(_found, response.body)
+
+
 async def test_tasks_get(cli, db):
     # create a flow, run and step for the test
     _flow = (await add_flow(db, "TestFlow", "test_user-1", ["a_tag", "b_tag"], ["runtime:test"])).body
@@ -185,6 +309,65 @@ async def test_tasks_get(cli, db):
     await assert_api_get_response(cli, "/flows/{flow_id}/runs/{run_number}/steps/nonexistent/tasks".format(**_first_task), status=200, data=[])
 
 
+async def test_tasks_get_streamed(cli, db, monkeypatch):
+    monkeypatch.setattr(task_api, "STREAM_RESPONSES", True)
+    monkeypatch.setattr(postgres_async_db, "STREAM_CHUNK_SIZE", 2)
+
+    _flow = (await add_flow(db, "TestFlow", "test_user-1", ["a_tag", "b_tag"], ["runtime:test"])).body
+    _run = (await add_run(db, flow_id=_flow["flow_id"])).body
+    _step = (await add_step(db, flow_id=_run["flow_id"], run_number=_run["run_number"], step_name="first_step")).body
+
+    _tasks = []
+    for _ in range(5):
+        _tasks.append((await add_task(db, flow_id=_step["flow_id"], run_number=_step["run_number"], step_name=_step["step_name"])).body)
+
+    # tasks are written in chunks, as a single JSON array
+    response = await cli.get("/flows/{flow_id}/runs/{run_number}/steps/{step_name}/tasks".format(**_step))
+    assert response.status == 200
+    assert response.headers["Transfer-Encoding"] == "chunked"
+    assert sorted(json.loads(await response.text()), key=lambda task: task["task_id"]) == _tasks
+
+    await assert_api_get_response(cli, "/flows/{flow_id}/runs/{run_number}/steps/nonexistent/tasks".format(**_step), status=200, data=[])
+
+
+async def test_tasks_get_since(cli, db, monkeypatch):
+    monkeypatch.setattr(api_utils, "CHANGE_TOKEN_GRACE_MS", 0)
+
+    _flow = (await add_flow(db, "TestFlow", "test_user-1", ["a_tag", "b_tag"], ["runtime:test"])).body
+    _run = (await add_run(db, flow_id=_flow["flow_id"])).body
+    _step = (await add_step(db, flow_id=_run["flow_id"], run_number=_run["run_number"], step_name="first_step")).body
+    _first_task = (await add_task(db, flow_id=_step["flow_id"], run_number=_step["run_number"], step_name=_step["step_name"])).body
+    _second_task = (await add_task(db, flow_id=_step["flow_id"], run_number=_step["run_number"], step_name=_step["step_name"])).body
+    await asyncio.sleep(0.01)
+
+    path = "/flows/{flow_id}/runs/{run_number}/steps/{step_name}/tasks".format(**_step)
+
+    # a full fetch returns a change token
+    response = await cli.get(path)
+    assert response.status == 200
+    change_token = int(response.headers["METADATA_CHANGE_TOKEN"])
+    assert len(json.loads(await response.text())) == 2
+
+    # nothing changed since
+    response = await cli.get(path, params={"since": change_token})
+    assert json.loads(await response.text()) == []
+    assert int(response.headers["METADATA_CHANGE_TOKEN"]) >= change_token
+
+    # added tasks and tasks with a heartbeat have changed
+    _third_task = (await add_task(db, flow_id=_step["flow_id"], run_number=_step["run_number"], step_name=_step["step_name"])).body
+    await assert_api_post_response(
+        cli, path="/flows/{flow_id}/runs/{run_number}/steps/{step_name}/tasks/{task_id}/heartbeat".format(**_first_task),
+        status=200)
+
+    response = await cli.get(path, params={"since": change_token})
+    assert sorted(task["task_id"] for task in json.loads(await response.text())) == [_first_task["task_id"], _third_task["task_id"]]
+
+    # invalid change tokens are rejected
+    for since in ["yesterday", "-1"]:
+        response = await cli.get(path, params={"since": since})
+        assert response.status == 400
+
+
 async def test_task_get(cli, db):
     # create flow, run and step for test
     _flow = (await add_flow(db, "TestFlow", "test_user-1", ["a_tag", "b_tag"], ["runtime:test"])).body
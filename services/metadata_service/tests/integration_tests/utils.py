@@ -5,6 +5,7 @@ import psycopg2
 import pytest
 from aiohttp import web
 from services.data.postgres_async_db import AsyncPostgresDB
+from services.data.db_utils import parse_attempt_id
 from services.utils.tests import get_test_dbconf
 from services.metadata_service.api.admin import AuthApi
 from services.metadata_service.api.flow import FlowApi
@@ -61,11 +62,14 @@ async def init_db(cli):
 async def clean_db(db: AsyncPostgresDB):
     # Tables to clean (order is important due to foreign keys)
     tables = [
+        db.run_summary_table_postgres,
+        db.task_attempt_table_postgres,
         db.metadata_table_postgres,
         db.artifact_table_postgres,
         db.task_table_postgres,
         db.step_table_postgres,
         db.run_table_postgres,
+        db.run_tag_table_postgres,
         db.flow_table_postgres
     ]
     for table in tables:
@@ -150,7 +154,8 @@ async def add_metadata(db: AsyncPostgresDB, flow_id="HelloFlow",
         "type": metadata.get("type", " "),
         "user_name": user_name,
         "tags": json.dumps(tags),
-        "system_tags": json.dumps(system_tags)
+        "system_tags": json.dumps(system_tags),
+        "attempt_id": parse_attempt_id(metadata.get("field_name"), metadata.get("value"), tags)
     }
     return await db.metadata_table_postgres.create_record(values)
 
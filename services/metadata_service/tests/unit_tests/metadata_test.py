@@ -0,0 +1,22 @@
+import pytest
+from services.data.db_utils import parse_attempt_id
+
+pytestmark = [pytest.mark.unit_tests]
+
+expectations = [
+    ("attempt_ok", "True", ["attempt_id:2"], 2),
+    ("attempt_ok", "True", ["metaflow_version:2.3", "attempt_id:12"], 12),
+    ("attempt_ok", "True", [], None),
+    ("attempt", "1", [], 1),
+    ("attempt", "1", ["attempt_id:1"], 1),
+    ("attempt-done", '"3"', None, 3),
+    ("attempt-done", "[4]", [], 4),
+    ("attempt", "first", [], None),
+    ("code-package", "1", [], None),
+    ("code-package", "s3://bucket", ["attempt_id:0"], 0),
+]
+
+
+@pytest.mark.parametrize("field_name, value, tags, expected", expectations)
+def test_parse_attempt_id(field_name, value, tags, expected):
+    assert parse_attempt_id(field_name, value, tags) == expected
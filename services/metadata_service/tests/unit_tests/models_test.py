@@ -0,0 +1,64 @@
+import pytest
+from services.data import FlowRow, RunRow, StepRow, TaskRow, ArtifactRow, MetadataRow, TaskAttemptRow, RunSummaryRow, \
+    RunTagRow
+
+pytestmark = [pytest.mark.unit_tests]
+
+rows = [
+    (FlowRow, {"flow_id": "HelloFlow", "user_name": "dipper", "ts_epoch": 1, "tags": ["a"], "system_tags": ["b"]}),
+    (RunRow, {"flow_id": "HelloFlow", "run_number": 5, "run_id": None, "user_name": "dipper", "ts_epoch": 1,
+              "tags": [], "system_tags": [], "last_heartbeat_ts": 2}),
+    (RunRow, {"flow_id": "HelloFlow", "run_number": 5, "run_id": "named", "user_name": "dipper", "ts_epoch": 1,
+              "tags": [], "system_tags": [], "last_heartbeat_ts": None}),
+    (StepRow, {"flow_id": "HelloFlow", "run_number": 5, "run_id": None, "step_name": "start",
+               "user_name": "dipper", "ts_epoch": 1, "tags": [], "system_tags": []}),
+    (StepRow, {"flow_id": "HelloFlow", "run_number": 5, "run_id": "named", "step_name": "start",
+               "user_name": "dipper", "ts_epoch": 1, "tags": [], "system_tags": []}),
+    (TaskRow, {"flow_id": "HelloFlow", "run_number": 5, "run_id": None, "step_name": "start", "task_id": 7,
+               "task_name": None, "user_name": "dipper", "ts_epoch": 1, "tags": [], "system_tags": [],
+               "last_heartbeat_ts": 2}),
+    (TaskRow, {"flow_id": "HelloFlow", "run_number": 5, "run_id": "named", "step_name": "start", "task_id": 7,
+               "task_name": "task", "user_name": "dipper", "ts_epoch": 1, "tags": [], "system_tags": [],
+               "last_heartbeat_ts": None}),
+    (MetadataRow, {"flow_id": "HelloFlow", "run_number": 5, "run_id": None, "step_name": "start", "task_id": 7,
+                   "task_name": None, "id": 3, "field_name": "field", "value": "value", "type": "type",
+                   "user_name": "dipper", "ts_epoch": 1, "tags": ["attempt_id:0"], "system_tags": [],
+                   "attempt_id": 0}),
+    (ArtifactRow, {"flow_id": "HelloFlow", "run_number": 5, "run_id": "named", "step_name": "start", "task_id": 7,
+                   "task_name": "task", "name": "artifact", "location": "s3://", "ds_type": "s3", "sha": "sha",
+                   "type": "type", "content_type": "content", "user_name": "dipper", "attempt_id": 1,
+                   "ts_epoch": 1, "tags": [], "system_tags": []}),
+    (TaskAttemptRow, {"flow_id": "HelloFlow", "run_number": 5, "step_name": "start", "task_id": 7, "attempt_id": 0,
+                      "started_at": 1, "attempt_finished_at": 2, "attempt_ok": True, "task_ok_finished_at": None,
+                      "task_ok_location": None}),
+    (RunSummaryRow, {"flow_id": "HelloFlow", "run_number": 5, "started_at": 1, "end_attempt_ok": True,
+                     "end_attempt_ok_ts": 3, "end_attempt_ts": 2, "status": "completed",
+                     "finished_at": 3, "duration": 2}),
+    (RunTagRow, {"tag": "runtime:dev", "run_count": 3, "last_seen_ts": 1}),
+]
+
+
+@pytest.mark.parametrize("expanded", [False, True])
+@pytest.mark.parametrize("row_type, record", rows)
+def test_tuple_serializer(row_type, record, expanded):
+    # columns in reverse order, with an unrelated column in between
+    columns = list(reversed(list(record.keys()))) + ["unrelated"]
+    values = tuple(record[column] for column in columns[:-1]) + ("unrelated",)
+
+    serialize = row_type.tuple_serializer(columns, expanded)
+    expected = row_type(**record).serialize(expanded)
+    assert serialize(values) == expected
+    # keys are in the same order, which is kept in the JSON responses
+    assert list(serialize(values).keys()) == list(expected.keys())
+
+
+def test_rows_are_slotted():
+    row = FlowRow(flow_id="HelloFlow", user_name="dipper")
+    assert not hasattr(row, "__dict__")
+    with pytest.raises(AttributeError):
+        row.unknown = 1
+
+
+def test_tuple_serializer_missing_column():
+    with pytest.raises(KeyError):
+        FlowRow.tuple_serializer(["flow_id", "user_name"])
@@ -0,0 +1,151 @@
+import os
+import signal
+import subprocess
+import sys
+import textwrap
+import time
+
+import pytest
+from services.metadata_service.workers import Supervisor, WorkerStatus, worker_pool_max
+
+pytestmark = [pytest.mark.unit_tests]
+
+
+def serve_until_stopped(worker):
+    worker.started()
+    while True:
+        worker.report()
+        time.sleep(0.05)
+
+
+def serve_after_stopped(worker):
+    "Keep serving for a second after SIGTERM, like a worker finishing its requests in flight"
+    stopped = []
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopped.append(time.monotonic()))
+    worker.started()
+    while not stopped or time.monotonic() - stopped[0] < 1:
+        worker.report()
+        time.sleep(0.05)
+
+
+def wait_for(condition, supervisor, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        supervisor.check()
+        time.sleep(0.05)
+
+
+def serving(supervisor):
+    return sorted((worker["index"], worker["pid"]) for worker in supervisor.status.workers() if worker["status"] == "UP")
+
+
+@pytest.mark.parametrize("budget, workers, pool_max, expected", [
+    (0, 4, 10, 10),
+    (50, 4, 10, 10),
+    (100, 4, 10, 10),
+    (30, 4, 10, 6),
+    (3, 4, 10, 1),
+])
+def test_worker_pool_max(budget, workers, pool_max, expected):
+    assert worker_pool_max(budget, workers, pool_max) == expected
+
+
+def test_worker_status():
+    status = WorkerStatus(2)
+    assert status.workers() == []
+
+    status.write(1, index=3, pid=1234, generation=2, reported_at=time.time())
+    assert [(w["index"], w["pid"], w["generation"], w["status"]) for w in status.workers()] == [(3, 1234, 2, "STARTING")]
+
+    status.started(1)
+    status.report(1, 42)
+    [worker] = status.workers()
+    assert worker["status"] == "UP" and worker["requests"] == 42
+    assert status.workers(health_timeout=0)[0]["status"] == "DOWN"
+
+    # a slot taken over by another worker is left to it
+    status.clear(1, pid=4321)
+    assert len(status.workers()) == 1
+    status.clear(1, pid=1234)
+    assert status.workers() == []
+
+
+def test_supervisor_restarts_and_reloads_workers():
+    supervisor = Supervisor(2, serve_until_stopped, shutdown_timeout=1)
+    try:
+        for index in range(2):
+            supervisor.spawn(index)
+        wait_for(lambda: len(serving(supervisor)) == 2, supervisor)
+        started = serving(supervisor)
+
+        # a worker that exits is restarted
+        os.kill(started[0][1], signal.SIGKILL)
+        wait_for(lambda: len(serving(supervisor)) == 2 and serving(supervisor) != started, supervisor)
+        restarted = serving(supervisor)
+        assert restarted[1] == started[1]
+
+        # a reload replaces all workers with a new generation
+        supervisor.reload()
+        wait_for(lambda: len(supervisor.processes) == 2, supervisor)
+        assert {worker.generation for worker in supervisor.processes.values()} == {1}
+        assert not set(pid for _, pid in serving(supervisor)) & set(pid for _, pid in restarted)
+    finally:
+        supervisor.stop()
+    assert supervisor.processes == {}
+
+
+def test_supervisor_reloads_while_retired_workers_stop():
+    supervisor = Supervisor(2, serve_after_stopped, shutdown_timeout=5)
+    try:
+        for index in range(2):
+            supervisor.spawn(index)
+        wait_for(lambda: len(serving(supervisor)) == 2, supervisor)
+
+        # a second reload replaces only the workers of the first one, not the retired workers still stopping
+        supervisor.reload()
+        supervisor.reload()
+        assert sorted(worker.generation for worker in supervisor.processes.values() if not worker.retired) == [2, 2]
+        replacements = sorted((worker.index, worker.pid) for worker in supervisor.processes.values()
+                              if not worker.retired)
+
+        # the retired workers exit without clearing the slots of their replacements, which keep serving
+        wait_for(lambda: len(supervisor.processes) == 2, supervisor)
+        assert serving(supervisor) == replacements
+        assert not any(worker.killed for worker in supervisor.processes.values())
+        time.sleep(0.5)
+        supervisor.check()
+        assert serving(supervisor) == replacements
+        assert all(worker["seconds_since_report"] < 0.5 for worker in supervisor.status.workers())
+    finally:
+        supervisor.stop()
+    assert supervisor.processes == {}
+
+
+def test_metrics_of_all_workers(tmp_path):
+    # multiprocess mode is set up on import, so the workers are forked by a fresh interpreter
+    script = textwrap.dedent("""
+        import os
+        import sys
+        from services.data import metrics
+
+        pids = []
+        for _ in range(2):
+            pid = os.fork()
+            if pid == 0:
+                metrics.INGEST_BATCH_SIZE.labels("global", "artifact_v3").observe(10)
+                metrics.INGEST_QUEUE_DEPTH.labels("global", "artifact_v3").set(3)
+                os._exit(0)
+            os.waitpid(pid, 0)
+            pids.append(pid)
+        metrics.process_exited(pids[0])
+        sys.stdout.write(metrics.export_metrics()[0].decode())
+    """)
+    env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=str(tmp_path))
+    output = subprocess.run([sys.executable, "-c", script], env=env, check=True, stdout=subprocess.PIPE).stdout.decode()
+
+    # histograms include all workers, gauges only the ones still running
+    labels = '{pool="global",table="artifact_v3"}'
+    assert "metaflow_db_ingest_batch_size_count{} 2.0".format(labels) in output
+    assert "metaflow_db_ingest_batch_size_sum{} 20.0".format(labels) in output
+    assert "metaflow_db_ingest_queue_depth{} 3.0".format(labels) in output
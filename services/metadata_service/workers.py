@@ -0,0 +1,368 @@
+"""
+Pre-forked serving of the metadata service on multiple cores.
+
+A supervisor process forks MF_METADATA_WORKERS workers. Each worker runs its own event loop and database pool,
+and listens on the service port with SO_REUSEPORT, so that the kernel spreads incoming connections over the workers.
+The supervisor restarts workers that exit, and kills workers that stop reporting their health, eg. due to a blocked
+event loop, to have them restarted as well.
+
+Signals handled by the supervisor
+    - SIGHUP: graceful reload. Workers are replaced one at a time, each replacement serving before the worker it
+      replaces stops accepting connections and finishes its requests in flight.
+    - SIGTERM, SIGINT: graceful shutdown of all workers.
+
+Workers report their health to a table in shared memory, which every worker includes in its /healthcheck response.
+"""
+import asyncio
+import mmap
+import os
+import signal
+import struct
+import sys
+import time
+import traceback
+from typing import Callable, Dict, List
+
+from aiohttp import web
+
+from services.data.metrics import clear_multiprocess_metrics, process_exited
+from services.data.service_configs import worker_health_timeout_seconds, \
+    worker_shutdown_timeout_seconds
+from services.utils import logging
+
+# Seconds between health reports of each worker
+HEALTH_REPORT_INTERVAL_SECONDS = 1.0
+
+# Seconds a forked worker has to connect to the database and start serving
+WORKER_READY_TIMEOUT_SECONDS = 60.0
+
+# Minimum seconds between restarts of a worker, so that workers failing on startup do not restart in a busy loop
+WORKER_RESTART_DELAY_SECONDS = 1.0
+
+# Seconds between checks of the supervisor on its workers
+SUPERVISOR_CHECK_INTERVAL_SECONDS = 0.2
+
+# index, pid, generation, started_at, reported_at, requests
+_SLOT = struct.Struct("=qqqddq")
+_REPORT = struct.Struct("=dq")
+_PID_OFFSET = struct.calcsize("=q")
+_STARTED_OFFSET = struct.calcsize("=qqq")
+_REPORT_OFFSET = struct.calcsize("=qqqd")
+
+
+def worker_pool_max(connection_budget: int, workers: int, pool_max: int) -> int:
+    """
+    Maximum size of the database pool of each worker, sharing connection_budget between the workers.
+
+    An extra worker is accounted for, as a worker and its replacement are both connected during a reload.
+    Without a budget, or with a budget larger than the workers need, each worker is allowed pool_max connections.
+    """
+    if connection_budget <= 0:
+        return pool_max
+    return min(pool_max, max(1, connection_budget // (workers + 1)))
+
+
+class WorkerStatus(object):
+    """
+    Health of the workers, in a table of slots in anonymous shared memory.
+
+    The table is created by the supervisor and inherited by the forked workers. Each slot is written
+    by the supervisor when it forks a worker, and afterwards only by the worker itself. A slot can be
+    taken over by a worker of a later generation while its previous worker is still stopping, after
+    which the previous worker no longer writes to it.
+
+    Parameters
+    ----------
+    slots : int
+        number of workers that can be reported at once
+    """
+
+    def __init__(self, slots: int):
+        self.slots = slots
+        self._memory = mmap.mmap(-1, _SLOT.size * slots)
+
+    def write(self, slot: int, index: int, pid: int, generation: int, started_at: float = 0.0,
+              reported_at: float = 0.0, requests: int = 0):
+        _SLOT.pack_into(self._memory, slot * _SLOT.size, index, pid, generation, started_at, reported_at, requests)
+
+    def set_pid(self, slot: int, pid: int):
+        struct.pack_into("=q", self._memory, slot * _SLOT.size + _PID_OFFSET, pid)
+
+    def started(self, slot: int):
+        struct.pack_into("=d", self._memory, slot * _SLOT.size + _STARTED_OFFSET, time.time())
+        self.report(slot, 0)
+
+    def report(self, slot: int, requests: int):
+        _REPORT.pack_into(self._memory, slot * _SLOT.size + _REPORT_OFFSET, time.time(), requests)
+
+    def pid(self, slot: int) -> int:
+        return struct.unpack_from("=q", self._memory, slot * _SLOT.size + _PID_OFFSET)[0]
+
+    def clear(self, slot: int, pid: int):
+        "Clear the slot of an exited worker, unless it has been taken over by a newer worker already"
+        if self.pid(slot) == pid:
+            self.write(slot, 0, 0, 0)
+
+    def read(self, slot: int) -> Dict:
+        index, pid, generation, started_at, reported_at, requests = _SLOT.unpack_from(self._memory, slot * _SLOT.size)
+        return {
+            "index": index,
+            "pid": pid,
+            "generation": generation,
+            "started_at": started_at,
+            "reported_at": reported_at,
+            "requests": requests
+        }
+
+    def workers(self, health_timeout: float = worker_health_timeout_seconds) -> List[Dict]:
+        "Health of all running workers, ordered by their index"
+        now = time.time()
+        workers = []
+        for slot in range(self.slots):
+            worker = self.read(slot)
+            if not worker["pid"]:
+                continue
+            workers.append({
+                "index": worker["index"],
+                "pid": worker["pid"],
+                "generation": worker["generation"],
+                "status": "UP" if worker["started_at"] and now - worker["reported_at"] < health_timeout
+                else ("STARTING" if not worker["started_at"] else "DOWN"),
+                "uptime_seconds": round(now - worker["started_at"], 3) if worker["started_at"] else 0,
+                "seconds_since_report": round(now - worker["reported_at"], 3),
+                "requests": worker["requests"]
+            })
+        return sorted(workers, key=lambda worker: (worker["index"], worker["generation"]))
+
+
+class Worker(object):
+    """
+    A worker process forked by the supervisor, as seen from within the worker.
+
+    Counts the requests served by the worker, and reports them along with its health to its slot in the
+    shared WorkerStatus table.
+    """
+
+    def __init__(self, index: int, generation: int, slot: int, status: WorkerStatus, workers: int):
+        self.index = index
+        self.generation = generation
+        self.slot = slot
+        self.status = status
+        self.workers = workers
+        self.pid = None
+        self.requests = 0
+        # Set by the supervisor for workers it has told to stop
+        self.retired = False
+        self.stop_deadline = 0.0
+        self.killed = False
+
+    @web.middleware
+    async def middleware(self, request, handler):
+        self.requests += 1
+        return await handler(request)
+
+    def started(self):
+        "Report the worker as serving"
+        self.status.started(self.slot)
+
+    def report(self):
+        # A retired worker that is still stopping leaves a slot taken over by a newer worker alone
+        if self.status.pid(self.slot) == self.pid:
+            self.status.report(self.slot, self.requests)
+
+    async def report_periodically(self, interval: float = HEALTH_REPORT_INTERVAL_SECONDS):
+        "Keep reporting while the event loop of the worker is responsive"
+        while True:
+            self.report()
+            await asyncio.sleep(interval)
+
+    def health(self) -> Dict:
+        "Health of this worker and all other workers of the supervisor, for /healthcheck"
+        self.report()
+        return {
+            "worker": {"index": self.index, "pid": os.getpid(), "generation": self.generation},
+            "workers": self.status.workers()
+        }
+
+
+class Supervisor(object):
+    """
+    Forks and supervises worker processes.
+
+    Parameters
+    ----------
+    workers : int
+        number of worker processes
+    target : Callable[[Worker], None]
+        serves requests in a forked worker, until the worker receives SIGTERM
+    health_timeout : float
+        seconds after which a worker that has not reported its health is killed and restarted
+    shutdown_timeout : float
+        seconds that workers have to finish their requests in flight when they are stopped
+    """
+
+    def __init__(self, workers: int, target: Callable[[Worker], None],
+                 health_timeout: float = worker_health_timeout_seconds,
+                 shutdown_timeout: float = worker_shutdown_timeout_seconds,
+                 ready_timeout: float = WORKER_READY_TIMEOUT_SECONDS):
+        self.workers = max(1, workers)
+        self.target = target
+        self.health_timeout = health_timeout
+        self.shutdown_timeout = shutdown_timeout
+        self.ready_timeout = ready_timeout
+        self.logger = logging.getLogger("Supervisor")
+
+        # Slots for two generations of workers, which overlap during a reload
+        self.status = WorkerStatus(2 * self.workers)
+        self.generation = 0
+        self.processes: Dict[int, Worker] = {}
+        self._restarts: Dict[int, float] = {}
+        self._last_spawn: Dict[int, float] = {}
+        self._signals: List[int] = []
+        self._stopping = False
+
+    def run(self):
+        "Fork the workers and supervise them until SIGTERM or SIGINT"
+        for signum in [signal.SIGHUP, signal.SIGTERM, signal.SIGINT]:
+            signal.signal(signum, self._on_signal)
+        clear_multiprocess_metrics()
+        for index in range(self.workers):
+            self.spawn(index)
+        self.logger.info("Started {} workers".format(self.workers))
+        try:
+            while True:
+                while self._signals and self._signals[0] == signal.SIGHUP:
+                    self._signals.pop(0)
+                    self.reload()
+                if self._signals:
+                    self.logger.info("Received {}, stopping workers".format(signal.Signals(self._signals[0]).name))
+                    break
+                self.check()
+                time.sleep(SUPERVISOR_CHECK_INTERVAL_SECONDS)
+        finally:
+            self.stop()
+
+    def _on_signal(self, signum, frame):
+        self._signals.append(signum)
+
+    def spawn(self, index: int) -> Worker:
+        "Fork a worker of the current generation"
+        slot = index + (self.generation % 2) * self.workers
+        worker = Worker(index, self.generation, slot, self.status, self.workers)
+        # The worker is given the ready timeout to report for the first time
+        self.status.write(slot, index, 0, self.generation, reported_at=time.time())
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                # The supervisor stops workers with SIGTERM, a Ctrl-C in the terminal is handled by the supervisor
+                signal.signal(signal.SIGINT, signal.SIG_IGN)
+                signal.signal(signal.SIGHUP, signal.SIG_IGN)
+                signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                worker.pid = os.getpid()
+                self.target(worker)
+            except BaseException:
+                traceback.print_exc()
+                code = 1
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(code)
+
+        worker.pid = pid
+        self.status.set_pid(slot, pid)
+        self.processes[pid] = worker
+        self._last_spawn[index] = time.monotonic()
+        self.logger.info("Forked worker {} (pid {}, generation {})".format(index, pid, self.generation))
+        return worker
+
+    def check(self):
+        "Reap exited workers, restart the ones that exited unexpectedly and kill the ones that stopped reporting"
+        while True:
+            try:
+                pid, exit_status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                break
+            worker = self.processes.pop(pid, None)
+            if worker is None:
+                continue
+            self.status.clear(worker.slot, pid)
+            process_exited(pid)
+            if not self._stopping and not worker.retired:
+                self.logger.warning("Worker {} (pid {}) exited with status {}, restarting it".format(
+                    worker.index, pid, exit_status))
+                self._restarts[worker.index] = self._last_spawn.get(worker.index, 0) + WORKER_RESTART_DELAY_SECONDS
+
+        for index, restart_at in list(self._restarts.items()):
+            if time.monotonic() >= restart_at:
+                del self._restarts[index]
+                self.spawn(index)
+
+        now = time.time()
+        for worker in list(self.processes.values()):
+            status = self.status.read(worker.slot)
+            if status["pid"] != worker.pid:
+                # A retired worker whose slot was taken over no longer reports, it is only given time to stop
+                if not worker.killed and time.monotonic() > worker.stop_deadline:
+                    self.logger.error("Worker {} (pid {}) did not stop in time, killing it".format(
+                        worker.index, worker.pid))
+                    worker.killed = True
+                    self._kill(worker.pid, signal.SIGKILL)
+                continue
+            timeout = self.health_timeout if status["started_at"] else self.ready_timeout
+            if not worker.killed and now - status["reported_at"] > timeout:
+                self.logger.error("Worker {} (pid {}) has not reported for {:.1f}s, killing it".format(
+                    worker.index, worker.pid, now - status["reported_at"]))
+                worker.killed = True
+                self._kill(worker.pid, signal.SIGKILL)
+
+    def reload(self):
+        "Replace the workers one at a time, without refusing connections"
+        self.generation += 1
+        self.logger.info("Reloading workers, generation {}".format(self.generation))
+        self._restarts.clear()
+        for old in sorted(self.processes.values(), key=lambda worker: worker.index):
+            # Retired workers finishing their requests from a previous reload are not replaced again
+            if old.retired or old.generation >= self.generation:
+                continue
+            new = self.spawn(old.index)
+            deadline = time.monotonic() + self.ready_timeout
+            while new.pid in self.processes and not self.status.read(new.slot)["started_at"] \
+                    and time.monotonic() < deadline:
+                time.sleep(SUPERVISOR_CHECK_INTERVAL_SECONDS)
+                self.check()
+            if not self.status.read(new.slot)["started_at"]:
+                self.logger.error("Replacement of worker {} did not start serving".format(old.index))
+            old.retired = True
+            old.stop_deadline = time.monotonic() + self.shutdown_timeout + 1
+            self._kill(old.pid, signal.SIGTERM)
+
+    def stop(self):
+        "Stop all workers, giving them the shutdown timeout to finish their requests"
+        self._stopping = True
+        for worker in self.processes.values():
+            worker.retired = True
+            self._kill(worker.pid, signal.SIGTERM)
+        deadline = time.monotonic() + self.shutdown_timeout + 1
+        while self.processes and time.monotonic() < deadline:
+            self.check()
+            time.sleep(SUPERVISOR_CHECK_INTERVAL_SECONDS)
+        for worker in list(self.processes.values()):
+            self.logger.error("Worker {} (pid {}) did not stop in time, killing it".format(worker.index, worker.pid))
+            self._kill(worker.pid, signal.SIGKILL)
+            os.waitpid(worker.pid, 0)
+            self.processes.pop(worker.pid, None)
+            self.status.clear(worker.slot, worker.pid)
+            process_exited(worker.pid)
+
+    def _kill(self, pid: int, signum: int):
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:
+            # Exited already, reaped by the next check
+            pass
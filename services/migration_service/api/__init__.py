@@ -7,7 +7,16 @@ version_dict = {
     '20200603104139': '20200603104139',
     '20201002000616': '20201002000616',
     '20210202145952': '20210202145952',
-    '20210260056859': 'latest'
+    '20210260056859': '20210260056859',
+    '20261018120000': '20261018120000',
+    '20261018130000': '20261018130000',
+    '20261018140000': '20261018140000',
+    '20261018150000': '20261018150000',
+    '20261018160000': '20261018160000',
+    '20261018170000': '20261018170000',
+    '20261018180000': '20261018180000',
+    '20261018190000': '20261018190000',
+    '20261018200000': 'latest'
 }
 
 latest = "latest"
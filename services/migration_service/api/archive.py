@@ -0,0 +1,113 @@
+import json
+import os
+
+from aiohttp import web
+from multidict import MultiDict
+
+from ..data.postgres_async_db import AsyncPostgresDB
+from ..data.retention import (ARCHIVE_BATCH_SIZE, ARCHIVE_MAX_RUNS_PER_SECOND,
+                              ARCHIVE_OLDER_THAN_DAYS, ArchiveInProgress,
+                              RunArchiver)
+
+
+class ArchiveApi(object):
+    def __init__(self, app):
+        self.archiver = None
+        app.router.add_route("GET", "/archive", self.archive_status)
+
+        endpoints_enabled = int(os.environ.get("MF_MIGRATION_ENDPOINTS_ENABLED",
+                                               1))
+        if endpoints_enabled:
+            app.router.add_route("POST", "/archive", self.start_archive)
+            app.router.add_route("DELETE", "/archive", self.cancel_archive)
+
+    def _get_archiver(self) -> RunArchiver:
+        if self.archiver is None:
+            self.archiver = RunArchiver(AsyncPostgresDB.get_instance().pool)
+        return self.archiver
+
+    async def start_archive(self, request):
+        """
+        ---
+        description: This end-point starts moving old runs, with their steps, tasks, metadata and
+            artifacts, to the archive tables in the background
+        tags:
+        - Admin
+        parameters:
+        - name: "older_than_days"
+          in: "query"
+          description: "minimum age of the runs to archive"
+          required: false
+          type: "number"
+        - name: "batch_size"
+          in: "query"
+          description: "number of runs moved per transaction"
+          required: false
+          type: "integer"
+        - name: "max_runs_per_second"
+          in: "query"
+          description: "upper limit for the archival rate, 0 for no limit"
+          required: false
+          type: "number"
+        produces:
+        - 'application/json'
+        responses:
+            "202":
+                description: archival started. Returns progress of the job
+            "400":
+                description: invalid parameters
+            "409":
+                description: an archival job is already running
+        """
+        try:
+            older_than_days = float(request.query.get("older_than_days", ARCHIVE_OLDER_THAN_DAYS))
+            batch_size = int(request.query.get("batch_size", ARCHIVE_BATCH_SIZE))
+            max_runs_per_second = float(request.query.get("max_runs_per_second", ARCHIVE_MAX_RUNS_PER_SECOND))
+            if older_than_days < 0 or batch_size < 1 or max_runs_per_second < 0:
+                raise ValueError("parameters out of range")
+        except ValueError as e:
+            return _json_response({"detail": repr(e)}, status=400)
+
+        try:
+            progress = self._get_archiver().start(older_than_days, batch_size, max_runs_per_second)
+        except ArchiveInProgress as e:
+            return _json_response({"detail": str(e), "progress": self.archiver.progress}, status=409)
+        return _json_response(progress, status=202)
+
+    async def archive_status(self, request):
+        """
+        ---
+        description: This end-point returns the progress of the latest archival job
+        tags:
+        - Admin
+        produces:
+        - 'application/json'
+        responses:
+            "200":
+                description: successful operation. Returns state, runs and rows archived so far
+        """
+        return _json_response(self._get_archiver().progress)
+
+    async def cancel_archive(self, request):
+        """
+        ---
+        description: This end-point stops the running archival job. Runs that have been
+            archived so far stay archived
+        tags:
+        - Admin
+        produces:
+        - 'application/json'
+        responses:
+            "200":
+                description: archival job cancelled
+            "404":
+                description: no archival job is running
+        """
+        if not self._get_archiver().cancel():
+            return _json_response({"detail": "no archival job is running"}, status=404)
+        return _json_response({"detail": "archival job cancelled"})
+
+
+def _json_response(body, status=200):
+    return web.Response(status=status, body=json.dumps(body),
+                        headers=MultiDict({"Content-Type": "application/json"}))
@@ -0,0 +1,235 @@
+"""
+Retention of old runs.
+
+Runs older than a given age are moved, together with their summary, steps, tasks, task attempts, metadata and artifacts,
+from the main tables to the archive tables created by the migrations (<table>_archive).
+Each batch of runs is moved in a single transaction, so a run is either fully archived or not at all.
+The metadata service can read archived runs back with DB_ARCHIVE_READ_THROUGH=1.
+
+Rows are moved by name, the columns of a table and its archive table do not need to be in the same order.
+Archived rows are deleted from the main tables, which fires their delete triggers: the notify triggers broadcast
+the deletes, and archived runs no longer count towards the tag dictionary of the UI.
+"""
+import asyncio
+import os
+import time
+from typing import Dict, List
+
+# Table names can be overridden with the same environment variables as in the metadata service
+RUN_TABLE_NAME = os.environ.get("DB_TABLE_NAME_RUNS", "runs_v3")
+STEP_TABLE_NAME = os.environ.get("DB_TABLE_NAME_STEPS", "steps_v3")
+TASK_TABLE_NAME = os.environ.get("DB_TABLE_NAME_TASKS", "tasks_v3")
+METADATA_TABLE_NAME = os.environ.get("DB_TABLE_NAME_METADATA", "metadata_v3")
+ARTIFACT_TABLE_NAME = os.environ.get("DB_TABLE_NAME_ARTIFACT", "artifact_v3")
+TASK_ATTEMPT_TABLE_NAME = os.environ.get("DB_TABLE_NAME_TASK_ATTEMPTS", "task_attempts_v3")
+RUN_SUMMARY_TABLE_NAME = os.environ.get("DB_TABLE_NAME_RUN_SUMMARY", "run_summary_v3")
+
+# Tables are archived in this order due to foreign keys
+ARCHIVED_TABLES = [RUN_SUMMARY_TABLE_NAME, TASK_ATTEMPT_TABLE_NAME, METADATA_TABLE_NAME, ARTIFACT_TABLE_NAME, TASK_TABLE_NAME, STEP_TABLE_NAME, RUN_TABLE_NAME]
+
+# Defaults for archival jobs, can be overridden per job
+ARCHIVE_OLDER_THAN_DAYS = int(os.environ.get("MF_ARCHIVE_OLDER_THAN_DAYS", 365))
+ARCHIVE_BATCH_SIZE = int(os.environ.get("MF_ARCHIVE_BATCH_SIZE", 100))
+ARCHIVE_MAX_RUNS_PER_SECOND = float(os.environ.get("MF_ARCHIVE_MAX_RUNS_PER_SECOND", 50))
+
+
+def archive_table_name(table_name: str) -> str:
+    return "{}_archive".format(table_name)
+
+
+class ArchiveInProgress(Exception):
+    "Raised when an archival job is started while another one is running"
+
+
+class RunArchiver(object):
+    """
+    Moves old runs to the archive tables in batches, reporting progress as it goes.
+
+    Only one archival job runs at a time. Runs that are still heartbeating are not archived.
+
+    Parameters
+    ----------
+    pool : aiopg.Pool
+        connection pool to the metadata database
+    """
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.progress = {"state": "idle"}
+        self._task = None
+        self._stop = asyncio.Event()
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, older_than_days: float = ARCHIVE_OLDER_THAN_DAYS, batch_size: int = ARCHIVE_BATCH_SIZE,
+              max_runs_per_second: float = ARCHIVE_MAX_RUNS_PER_SECOND) -> Dict:
+        "Start archiving in the background, returning the initial progress"
+        if self.running:
+            raise ArchiveInProgress("An archival job is already running")
+        self._start_progress(older_than_days, batch_size, max_runs_per_second)
+        self._task = asyncio.get_event_loop().create_task(self._archive())
+        return self.progress
+
+    def cancel(self) -> bool:
+        "Stop the running job after the current batch. Returns False if no job is running."
+        if not self.running:
+            return False
+        self._stop.set()
+        return True
+
+    async def archive(self, older_than_days: float = ARCHIVE_OLDER_THAN_DAYS, batch_size: int = ARCHIVE_BATCH_SIZE,
+                      max_runs_per_second: float = ARCHIVE_MAX_RUNS_PER_SECOND) -> Dict:
+        """
+        Archive all runs created more than older_than_days ago.
+
+        Parameters
+        ----------
+        older_than_days : float
+            minimum age of the runs to archive
+        batch_size : int
+            number of runs moved per transaction
+        max_runs_per_second : float
+            upper limit for the archival rate, to bound the load on the database. 0 for no limit.
+
+        Returns
+        -------
+        Dict
+            final progress of the job
+        """
+        self._start_progress(older_than_days, batch_size, max_runs_per_second)
+        return await self._archive()
+
+    def _start_progress(self, older_than_days: float, batch_size: int, max_runs_per_second: float):
+        cutoff = int(round(time.time() * 1000)) - int(older_than_days * 24 * 60 * 60 * 1000)
+        self._stop = asyncio.Event()
+        self.progress = {
+            "state": "running",
+            "older_than_days": older_than_days,
+            "cutoff_ts_epoch": cutoff,
+            "batch_size": batch_size,
+            "max_runs_per_second": max_runs_per_second,
+            "runs_total": None,
+            "runs_archived": 0,
+            "rows_archived": {table_name: 0 for table_name in ARCHIVED_TABLES},
+            "started_at": int(time.time()),
+            "finished_at": None,
+            "error": None
+        }
+
+    async def _archive(self) -> Dict:
+        cutoff = self.progress["cutoff_ts_epoch"]
+        batch_size = self.progress["batch_size"]
+        max_runs_per_second = self.progress["max_runs_per_second"]
+        try:
+            self.progress["runs_total"] = await self.count_runs(cutoff)
+            while not self._stop.is_set():
+                started = time.monotonic()
+                archived = await self.archive_batch(cutoff, batch_size)
+                if not archived:
+                    break
+                if max_runs_per_second:
+                    await self._wait_for_stop(archived / max_runs_per_second - (time.monotonic() - started))
+            self.progress["state"] = "cancelled" if self._stop.is_set() else "completed"
+        except asyncio.CancelledError:
+            self.progress["state"] = "cancelled"
+        except Exception as ex:
+            self.progress["state"] = "failed"
+            self.progress["error"] = repr(ex)
+        finally:
+            self.progress["finished_at"] = int(time.time())
+        return self.progress
+
+    async def _wait_for_stop(self, timeout: float):
+        "Pause between batches, returning early when the job is cancelled"
+        try:
+            await asyncio.wait_for(self._stop.wait(), max(0, timeout))
+        except asyncio.TimeoutError:
+            pass
+
+    async def count_runs(self, cutoff: int) -> int:
+        "Number of runs to archive"
+        with (await self.pool.cursor()) as cur:
+            await cur.execute(
+                "SELECT count(*) FROM {} WHERE {}".format(RUN_TABLE_NAME, _archivable_condition()),
+                (cutoff, cutoff // 1000))
+            return (await cur.fetchone())[0]
+
+    async def archive_batch(self, cutoff: int, batch_size: int) -> int:
+        "Move a batch of runs with all related rows to the archive tables. Returns the number of archived runs."
+        with (await self.pool.cursor()) as cur:
+            await cur.execute("BEGIN")
+            try:
+                # Skip runs that are being archived by a concurrent job
+                await cur.execute(
+                    """
+                    SELECT flow_id, run_number FROM {table_name}
+                    WHERE {condition}
+                    ORDER BY ts_epoch
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                    """.format(table_name=RUN_TABLE_NAME, condition=_archivable_condition()),
+                    (cutoff, cutoff // 1000, batch_size))
+                runs = await cur.fetchall()
+                if runs:
+                    rows_archived = await _move_runs(cur, [run[0] for run in runs], [run[1] for run in runs])
+                await cur.execute("COMMIT")
+            except BaseException:
+                await cur.execute("ROLLBACK")
+                raise
+
+        if runs:
+            self.progress["runs_archived"] += len(runs)
+            for table_name, count in rows_archived.items():
+                self.progress["rows_archived"][table_name] += count
+        return len(runs)
+
+
+def _archivable_condition() -> str:
+    # last_heartbeat_ts is in seconds, ts_epoch in milliseconds
+    return "ts_epoch < %s AND (last_heartbeat_ts IS NULL OR last_heartbeat_ts < %s)"
+
+
+async def _table_columns(cur, table_name: str) -> List[str]:
+    "Names of the columns of a table, in order"
+    await cur.execute(
+        """
+        SELECT attname FROM pg_attribute
+        WHERE attrelid = %s::regclass AND attnum > 0 AND NOT attisdropped
+        ORDER BY attnum
+        """,
+        (table_name,))
+    return [row[0] for row in await cur.fetchall()]
+
+
+async def _archived_columns(cur, table_name: str) -> List[str]:
+    """
+    Columns moved from a table to its archive table.
+    Raises an error if the archive table lacks a column of the table, instead of dropping its values.
+    """
+    columns = await _table_columns(cur, table_name)
+    archive_columns = await _table_columns(cur, archive_table_name(table_name))
+    missing = [column for column in columns if column not in archive_columns]
+    if missing:
+        raise ValueError("Archive table {} lacks columns {} of {}, apply the migrations first".format(
+            archive_table_name(table_name), ", ".join(missing), table_name))
+    return columns
+
+
+async def _move_runs(cur, flow_ids: List[str], run_numbers: List[int]) -> Dict[str, int]:
+    rows_archived = {}
+    for table_name in ARCHIVED_TABLES:
+        columns = ", ".join('"{}"'.format(column) for column in await _archived_columns(cur, table_name))
+        await cur.execute(
+            """
+            WITH moved AS (
+                DELETE FROM {table_name}
+                WHERE (flow_id, run_number) IN (SELECT * FROM unnest(%s::text[], %s::bigint[]))
+                RETURNING {columns}
+            )
+            INSERT INTO {archive_table_name} ({columns}) SELECT {columns} FROM moved
+            """.format(table_name=table_name, archive_table_name=archive_table_name(table_name), columns=columns),
+            (flow_ids, run_numbers))
+        rows_archived[table_name] = cur.rowcount
+    return rows_archived
@@ -0,0 +1,15 @@
+-- +goose NO TRANSACTION
+-- +goose Up
+-- +goose StatementBegin
+
+-- artifacts of a task on run_id, newest attempt first, for selecting the latest attempt in SQL
+CREATE INDEX CONCURRENTLY IF NOT EXISTS artifact_v3_idx_flow_id_run_id_step_name_task_id_attempt_id ON artifact_v3 (
+    flow_id, run_id, step_name, task_id, attempt_id DESC) WHERE run_id IS NOT NULL;
+
+-- +goose StatementEnd
+
+-- +goose Down
+-- +goose StatementBegin
+DROP INDEX IF EXISTS artifact_v3_idx_flow_id_run_id_step_name_task_id_attempt_id;
+
+-- +goose StatementEnd
@@ -0,0 +1,133 @@
+-- +goose Up
+-- +goose StatementBegin
+SELECT 'up SQL query';
+
+-- Create monthly partitions of a table partitioned on ts_epoch (milliseconds), for the current month and
+-- months_ahead following months. New partitions continue from the upper bound of the latest partition
+-- and copy its primary key. Returns the number of created partitions.
+CREATE OR REPLACE FUNCTION create_ts_epoch_partitions(parent text, months_ahead integer DEFAULT 3) RETURNS integer
+    LANGUAGE plpgsql
+    AS $$
+DECLARE
+    template regclass;
+    primary_key text;
+    last_bound bigint;
+    partition_month timestamp;
+    partition_name text;
+    range_start bigint;
+    range_end bigint;
+    created integer := 0;
+BEGIN
+    -- Serialize concurrent calls, e.g. by several service instances starting up
+    PERFORM pg_advisory_xact_lock(hashtext('create_ts_epoch_partitions:' || parent));
+
+    SELECT inh.inhrelid::regclass,
+           substring(pg_get_expr(part.relpartbound, part.oid) from 'TO \(''?(-?\d+)''?\)')::bigint
+    INTO template, last_bound
+    FROM pg_inherits inh JOIN pg_class part ON part.oid = inh.inhrelid
+    WHERE inh.inhparent = parent::regclass
+    ORDER BY 2 DESC NULLS LAST
+    LIMIT 1;
+
+    SELECT pg_get_constraintdef(oid) INTO primary_key
+    FROM pg_constraint WHERE conrelid = template AND contype = 'p';
+
+    FOR month_offset IN 0..months_ahead LOOP
+        partition_month := date_trunc('month', now() AT TIME ZONE 'UTC') + month_offset * interval '1 month';
+        range_start := extract(epoch from partition_month) * 1000;
+        range_end := extract(epoch from partition_month + interval '1 month') * 1000;
+        CONTINUE WHEN range_end <= last_bound;
+
+        range_start := greatest(range_start, last_bound);
+        partition_name := parent || '_p' || to_char(partition_month, 'YYYYMM');
+
+        EXECUTE format('CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS INCLUDING STORAGE)', partition_name, parent);
+        IF primary_key IS NOT NULL THEN
+            EXECUTE format('ALTER TABLE %I ADD %s', partition_name, primary_key);
+        END IF;
+        -- Indexes of the parent are created on the partition when it is attached
+        EXECUTE format('ALTER TABLE %I ATTACH PARTITION %I FOR VALUES FROM (%s) TO (%s)',
+                       parent, partition_name, range_start, range_end);
+
+        created := created + 1;
+        last_bound := range_end;
+    END LOOP;
+    RETURN created;
+END;
+$$;
+
+-- Existing rows are kept in a legacy partition up to the start of next month,
+-- later rows go to monthly partitions. Attaching the legacy partition scans it once to validate the range.
+-- Notify triggers are dropped, and set up again on the partitioned table by the services.
+DO $$
+DECLARE
+    boundary bigint := extract(epoch from date_trunc('month', now() AT TIME ZONE 'UTC') + interval '1 month') * 1000;
+BEGIN
+    DROP TRIGGER IF EXISTS notify_ui_metadata_v3 ON metadata_v3;
+    DROP TRIGGER IF EXISTS notify_ui_metadata_v3_insert ON metadata_v3;
+    DROP TRIGGER IF EXISTS notify_ui_metadata_v3_update ON metadata_v3;
+    DROP TRIGGER IF EXISTS notify_ui_metadata_v3_delete ON metadata_v3;
+
+    ALTER TABLE metadata_v3 RENAME TO metadata_v3_legacy;
+    ALTER TABLE metadata_v3_legacy RENAME CONSTRAINT metadata_v3_pkey TO metadata_v3_legacy_pkey;
+    ALTER INDEX metadata_v3_akey RENAME TO metadata_v3_legacy_akey;
+
+    CREATE TABLE metadata_v3 (LIKE metadata_v3_legacy INCLUDING DEFAULTS INCLUDING STORAGE) PARTITION BY RANGE (ts_epoch);
+    EXECUTE format('ALTER SEQUENCE %s OWNED BY metadata_v3.id', pg_get_serial_sequence('metadata_v3_legacy', 'id'));
+    CREATE INDEX metadata_v3_akey ON metadata_v3 (flow_id, run_number, step_name, task_id, field_name);
+    EXECUTE format('ALTER TABLE metadata_v3 ATTACH PARTITION metadata_v3_legacy FOR VALUES FROM (MINVALUE) TO (%s)', boundary);
+
+    DROP TRIGGER IF EXISTS notify_ui_artifact_v3 ON artifact_v3;
+    DROP TRIGGER IF EXISTS notify_ui_artifact_v3_insert ON artifact_v3;
+    DROP TRIGGER IF EXISTS notify_ui_artifact_v3_update ON artifact_v3;
+    DROP TRIGGER IF EXISTS notify_ui_artifact_v3_delete ON artifact_v3;
+
+    ALTER TABLE artifact_v3 RENAME TO artifact_v3_legacy;
+    ALTER TABLE artifact_v3_legacy RENAME CONSTRAINT artifact_v3_pkey TO artifact_v3_legacy_pkey;
+    ALTER INDEX IF EXISTS artifact_v3_idx_flow_id_run_id_step_name_task_id_attempt_id
+        RENAME TO artifact_v3_legacy_idx_flow_id_run_id_step_name_task_id_attempt_id;
+
+    CREATE TABLE artifact_v3 (LIKE artifact_v3_legacy INCLUDING DEFAULTS INCLUDING STORAGE) PARTITION BY RANGE (ts_epoch);
+    CREATE INDEX artifact_v3_idx_flow_id_run_id_step_name_task_id_attempt_id ON artifact_v3 (
+        flow_id, run_id, step_name, task_id, attempt_id DESC) WHERE run_id IS NOT NULL;
+    EXECUTE format('ALTER TABLE artifact_v3 ATTACH PARTITION artifact_v3_legacy FOR VALUES FROM (MINVALUE) TO (%s)', boundary);
+END;
+$$;
+
+SELECT create_ts_epoch_partitions('metadata_v3');
+SELECT create_ts_epoch_partitions('artifact_v3');
+
+-- +goose StatementEnd
+
+-- +goose Down
+-- +goose StatementBegin
+SELECT 'down SQL query';
+
+-- Move rows of the monthly partitions back to the legacy tables, and restore these
+DO $$
+BEGIN
+    ALTER TABLE metadata_v3 DETACH PARTITION metadata_v3_legacy;
+    INSERT INTO metadata_v3_legacy SELECT * FROM metadata_v3;
+    EXECUTE format('ALTER SEQUENCE %s OWNED BY metadata_v3_legacy.id', pg_get_serial_sequence('metadata_v3', 'id'));
+    DROP TABLE metadata_v3;
+    DROP TRIGGER IF EXISTS notify_ui_metadata_v3 ON metadata_v3_legacy;
+
+    ALTER TABLE metadata_v3_legacy RENAME TO metadata_v3;
+    ALTER TABLE metadata_v3 RENAME CONSTRAINT metadata_v3_legacy_pkey TO metadata_v3_pkey;
+    ALTER INDEX metadata_v3_legacy_akey RENAME TO metadata_v3_akey;
+
+    ALTER TABLE artifact_v3 DETACH PARTITION artifact_v3_legacy;
+    INSERT INTO artifact_v3_legacy SELECT * FROM artifact_v3;
+    DROP TABLE artifact_v3;
+    DROP TRIGGER IF EXISTS notify_ui_artifact_v3 ON artifact_v3_legacy;
+
+    ALTER TABLE artifact_v3_legacy RENAME TO artifact_v3;
+    ALTER TABLE artifact_v3 RENAME CONSTRAINT artifact_v3_legacy_pkey TO artifact_v3_pkey;
+    ALTER INDEX artifact_v3_legacy_idx_flow_id_run_id_step_name_task_id_attempt_id
+        RENAME TO artifact_v3_idx_flow_id_run_id_step_name_task_id_attempt_id;
+END;
+$$;
+
+DROP FUNCTION IF EXISTS create_ts_epoch_partitions(text, integer);
+
+-- +goose StatementEnd
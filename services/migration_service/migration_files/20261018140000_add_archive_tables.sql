@@ -0,0 +1,33 @@
+-- +goose Up
+-- +goose StatementBegin
+SELECT 'up SQL query';
+
+-- Runs moved out of the main tables by the retention job of the migration service, together with
+-- their steps, tasks, metadata and artifacts. Archive tables have the columns and keys of the
+-- archived tables, but no foreign keys and no partitions.
+CREATE TABLE IF NOT EXISTS runs_v3_archive (LIKE runs_v3 INCLUDING INDEXES);
+CREATE TABLE IF NOT EXISTS steps_v3_archive (LIKE steps_v3 INCLUDING INDEXES);
+CREATE TABLE IF NOT EXISTS tasks_v3_archive (LIKE tasks_v3 INCLUDING INDEXES);
+
+CREATE TABLE IF NOT EXISTS metadata_v3_archive (
+    LIKE metadata_v3,
+    PRIMARY KEY (id, flow_id, run_number, step_name, task_id, field_name)
+);
+CREATE TABLE IF NOT EXISTS artifact_v3_archive (
+    LIKE artifact_v3,
+    PRIMARY KEY (flow_id, run_number, step_name, task_id, attempt_id, name)
+);
+
+-- +goose StatementEnd
+
+-- +goose Down
+-- +goose StatementBegin
+SELECT 'down SQL query';
+
+DROP TABLE IF EXISTS artifact_v3_archive;
+DROP TABLE IF EXISTS metadata_v3_archive;
+DROP TABLE IF EXISTS tasks_v3_archive;
+DROP TABLE IF EXISTS steps_v3_archive;
+DROP TABLE IF EXISTS runs_v3_archive;
+
+-- +goose StatementEnd
@@ -0,0 +1,35 @@
+-- +goose NO TRANSACTION
+-- +goose Up
+
+-- rows added to a run or step since a change token, for the `since` parameter of the list endpoints.
+-- Runs of a flow are already indexed on flow_id and ts_epoch. last_heartbeat_ts is left unindexed,
+-- so that heartbeats remain HOT updates.
+-- +goose StatementBegin
+CREATE INDEX CONCURRENTLY IF NOT EXISTS tasks_v3_idx_flow_id_run_number_step_name_ts_epoch ON tasks_v3 (
+    flow_id, run_number, step_name, ts_epoch);
+-- +goose StatementEnd
+
+-- metadata_v3 and artifact_v3 are partitioned, which does not allow creating indexes concurrently.
+-- The indexes are created on each partition, blocking inserts into the partition while it is built.
+-- +goose StatementBegin
+CREATE INDEX IF NOT EXISTS metadata_v3_idx_flow_id_run_number_ts_epoch ON metadata_v3 (
+    flow_id, run_number, ts_epoch);
+-- +goose StatementEnd
+
+-- +goose StatementBegin
+CREATE INDEX IF NOT EXISTS artifact_v3_idx_flow_id_run_number_ts_epoch ON artifact_v3 (
+    flow_id, run_number, ts_epoch);
+-- +goose StatementEnd
+
+-- +goose Down
+-- +goose StatementBegin
+DROP INDEX IF EXISTS artifact_v3_idx_flow_id_run_number_ts_epoch;
+-- +goose StatementEnd
+
+-- +goose StatementBegin
+DROP INDEX IF EXISTS metadata_v3_idx_flow_id_run_number_ts_epoch;
+-- +goose StatementEnd
+
+-- +goose StatementBegin
+DROP INDEX IF EXISTS tasks_v3_idx_flow_id_run_number_step_name_ts_epoch;
+-- +goose StatementEnd
@@ -0,0 +1,128 @@
+-- +goose Up
+-- +goose StatementBegin
+SELECT 'up SQL query';
+
+-- Summary of each attempt of a task, maintained by insert triggers on metadata_v3 and artifact_v3,
+-- so that task listings of the UI join a single row per attempt instead of aggregating the
+-- attempt metadata and _task_ok artifacts of every task.
+CREATE TABLE IF NOT EXISTS task_attempts_v3 (
+    flow_id VARCHAR(255) NOT NULL,
+    run_number BIGINT NOT NULL,
+    step_name VARCHAR(255) NOT NULL,
+    task_id BIGINT NOT NULL,
+    attempt_id INT NOT NULL,
+    started_at BIGINT,
+    attempt_finished_at BIGINT,
+    attempt_ok BOOLEAN,
+    task_ok_finished_at BIGINT,
+    task_ok_location TEXT,
+    PRIMARY KEY(flow_id, run_number, step_name, task_id, attempt_id)
+);
+
+-- Attempts of tasks are summarized as their metadata and artifacts are recorded.
+-- Metadata values are plain text, or JSON encoded for older clients, eg. '1', '"1"' or '[1]'.
+-- Values that are not attempt ids are skipped instead of failing the insert of the metadata.
+CREATE OR REPLACE FUNCTION task_attempts_v3_from_metadata() RETURNS TRIGGER AS $$
+DECLARE
+    _value TEXT := lower(trim(both '[]" ' from NEW.value::text));
+    _attempt_id INT;
+    _attempt_ok BOOLEAN;
+BEGIN
+    IF NEW.field_name = 'attempt_ok' THEN
+        _attempt_id := substring(NEW.tags::text from 'attempt_id:(\d{1,9})')::int;
+        IF _value IN ('true', 'false', 't', 'f') THEN
+            _attempt_ok := _value::boolean;
+        END IF;
+    ELSIF _value ~ '^\d{1,9}$' THEN
+        _attempt_id := _value::int;
+    END IF;
+    IF _attempt_id IS NOT NULL THEN
+        INSERT INTO task_attempts_v3 AS t
+            (flow_id, run_number, step_name, task_id, attempt_id, started_at, attempt_finished_at, attempt_ok)
+        VALUES (NEW.flow_id, NEW.run_number, NEW.step_name, NEW.task_id, _attempt_id,
+            CASE WHEN NEW.field_name = 'attempt' THEN NEW.ts_epoch END,
+            CASE WHEN NEW.field_name <> 'attempt' THEN NEW.ts_epoch END,
+            _attempt_ok)
+        ON CONFLICT (flow_id, run_number, step_name, task_id, attempt_id) DO UPDATE SET
+            started_at = GREATEST(t.started_at, EXCLUDED.started_at),
+            attempt_finished_at = GREATEST(t.attempt_finished_at, EXCLUDED.attempt_finished_at),
+            attempt_ok = GREATEST(t.attempt_ok, EXCLUDED.attempt_ok);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION task_attempts_v3_from_artifacts() RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO task_attempts_v3 AS t
+        (flow_id, run_number, step_name, task_id, attempt_id, task_ok_finished_at, task_ok_location)
+    VALUES (NEW.flow_id, NEW.run_number, NEW.step_name, NEW.task_id, NEW.attempt_id, NEW.ts_epoch, NEW.location)
+    ON CONFLICT (flow_id, run_number, step_name, task_id, attempt_id) DO UPDATE SET
+        task_ok_finished_at = GREATEST(t.task_ok_finished_at, EXCLUDED.task_ok_finished_at),
+        task_ok_location = GREATEST(t.task_ok_location, EXCLUDED.task_ok_location);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS task_attempts_v3_from_metadata ON metadata_v3;
+CREATE TRIGGER task_attempts_v3_from_metadata AFTER INSERT ON metadata_v3
+    FOR EACH ROW WHEN (NEW.field_name IN ('attempt', 'attempt-done', 'attempt_ok'))
+    EXECUTE PROCEDURE task_attempts_v3_from_metadata();
+
+DROP TRIGGER IF EXISTS task_attempts_v3_from_artifacts ON artifact_v3;
+CREATE TRIGGER task_attempts_v3_from_artifacts AFTER INSERT ON artifact_v3
+    FOR EACH ROW WHEN (NEW.name = '_task_ok')
+    EXECUTE PROCEDURE task_attempts_v3_from_artifacts();
+
+-- Summary of the attempts recorded before the triggers were set up
+INSERT INTO task_attempts_v3 AS t (flow_id, run_number, step_name, task_id, attempt_id, started_at,
+    attempt_finished_at, attempt_ok, task_ok_finished_at, task_ok_location)
+SELECT flow_id, run_number, step_name, task_id, attempt_id, max(started_at), max(attempt_finished_at),
+    bool_or(attempt_ok), max(task_ok_finished_at), max(task_ok_location)
+FROM (
+    SELECT flow_id, run_number, step_name, task_id,
+        CASE
+            WHEN field_name = 'attempt_ok' THEN substring(tags::text from 'attempt_id:(\d{1,9})')::int
+            WHEN trim(both '[]" ' from value::text) ~ '^\d{1,9}$' THEN trim(both '[]" ' from value::text)::int
+        END AS attempt_id,
+        CASE WHEN field_name = 'attempt' THEN ts_epoch END AS started_at,
+        CASE WHEN field_name <> 'attempt' THEN ts_epoch END AS attempt_finished_at,
+        CASE
+            WHEN field_name = 'attempt_ok'
+                AND lower(trim(both '[]" ' from value::text)) IN ('true', 'false', 't', 'f')
+            THEN lower(trim(both '[]" ' from value::text))::boolean
+        END AS attempt_ok,
+        NULL::bigint AS task_ok_finished_at,
+        NULL::text AS task_ok_location
+    FROM metadata_v3
+    WHERE field_name IN ('attempt', 'attempt-done', 'attempt_ok')
+    UNION ALL
+    SELECT flow_id, run_number, step_name, task_id, attempt_id, NULL, NULL, NULL, ts_epoch, location
+    FROM artifact_v3
+    WHERE name = '_task_ok'
+) a
+WHERE attempt_id IS NOT NULL
+GROUP BY flow_id, run_number, step_name, task_id, attempt_id
+ON CONFLICT (flow_id, run_number, step_name, task_id, attempt_id) DO UPDATE SET
+    started_at = GREATEST(t.started_at, EXCLUDED.started_at),
+    attempt_finished_at = GREATEST(t.attempt_finished_at, EXCLUDED.attempt_finished_at),
+    attempt_ok = GREATEST(t.attempt_ok, EXCLUDED.attempt_ok),
+    task_ok_finished_at = GREATEST(t.task_ok_finished_at, EXCLUDED.task_ok_finished_at),
+    task_ok_location = GREATEST(t.task_ok_location, EXCLUDED.task_ok_location);
+
+CREATE TABLE IF NOT EXISTS task_attempts_v3_archive (LIKE task_attempts_v3 INCLUDING INDEXES);
+
+-- +goose StatementEnd
+
+-- +goose Down
+-- +goose StatementBegin
+SELECT 'down SQL query';
+
+DROP TRIGGER IF EXISTS task_attempts_v3_from_artifacts ON artifact_v3;
+DROP TRIGGER IF EXISTS task_attempts_v3_from_metadata ON metadata_v3;
+DROP FUNCTION IF EXISTS task_attempts_v3_from_artifacts();
+DROP FUNCTION IF EXISTS task_attempts_v3_from_metadata();
+DROP TABLE IF EXISTS task_attempts_v3_archive;
+DROP TABLE IF EXISTS task_attempts_v3;
+
+-- +goose StatementEnd
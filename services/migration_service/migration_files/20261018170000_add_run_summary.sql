@@ -0,0 +1,124 @@
+-- +goose Up
+-- +goose StatementBegin
+SELECT 'up SQL query';
+
+-- Terminal state of each run, maintained by an insert trigger on the attempt and attempt_ok metadata
+-- of the end step, so that run listings of the UI do not look up the metadata of every run.
+CREATE TABLE IF NOT EXISTS run_summary_v3 (
+    flow_id VARCHAR(255) NOT NULL,
+    run_number BIGINT NOT NULL,
+    started_at BIGINT,
+    end_attempt_ok BOOLEAN,
+    end_attempt_ok_ts BIGINT,
+    end_attempt_ts BIGINT,
+    status VARCHAR(255),
+    finished_at BIGINT,
+    duration BIGINT,
+    PRIMARY KEY(flow_id, run_number)
+);
+
+-- status, finished_at and duration follow from the result of the end step
+CREATE OR REPLACE FUNCTION run_summary_v3_terminal_state() RETURNS TRIGGER AS $$
+BEGIN
+    IF NEW.end_attempt_ok IS TRUE THEN
+        NEW.status := 'completed';
+    ELSIF NEW.end_attempt_ok IS FALSE AND COALESCE(NEW.end_attempt_ts, 0) <= NEW.end_attempt_ok_ts THEN
+        NEW.status := 'failed';
+    ELSE
+        -- not finished yet, or a later attempt of the end step is running
+        NEW.status := NULL;
+    END IF;
+    NEW.finished_at := CASE WHEN NEW.status IS NOT NULL THEN NEW.end_attempt_ok_ts END;
+    NEW.duration := CASE
+        WHEN NEW.status = 'completed' OR NEW.end_attempt_ts IS NOT NULL
+        THEN NEW.finished_at - NEW.started_at
+    END;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS run_summary_v3_terminal_state ON run_summary_v3;
+CREATE TRIGGER run_summary_v3_terminal_state BEFORE INSERT OR UPDATE ON run_summary_v3
+    FOR EACH ROW EXECUTE PROCEDURE run_summary_v3_terminal_state();
+
+-- Metadata values are plain text, or JSON encoded for older clients, eg. 'True' or '["True"]'.
+-- Values that are not booleans are skipped instead of failing the insert of the metadata.
+CREATE OR REPLACE FUNCTION run_summary_v3_from_metadata() RETURNS TRIGGER AS $$
+DECLARE
+    _value TEXT := lower(trim(both '[]" ' from NEW.value::text));
+    _attempt_ok BOOLEAN;
+BEGIN
+    IF NEW.field_name = 'attempt_ok' THEN
+        IF _value NOT IN ('true', 'false', 't', 'f') THEN
+            RETURN NULL;
+        END IF;
+        _attempt_ok := _value::boolean;
+    END IF;
+    INSERT INTO run_summary_v3 AS s
+        (flow_id, run_number, started_at, end_attempt_ok, end_attempt_ok_ts, end_attempt_ts)
+    VALUES (NEW.flow_id, NEW.run_number,
+        (SELECT ts_epoch FROM runs_v3 WHERE flow_id = NEW.flow_id AND run_number = NEW.run_number),
+        _attempt_ok,
+        CASE WHEN NEW.field_name = 'attempt_ok' THEN NEW.ts_epoch END,
+        CASE WHEN NEW.field_name = 'attempt' THEN NEW.ts_epoch END)
+    ON CONFLICT (flow_id, run_number) DO UPDATE SET
+        -- the latest attempt_ok of the end step decides
+        end_attempt_ok = CASE
+            WHEN EXCLUDED.end_attempt_ok_ts >= COALESCE(s.end_attempt_ok_ts, 0)
+            THEN EXCLUDED.end_attempt_ok
+            ELSE s.end_attempt_ok
+        END,
+        end_attempt_ok_ts = GREATEST(s.end_attempt_ok_ts, EXCLUDED.end_attempt_ok_ts),
+        end_attempt_ts = GREATEST(s.end_attempt_ts, EXCLUDED.end_attempt_ts);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS run_summary_v3_from_metadata ON metadata_v3;
+CREATE TRIGGER run_summary_v3_from_metadata AFTER INSERT ON metadata_v3
+    FOR EACH ROW WHEN (NEW.step_name = 'end' AND NEW.field_name IN ('attempt', 'attempt_ok'))
+    EXECUTE PROCEDURE run_summary_v3_from_metadata();
+
+-- Summary of the runs recorded before the triggers were set up
+INSERT INTO run_summary_v3 AS s
+    (flow_id, run_number, started_at, end_attempt_ok, end_attempt_ok_ts, end_attempt_ts)
+SELECT m.flow_id, m.run_number, max(r.ts_epoch),
+    (array_agg(attempt_ok ORDER BY m.ts_epoch DESC) FILTER (WHERE attempt_ok IS NOT NULL))[1],
+    max(m.ts_epoch) FILTER (WHERE attempt_ok IS NOT NULL),
+    max(m.ts_epoch) FILTER (WHERE field_name = 'attempt')
+FROM (
+    SELECT flow_id, run_number, field_name, ts_epoch,
+        CASE
+            WHEN field_name = 'attempt_ok'
+                AND lower(trim(both '[]" ' from value::text)) IN ('true', 'false', 't', 'f')
+            THEN lower(trim(both '[]" ' from value::text))::boolean
+        END AS attempt_ok
+    FROM metadata_v3
+    WHERE step_name = 'end' AND field_name IN ('attempt', 'attempt_ok')
+) m
+LEFT JOIN runs_v3 r ON r.flow_id = m.flow_id AND r.run_number = m.run_number
+GROUP BY m.flow_id, m.run_number
+ON CONFLICT (flow_id, run_number) DO UPDATE SET
+    end_attempt_ok = CASE
+        WHEN EXCLUDED.end_attempt_ok_ts >= COALESCE(s.end_attempt_ok_ts, 0)
+        THEN EXCLUDED.end_attempt_ok
+        ELSE s.end_attempt_ok
+    END,
+    end_attempt_ok_ts = GREATEST(s.end_attempt_ok_ts, EXCLUDED.end_attempt_ok_ts),
+    end_attempt_ts = GREATEST(s.end_attempt_ts, EXCLUDED.end_attempt_ts);
+
+CREATE TABLE IF NOT EXISTS run_summary_v3_archive (LIKE run_summary_v3 INCLUDING INDEXES);
+
+-- +goose StatementEnd
+
+-- +goose Down
+-- +goose StatementBegin
+SELECT 'down SQL query';
+
+DROP TRIGGER IF EXISTS run_summary_v3_from_metadata ON metadata_v3;
+DROP FUNCTION IF EXISTS run_summary_v3_from_metadata();
+DROP TABLE IF EXISTS run_summary_v3_archive;
+DROP TABLE IF EXISTS run_summary_v3;
+DROP FUNCTION IF EXISTS run_summary_v3_terminal_state();
+
+-- +goose StatementEnd
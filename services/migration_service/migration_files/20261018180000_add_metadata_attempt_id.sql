@@ -0,0 +1,87 @@
+-- +goose NO TRANSACTION
+-- +goose Up
+
+-- Attempt that a metadata row was recorded for, parsed from its 'attempt_id:<n>' tag when the metadata is added,
+-- or from the value of 'attempt' and 'attempt-done' metadata without the tag. NULL for run-level metadata.
+-- The column is added to the archive table as well, so that archived metadata keeps it.
+-- +goose StatementBegin
+ALTER TABLE metadata_v3 ADD COLUMN IF NOT EXISTS attempt_id INT;
+-- +goose StatementEnd
+
+-- +goose StatementBegin
+ALTER TABLE metadata_v3_archive ADD COLUMN IF NOT EXISTS attempt_id INT;
+-- +goose StatementEnd
+
+-- Existing rows are backfilled in chunks of ids, each chunk committed on its own,
+-- so that no long running transaction holds locks on all rows of the table.
+-- +goose StatementBegin
+DO $$
+DECLARE
+    chunk_size CONSTANT bigint := 50000;
+    chunk_start bigint;
+    max_id bigint;
+BEGIN
+    SELECT min(id), max(id) INTO chunk_start, max_id FROM metadata_v3;
+    WHILE chunk_start <= max_id LOOP
+        UPDATE metadata_v3 SET attempt_id = COALESCE(
+            substring(tags::text from 'attempt_id:(\d{1,9})')::int,
+            CASE WHEN field_name IN ('attempt', 'attempt-done') AND trim(both '[]" ' from value) ~ '^\d{1,9}$'
+                THEN trim(both '[]" ' from value)::int END)
+        WHERE id >= chunk_start AND id < chunk_start + chunk_size AND attempt_id IS NULL;
+        COMMIT;
+        chunk_start := chunk_start + chunk_size;
+    END LOOP;
+END;
+$$;
+-- +goose StatementEnd
+
+-- +goose StatementBegin
+DO $$
+DECLARE
+    chunk_size CONSTANT bigint := 50000;
+    chunk_start bigint;
+    max_id bigint;
+BEGIN
+    SELECT min(id), max(id) INTO chunk_start, max_id FROM metadata_v3_archive;
+    WHILE chunk_start <= max_id LOOP
+        UPDATE metadata_v3_archive SET attempt_id = COALESCE(
+            substring(tags::text from 'attempt_id:(\d{1,9})')::int,
+            CASE WHEN field_name IN ('attempt', 'attempt-done') AND trim(both '[]" ' from value) ~ '^\d{1,9}$'
+                THEN trim(both '[]" ' from value)::int END)
+        WHERE id >= chunk_start AND id < chunk_start + chunk_size AND attempt_id IS NULL;
+        COMMIT;
+        chunk_start := chunk_start + chunk_size;
+    END LOOP;
+END;
+$$;
+-- +goose StatementEnd
+
+-- Lookups of the latest attempt_ok and attempt-done metadata of a step by the UI, one partial index per field name.
+-- Attempts of tasks and runs are looked up in the task_attempts_v3 and run_summary_v3 tables instead.
+-- metadata_v3 is partitioned, which does not allow creating indexes concurrently, see 20261018150000.
+-- +goose StatementBegin
+CREATE INDEX IF NOT EXISTS metadata_v3_idx_attempt_done ON metadata_v3 (
+    flow_id, run_number, step_name, ts_epoch) WHERE field_name = 'attempt-done';
+-- +goose StatementEnd
+
+-- +goose StatementBegin
+CREATE INDEX IF NOT EXISTS metadata_v3_idx_attempt_ok ON metadata_v3 (
+    flow_id, run_number, step_name, ts_epoch) WHERE field_name = 'attempt_ok';
+-- +goose StatementEnd
+
+-- +goose Down
+-- +goose StatementBegin
+DROP INDEX IF EXISTS metadata_v3_idx_attempt_ok;
+-- +goose StatementEnd
+
+-- +goose StatementBegin
+DROP INDEX IF EXISTS metadata_v3_idx_attempt_done;
+-- +goose StatementEnd
+
+-- +goose StatementBegin
+ALTER TABLE metadata_v3_archive DROP COLUMN IF EXISTS attempt_id;
+-- +goose StatementEnd
+
+-- +goose StatementBegin
+ALTER TABLE metadata_v3 DROP COLUMN IF EXISTS attempt_id;
+-- +goose StatementEnd
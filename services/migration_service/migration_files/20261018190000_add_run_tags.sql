@@ -0,0 +1,84 @@
+-- +goose Up
+-- +goose StatementBegin
+SELECT 'up SQL query';
+
+-- Dictionary of the tags and system tags of runs, maintained by a trigger on the runs table,
+-- so that tag listings and autocomplete of the UI do not expand the tags of every run.
+CREATE TABLE IF NOT EXISTS run_tags_v3 (
+    tag TEXT COLLATE "C" NOT NULL,
+    run_count BIGINT NOT NULL,
+    last_seen_ts BIGINT,
+    PRIMARY KEY(tag)
+);
+
+-- Tags that are not JSON arrays, eg. NULL, are treated as empty instead of failing the insert of the run.
+CREATE OR REPLACE FUNCTION run_tags_v3_of(tags JSONB, system_tags JSONB) RETURNS TEXT[] AS $$
+    SELECT COALESCE(array_agg(DISTINCT tag ORDER BY tag), '{}')
+    FROM jsonb_array_elements_text(
+        CASE WHEN jsonb_typeof(tags) = 'array' THEN tags ELSE '[]' END ||
+        CASE WHEN jsonb_typeof(system_tags) = 'array' THEN system_tags ELSE '[]' END
+    ) AS tag
+    WHERE tag IS NOT NULL
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Tags are upserted in order, so that concurrent inserts of runs with the same tags do not deadlock.
+CREATE OR REPLACE FUNCTION run_tags_v3_from_runs() RETURNS TRIGGER AS $$
+DECLARE
+    _new TEXT[] := '{}';
+    _old TEXT[] := '{}';
+    _seen_ts BIGINT;
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        _new := run_tags_v3_of(NEW.tags, NEW.system_tags);
+        _seen_ts := NEW.ts_epoch;
+    ELSIF TG_OP = 'UPDATE' THEN
+        _new := run_tags_v3_of(NEW.tags, NEW.system_tags);
+        _old := run_tags_v3_of(OLD.tags, OLD.system_tags);
+        _seen_ts := extract(epoch from now())::bigint * 1000;
+    ELSE
+        _old := run_tags_v3_of(OLD.tags, OLD.system_tags);
+    END IF;
+
+    INSERT INTO run_tags_v3 AS t (tag, run_count, last_seen_ts)
+    SELECT tag, 1, _seen_ts FROM unnest(_new) AS tag
+    WHERE tag <> ALL(_old)
+    ORDER BY tag
+    ON CONFLICT (tag) DO UPDATE SET
+        run_count = t.run_count + 1,
+        last_seen_ts = GREATEST(t.last_seen_ts, EXCLUDED.last_seen_ts);
+
+    UPDATE run_tags_v3 SET run_count = run_count - 1
+    WHERE tag = ANY(_old) AND tag <> ALL(_new);
+    DELETE FROM run_tags_v3
+    WHERE tag = ANY(_old) AND tag <> ALL(_new) AND run_count <= 0;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Heartbeats do not update the tags, and do not fire the trigger
+DROP TRIGGER IF EXISTS run_tags_v3_from_runs ON runs_v3;
+CREATE TRIGGER run_tags_v3_from_runs AFTER INSERT OR DELETE OR UPDATE OF tags, system_tags ON runs_v3
+    FOR EACH ROW EXECUTE PROCEDURE run_tags_v3_from_runs();
+
+-- Tags of the runs recorded before the trigger was set up. Creating the trigger blocks inserts of runs
+-- until the migration commits, so that no run is counted twice.
+INSERT INTO run_tags_v3 AS t (tag, run_count, last_seen_ts)
+SELECT tag, count(*), max(ts_epoch)
+FROM runs_v3, unnest(run_tags_v3_of(tags, system_tags)) AS tag
+GROUP BY tag
+ON CONFLICT (tag) DO UPDATE SET
+    run_count = EXCLUDED.run_count,
+    last_seen_ts = GREATEST(t.last_seen_ts, EXCLUDED.last_seen_ts);
+
+-- +goose StatementEnd
+
+-- +goose Down
+-- +goose StatementBegin
+SELECT 'down SQL query';
+
+DROP TRIGGER IF EXISTS run_tags_v3_from_runs ON runs_v3;
+DROP FUNCTION IF EXISTS run_tags_v3_from_runs();
+DROP FUNCTION IF EXISTS run_tags_v3_of(JSONB, JSONB);
+DROP TABLE IF EXISTS run_tags_v3;
+
+-- +goose StatementEnd
@@ -0,0 +1,23 @@
+-- +goose NO TRANSACTION
+-- +goose Up
+
+-- Final status, finish time and duration of runs, for filters and sorts of the run listings of the UI.
+-- Runs without a final status yet are not looked up by status, so they are left out of the indexes.
+-- +goose StatementBegin
+CREATE INDEX CONCURRENTLY IF NOT EXISTS run_summary_v3_idx_status_finished_at ON run_summary_v3 (
+    status, finished_at) WHERE status IS NOT NULL;
+-- +goose StatementEnd
+
+-- +goose StatementBegin
+CREATE INDEX CONCURRENTLY IF NOT EXISTS run_summary_v3_idx_status_duration ON run_summary_v3 (
+    status, duration) WHERE status IS NOT NULL;
+-- +goose StatementEnd
+
+-- +goose Down
+-- +goose StatementBegin
+DROP INDEX IF EXISTS run_summary_v3_idx_status_duration;
+-- +goose StatementEnd
+
+-- +goose StatementBegin
+DROP INDEX IF EXISTS run_summary_v3_idx_status_finished_at;
+-- +goose StatementEnd
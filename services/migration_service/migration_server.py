@@ -7,6 +7,7 @@ from aiohttp_swagger import *
 from subprocess import Popen, PIPE
 
 from .api.admin import AdminApi
+from .api.archive import ArchiveApi
 
 from .data.postgres_async_db import AsyncPostgresDB
 from services.utils import DBConfiguration
@@ -20,6 +21,7 @@ def app(loop=None, db_conf: DBConfiguration = None):
     async_db = AsyncPostgresDB()
     loop.run_until_complete(async_db._init(db_conf))
     AdminApi(app)
+    ArchiveApi(app)
     setup_swagger(app)
     return app
 
@@ -0,0 +1,4 @@
+import pytest
+
+# we need to register the utils helper for assert rewriting in order to get descriptive assertion errors.
+pytest.register_assert_rewrite("services.migration_service.tests.integration_tests.utils")
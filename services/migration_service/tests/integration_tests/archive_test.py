@@ -0,0 +1,203 @@
+from .utils import (
+    init_app, init_db, clean_db,
+    add_flow, add_run, add_old_run, count_rows
+)
+from services.migration_service.data.retention import ARCHIVED_TABLES, RunArchiver, archive_table_name
+import asyncio
+import time
+import pytest
+pytestmark = [pytest.mark.integration_tests]
+
+# Fixtures begin
+
+
+@pytest.fixture
+def cli(loop, aiohttp_client):
+    return init_app(loop, aiohttp_client)
+
+
+@pytest.fixture
+async def db(cli):
+    async_db = await init_db(cli)
+    yield async_db
+    await clean_db(async_db)
+
+# Fixtures end
+
+
+async def test_archive_old_runs(db):
+    _flow = (await add_flow(db)).body
+    await add_old_run(db, flow_id=_flow["flow_id"])
+    _run = (await add_run(db, flow_id=_flow["flow_id"])).body
+
+    progress = await RunArchiver(db.pool).archive(older_than_days=1, batch_size=10, max_runs_per_second=0)
+
+    # only the old run is archived, with everything related to it
+    assert progress["state"] == "completed"
+    assert progress["runs_total"] == 1
+    assert progress["runs_archived"] == 1
+    # the run has no summary, as it has no end step
+    assert progress["rows_archived"] == {
+        db.run_summary_table_postgres.table_name: 0,
+        db.task_attempt_table_postgres.table_name: 1,
+        db.metadata_table_postgres.table_name: 1,
+        db.artifact_table_postgres.table_name: 1,
+        db.task_table_postgres.table_name: 1,
+        db.step_table_postgres.table_name: 1,
+        db.run_table_postgres.table_name: 1,
+    }
+    for table_name, count in progress["rows_archived"].items():
+        assert await count_rows(db, archive_table_name(table_name)) == count
+
+    _runs = (await db.run_table_postgres.find_records(conditions=["flow_id = %s"], values=[_flow["flow_id"]]))[0].body
+    assert [run["run_number"] for run in _runs] == [_run["run_number"]]
+    assert await count_rows(db, db.task_table_postgres.table_name) == 0
+
+    # archiving again finds nothing to do
+    progress = await RunArchiver(db.pool).archive(older_than_days=1, batch_size=10, max_runs_per_second=0)
+    assert progress["state"] == "completed"
+    assert progress["runs_total"] == 0
+    assert progress["runs_archived"] == 0
+
+
+async def test_archive_skips_heartbeating_runs(db):
+    _flow = (await add_flow(db)).body
+    _old_run = await add_old_run(db, flow_id=_flow["flow_id"])
+    with (await db.pool.cursor()) as cur:
+        await cur.execute(
+            "UPDATE {} SET last_heartbeat_ts = extract(epoch from now())::bigint WHERE run_number = %s".format(
+                db.run_table_postgres.table_name),
+            (_old_run["run_number"],))
+
+    progress = await RunArchiver(db.pool).archive(older_than_days=1, batch_size=10, max_runs_per_second=0)
+    assert progress["runs_total"] == 0
+    assert progress["runs_archived"] == 0
+    assert await count_rows(db, db.run_table_postgres.table_name) == 1
+
+
+async def test_archive_moves_columns_by_name(db):
+    _flow = (await add_flow(db)).body
+    await add_old_run(db, flow_id=_flow["flow_id"])
+    await add_old_run(db, flow_id=_flow["flow_id"])
+    run_table = db.run_table_postgres.table_name
+    run_archive_table = archive_table_name(run_table)
+
+    try:
+        # A column that was added to the archive table only is left empty
+        with (await db.pool.cursor()) as cur:
+            await cur.execute("ALTER TABLE {} ADD COLUMN archive_only int".format(run_archive_table))
+        progress = await RunArchiver(db.pool).archive(older_than_days=1, batch_size=1, max_runs_per_second=0)
+        assert progress["state"] == "completed"
+        assert progress["runs_archived"] == 2
+
+        # A column missing from the archive table fails the job, instead of dropping its values
+        await add_old_run(db, flow_id=_flow["flow_id"])
+        with (await db.pool.cursor()) as cur:
+            await cur.execute("ALTER TABLE {} ADD COLUMN live_only int".format(run_table))
+        progress = await RunArchiver(db.pool).archive(older_than_days=1, batch_size=1, max_runs_per_second=0)
+        assert progress["state"] == "failed"
+        assert "live_only" in progress["error"]
+        assert progress["runs_archived"] == 0
+        assert list(progress["rows_archived"].values()) == [0] * len(ARCHIVED_TABLES)
+        assert await count_rows(db, run_table) == 1
+        assert await count_rows(db, run_archive_table) == 2
+    finally:
+        with (await db.pool.cursor()) as cur:
+            await cur.execute("ALTER TABLE {} DROP COLUMN IF EXISTS live_only".format(run_table))
+            await cur.execute("ALTER TABLE {} DROP COLUMN IF EXISTS archive_only".format(run_archive_table))
+
+
+async def test_archive_batches(db):
+    _flow = (await add_flow(db)).body
+    for _ in range(5):
+        await add_old_run(db, flow_id=_flow["flow_id"])
+
+    archiver = RunArchiver(db.pool)
+    archiver._start_progress(older_than_days=1, batch_size=2, max_runs_per_second=0)
+    cutoff = archiver.progress["cutoff_ts_epoch"]
+
+    # each batch moves at most batch_size runs
+    assert [await archiver.archive_batch(cutoff, 2) for _ in range(4)] == [2, 2, 1, 0]
+    assert archiver.progress["runs_archived"] == 5
+    assert archiver.progress["rows_archived"][db.task_table_postgres.table_name] == 5
+
+
+async def test_archive_rate_limit(db):
+    _flow = (await add_flow(db)).body
+    for _ in range(3):
+        await add_old_run(db, flow_id=_flow["flow_id"])
+
+    # Three batches of one run at two runs per second take at least one and a half seconds
+    started = time.monotonic()
+    progress = await RunArchiver(db.pool).archive(older_than_days=1, batch_size=1, max_runs_per_second=2)
+    assert progress["state"] == "completed"
+    assert progress["runs_archived"] == 3
+    assert time.monotonic() - started >= 1.5
+
+
+async def test_archive_run_tags(db):
+    _flow = (await add_flow(db)).body
+    await add_old_run(db, flow_id=_flow["flow_id"], tags=["archived_tag", "shared_tag"])
+    await add_run(db, flow_id=_flow["flow_id"], tags=["shared_tag"])
+
+    progress = await RunArchiver(db.pool).archive(older_than_days=1, batch_size=10, max_runs_per_second=0)
+    assert progress["runs_archived"] == 1
+
+    # archived runs no longer count towards the tag dictionary
+    _tags = (await db.run_tag_table_postgres.find_records(
+        conditions=["tag IN (%s, %s)"], values=["archived_tag", "shared_tag"]))[0].body
+    assert [(tag["tag"], tag["run_count"]) for tag in _tags] == [("shared_tag", 1)]
+
+
+async def test_archive_api(cli, db):
+    _flow = (await add_flow(db)).body
+    for _ in range(3):
+        await add_old_run(db, flow_id=_flow["flow_id"])
+
+    response = await cli.get("/archive")
+    assert response.status == 200
+    assert (await response.json()) == {"state": "idle"}
+
+    for params in [{"older_than_days": "a"}, {"batch_size": 0}, {"max_runs_per_second": -1}]:
+        response = await cli.post("/archive", params=params)
+        assert response.status == 400
+
+    # one run per second keeps the job running while it is inspected
+    params = {"older_than_days": 1, "batch_size": 1, "max_runs_per_second": 1}
+    response = await cli.post("/archive", params=params)
+    assert response.status == 202
+    progress = await response.json()
+    assert progress["state"] == "running"
+    assert progress["batch_size"] == 1
+
+    response = await cli.post("/archive", params=params)
+    assert response.status == 409
+    assert (await response.json())["progress"]["state"] == "running"
+
+    response = await cli.delete("/archive")
+    assert response.status == 200
+
+    # the job stops at the end of the current batch
+    for _ in range(50):
+        progress = await (await cli.get("/archive")).json()
+        if progress["state"] != "running":
+            break
+        await asyncio.sleep(0.1)
+    assert progress["state"] == "cancelled"
+    assert progress["finished_at"] is not None
+    assert progress["runs_archived"] < 3
+
+    response = await cli.delete("/archive")
+    assert response.status == 404
+
+    # a new job archives the remaining runs
+    response = await cli.post("/archive", params={"older_than_days": 1, "max_runs_per_second": 0})
+    assert response.status == 202
+    for _ in range(50):
+        progress = await (await cli.get("/archive")).json()
+        if progress["state"] != "running":
+            break
+        await asyncio.sleep(0.1)
+    assert progress["state"] == "completed"
+    assert await count_rows(db, db.run_table_postgres.table_name) == 0
+    assert await count_rows(db, archive_table_name(db.run_table_postgres.table_name)) == 3
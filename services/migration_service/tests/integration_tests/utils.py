@@ -0,0 +1,178 @@
+import json
+
+from aiohttp import web
+from services.data.postgres_async_db import AsyncPostgresDB
+from services.utils.tests import get_test_dbconf
+from services.migration_service.api.admin import AdminApi
+from services.migration_service.api.archive import ArchiveApi
+from services.migration_service.data.postgres_async_db import \
+    AsyncPostgresDB as MigrationAsyncPostgresDB
+
+# Test fixture helpers begin
+
+
+def init_app(loop, aiohttp_client):
+    app = web.Application()
+
+    AdminApi(app)
+    ArchiveApi(app)
+
+    return loop.run_until_complete(aiohttp_client(app))
+
+
+async def init_db(cli):
+    db_conf = get_test_dbconf()
+
+    migration_db = MigrationAsyncPostgresDB.get_instance()
+    await migration_db._init(db_conf)
+
+    # Apply migrations and make sure "is_up_to_date" == True
+    await cli.patch("/upgrade")
+    status = await (await cli.get("/db_schema_status")).json()
+    assert status["is_up_to_date"] is True
+
+    # The metadata service tables are used to add rows to archive
+    db = AsyncPostgresDB.get_instance()
+    await db._init(db_conf)
+    return db
+
+
+async def clean_db(db: AsyncPostgresDB):
+    # Tables to clean (order is important due to foreign keys)
+    tables = [
+        db.run_summary_table_postgres,
+        db.task_attempt_table_postgres,
+        db.metadata_table_postgres,
+        db.artifact_table_postgres,
+        db.task_table_postgres,
+        db.step_table_postgres,
+        db.run_table_postgres,
+        db.run_tag_table_postgres,
+        db.flow_table_postgres
+    ]
+    for table in tables:
+        await table.execute_sql(select_sql="DELETE FROM {}".format(table.table_name))
+        if table.archive_table_name:
+            await table.execute_sql(select_sql="DELETE FROM {}".format(table.archive_table_name))
+
+# Test fixture helpers end
+
+# Row helpers begin
+
+
+async def add_flow(db: AsyncPostgresDB, flow_id="HelloFlow",
+                   user_name="dipper", tags=["foo:bar"], system_tags=["runtime:dev"]):
+    flow = {
+        "flow_id": flow_id,
+        "user_name": user_name,
+        "tags": json.dumps(tags),
+        "system_tags": json.dumps(system_tags)
+    }
+    return await db.flow_table_postgres.create_record(flow)
+
+
+async def add_run(db: AsyncPostgresDB, flow_id="HelloFlow",
+                  user_name="dipper", tags=["foo:bar"], system_tags=["runtime:dev"],
+                  last_heartbeat_ts: int = None):
+    run = {
+        "flow_id": flow_id,
+        "user_name": user_name,
+        "tags": json.dumps(tags),
+        "system_tags": json.dumps(system_tags),
+        "last_heartbeat_ts": last_heartbeat_ts
+    }
+    return await db.run_table_postgres.create_record(run)
+
+
+async def add_step(db: AsyncPostgresDB, flow_id="HelloFlow",
+                   run_number: int = None, step_name="step",
+                   user_name="dipper", tags=["foo:bar"], system_tags=["runtime:dev"]):
+    step = {
+        "flow_id": flow_id,
+        "run_number": run_number,
+        "step_name": step_name,
+        "user_name": user_name,
+        "tags": json.dumps(tags),
+        "system_tags": json.dumps(system_tags)
+    }
+    return await db.step_table_postgres.create_record(step)
+
+
+async def add_task(db: AsyncPostgresDB, flow_id="HelloFlow",
+                   run_number: int = None, step_name="step",
+                   user_name="dipper", tags=["foo:bar"], system_tags=["runtime:dev"]):
+    task = {
+        "flow_id": flow_id,
+        "run_number": run_number,
+        "step_name": step_name,
+        "user_name": user_name,
+        "tags": json.dumps(tags),
+        "system_tags": json.dumps(system_tags)
+    }
+    return await db.task_table_postgres.create_record(task)
+
+
+async def add_metadata(db: AsyncPostgresDB, flow_id="HelloFlow",
+                       run_number: int = None, step_name="step", task_id=None,
+                       metadata={},
+                       user_name="dipper", tags=["foo:bar"], system_tags=["runtime:dev"]):
+    values = {
+        "flow_id": flow_id,
+        "run_number": run_number,
+        "step_name": step_name,
+        "task_id": str(task_id),
+        "field_name": metadata.get("field_name", " "),
+        "value": metadata.get("value", " "),
+        "type": metadata.get("type", " "),
+        "user_name": user_name,
+        "tags": json.dumps(tags),
+        "system_tags": json.dumps(system_tags)
+    }
+    return await db.metadata_table_postgres.create_record(values)
+
+
+async def add_artifact(db: AsyncPostgresDB, flow_id="HelloFlow",
+                       run_number: int = None, step_name="step", task_id=None,
+                       artifact={},
+                       user_name="dipper", tags=["foo:bar"], system_tags=["runtime:dev"]):
+    values = {
+        "flow_id": flow_id,
+        "run_number": run_number,
+        "step_name": step_name,
+        "task_id": str(task_id),
+        "name": artifact.get("name", " "),
+        "location": artifact.get("location", " "),
+        "ds_type": artifact.get("ds_type", " "),
+        "sha": artifact.get("sha", " "),
+        "type": artifact.get("type", " "),
+        "content_type": artifact.get("content_type", " "),
+        "attempt_id": artifact.get("attempt_id", 0),
+        "user_name": user_name,
+        "tags": json.dumps(tags),
+        "system_tags": json.dumps(system_tags)
+    }
+    return await db.artifact_table_postgres.create_record(values)
+
+
+async def add_old_run(db: AsyncPostgresDB, flow_id="HelloFlow", tags=["foo:bar"]):
+    "Add a run created at the epoch, with a step, a task, a metadata row and an artifact"
+    _run = (await add_run(db, flow_id=flow_id, tags=tags)).body
+    _step = (await add_step(db, flow_id=flow_id, run_number=_run["run_number"])).body
+    _task = (await add_task(db, flow_id=flow_id, run_number=_run["run_number"], step_name=_step["step_name"])).body
+    await add_metadata(db, flow_id=flow_id, run_number=_run["run_number"], step_name=_step["step_name"],
+                       task_id=_task["task_id"], metadata={"field_name": "attempt", "value": "0", "type": "attempt"})
+    await add_artifact(db, flow_id=flow_id, run_number=_run["run_number"], step_name=_step["step_name"],
+                       task_id=_task["task_id"], artifact={"name": "_task_ok"})
+    with (await db.pool.cursor()) as cur:
+        await cur.execute(
+            "UPDATE {} SET ts_epoch = 0 WHERE flow_id = %s AND run_number = %s".format(db.run_table_postgres.table_name),
+            (flow_id, _run["run_number"]))
+    return _run
+
+
+async def count_rows(db: AsyncPostgresDB, table_name: str) -> int:
+    with (await db.pool.cursor()) as cur:
+        await cur.execute("SELECT count(*) FROM {}".format(table_name))
+        return (await cur.fetchone())[0]
+
+# Row helpers end
@@ -0,0 +1,103 @@
+import pytest
+from click.testing import CliRunner
+
+import migration_tools
+
+pytestmark = [pytest.mark.unit_tests]
+
+
+class MockResponse(object):
+    def __init__(self, body, status_code=200):
+        self.body = body
+        self.status_code = status_code
+
+    def json(self):
+        return self.body
+
+
+@pytest.fixture
+def requests_log(monkeypatch):
+    "Records the requests of the tools, answering them from a list of responses per method"
+    log = []
+    responses = {"GET": [], "POST": [], "DELETE": []}
+
+    def _request(method):
+        def _send(url, params=None):
+            log.append((method, url, params))
+            return responses[method].pop(0)
+        return _send
+
+    monkeypatch.setattr(migration_tools.requests, "get", _request("GET"))
+    monkeypatch.setattr(migration_tools.requests, "post", _request("POST"))
+    monkeypatch.setattr(migration_tools.requests, "delete", _request("DELETE"))
+    monkeypatch.setattr(migration_tools.time, "sleep", lambda seconds: None)
+    return log, responses
+
+
+def _progress(state, runs_archived=0):
+    return {"state": state, "runs_archived": runs_archived, "runs_total": 2}
+
+
+def test_archive(requests_log):
+    log, responses = requests_log
+    responses["POST"].append(MockResponse(_progress("running"), status_code=202))
+
+    result = CliRunner().invoke(migration_tools.cli, [
+        "archive", "--base-url", "http://localhost:8082", "--older-than-days", "30", "--batch-size", "10"])
+
+    assert result.exit_code == 0
+    # options that are not given are left to the defaults of the service
+    assert log == [("POST", "http://localhost:8082/archive", {"older_than_days": 30.0, "batch_size": 10})]
+    assert "running" in result.output
+
+
+def test_archive_wait(requests_log):
+    log, responses = requests_log
+    responses["POST"].append(MockResponse(_progress("running"), status_code=202))
+    responses["GET"].extend([MockResponse(_progress("running", 1)), MockResponse(_progress("completed", 2))])
+
+    result = CliRunner().invoke(migration_tools.cli, [
+        "archive", "--base-url", "http://localhost:8082", "--max-runs-per-second", "0", "--wait"])
+
+    assert result.exit_code == 0
+    assert log == [
+        ("POST", "http://localhost:8082/archive", {"max_runs_per_second": 0.0}),
+        ("GET", "http://localhost:8082/archive", None),
+        ("GET", "http://localhost:8082/archive", None),
+    ]
+    assert "running: 1/2 runs archived" in result.output
+    assert "completed: 2/2 runs archived" in result.output
+
+
+def test_archive_wait_not_started(requests_log):
+    log, responses = requests_log
+    responses["POST"].append(MockResponse({"detail": "An archival job is already running"}, status_code=409))
+
+    result = CliRunner().invoke(migration_tools.cli, ["archive", "--base-url", "http://localhost:8082", "--wait"])
+
+    # progress is not polled when the job was not started
+    assert result.exit_code == 0
+    assert [method for method, *_ in log] == ["POST"]
+    assert "already running" in result.output
+
+
+def test_archive_status(requests_log):
+    log, responses = requests_log
+    responses["GET"].append(MockResponse(_progress("completed", 2)))
+
+    result = CliRunner().invoke(migration_tools.cli, ["archive-status", "--base-url", "http://localhost:8082"])
+
+    assert result.exit_code == 0
+    assert log == [("GET", "http://localhost:8082/archive", None)]
+    assert "completed" in result.output
+
+
+def test_archive_cancel(requests_log):
+    log, responses = requests_log
+    responses["DELETE"].append(MockResponse({"detail": "archival job cancelled"}))
+
+    result = CliRunner().invoke(migration_tools.cli, ["archive-cancel", "--base-url", "http://localhost:8082"])
+
+    assert result.exit_code == 0
+    assert log == [("DELETE", "http://localhost:8082/archive", None)]
+    assert "cancelled" in result.output
@@ -4,6 +4,7 @@ import asyncio
 
 from aiohttp import web
 from multidict import MultiDict
+from services.data.metrics import export_metrics
 from services.utils import (METADATA_SERVICE_HEADER, METADATA_SERVICE_VERSION,
                             SERVICE_BUILD_TIMESTAMP, SERVICE_COMMIT_HASH,
                             web_response)
@@ -31,6 +32,7 @@ class AdminApi(object):
         app.router.add_route("GET", "/links", self.links)
         app.router.add_route("GET", "/notifications", self.get_notifications)
         app.router.add_route("GET", "/status", self.status)
+        app.router.add_route("GET", "/metrics", self.metrics)
 
         defaults = [
             {"href": 'https://docs.metaflow.org/', "label": 'Documentation'},
@@ -73,6 +75,23 @@ class AdminApi(object):
         return web.Response(text="pong", headers=MultiDict(
             {METADATA_SERVICE_HEADER: METADATA_SERVICE_VERSION}))
 
+    async def metrics(self, request):
+        """
+        ---
+        description: Returns database latency, connection pool and error metrics in the Prometheus text format
+        tags:
+        - Admin
+        produces:
+        - 'text/plain'
+        responses:
+            "200":
+                description: successful operation. Return metrics
+            "405":
+                description: invalid HTTP Method
+        """
+        body, content_type = export_metrics()
+        return web.Response(body=body, headers={"Content-Type": content_type})
+
     async def links(self, request):
         """
         ---
@@ -1,19 +1,36 @@
+from typing import Dict, List
+
 from services.utils import handle_exceptions, logging
 from services.data.db_utils import DBResponse, DBPagination, translate_run_key
+from ..data.tag_index import TagIndex
 from .utils import format_response_list, web_response, custom_conditions_query, pagination_query, operators_to_filters
-import sys
 import asyncio
 
 TAGS_FILL_INTERVAL_SECONDS = 60 * 5
+# Tags of inserted runs are added as they are notified, the full rebuild only drops tags of deleted runs.
+TAGS_REBUILD_INTERVAL_SECONDS = 60 * 60
 
 
 class AutoCompleteApi(object):
+    """
+    Autocomplete endpoints.
+
+    Parameters
+    ----------
+    app : aiohttp.web.Application
+    db : AsyncPostgresDB
+    event_emitter : AsyncIOEventEmitter (optional)
+        emitter of database change notifications. When given, tags of inserted runs are added to the
+        cached tags as they are notified, and the cached tags are rebuilt less often.
+    """
 
-    def __init__(self, app, db):
+    def __init__(self, app, db, event_emitter=None):
         self.db = db
         # Cached resources
         # Cache tags so we don't have to request DB everytime
-        self.tags = []
+        self.tags = TagIndex()
+        # Tags added while the cached tags are rebuilt, to add to the rebuilt index
+        self._tags_added_during_rebuild = None
         self.logger = logging.getLogger("AutoCompleteApi")
         app.router.add_route("GET", "/tags/autocomplete", self.get_tags)
         # Non-cached resources
@@ -21,28 +38,51 @@ class AutoCompleteApi(object):
         app.router.add_route("GET", "/flows/{flow_id}/runs/autocomplete", self.get_runs_for_flow)
         app.router.add_route("GET", "/flows/{flow_id}/runs/{run_id}/steps/autocomplete", self.get_steps_for_run)
         app.router.add_route("GET", "/flows/{flow_id}/runs/{run_id}/artifacts/autocomplete", self.get_artifacts_for_run)
+        self.tags_fill_interval = TAGS_FILL_INTERVAL_SECONDS
+        if event_emitter is not None:
+            event_emitter.on('notify', self.notify_handler)
+            self.tags_fill_interval = TAGS_REBUILD_INTERVAL_SECONDS
         loop = asyncio.get_event_loop()
         loop.create_task(self.periodic_tags_fetch_and_cache())
 
     async def periodic_tags_fetch_and_cache(self):
         '''
-        Async task that fill tags cache every 5minutes. Database query might take a while
-        so its better to cache the result.
+        Async task that fill tags cache every 5minutes from the tag dictionary of runs,
+        so that autocomplete does not query the database on every keystroke.
+        With run notifications, the cache is filled incrementally and only rebuilt every hour.
         '''
         while True:
             await self.update_cached_tags()
             # Check tags again after some sleep
-            await asyncio.sleep(TAGS_FILL_INTERVAL_SECONDS)
+            await asyncio.sleep(self.tags_fill_interval)
 
     async def update_cached_tags(self):
-        # Get all tags that are mentioned in runs table
-        res, _ = await self.db.run_table_postgres.get_tags()
+        # Get all tags that are set on runs, in order
+        res, _ = await self.db.run_tag_table_postgres.get_tags()
         if res.response_code == 200:
-            self.tags = sorted(res.body)
-        size = sys.getsizeof(self.tags) // 1024 // 1024
+            # Indexing hundreds of thousands of tags takes a while, build the index off the event loop
+            self._tags_added_during_rebuild = []
+            try:
+                tags = await asyncio.get_event_loop().run_in_executor(None, TagIndex, res.body)
+                tags.add(self._tags_added_during_rebuild)
+                self.tags = tags
+            finally:
+                self._tags_added_during_rebuild = None
+        size = self.tags.size_in_bytes() // 1024 // 1024
         count = len(self.tags)
         self.logger.info("{} cached tags in memory consuming {} Mb".format(count, size))
 
+    async def notify_handler(self, operation: str, resources: List[str], data: Dict,
+                             table_name: str = None, filter_dict: Dict = {}):
+        "Add the tags of inserted runs to the cached tags"
+        if operation != "INSERT" or table_name != self.db.run_table_postgres.table_name:
+            return
+        res, _ = await self.db.run_tag_table_postgres.get_tags_of_run(data["flow_id"], data["run_number"])
+        if res.response_code == 200:
+            self.tags.add(res.body)
+            if self._tags_added_during_rebuild is not None:
+                self._tags_added_during_rebuild.extend(res.body)
+
     @handle_exceptions
     async def get_tags(self, request):
         """
@@ -61,23 +101,22 @@ class AutoCompleteApi(object):
         # pagination setup
         page, limit, offset, _, _, _ = pagination_query(request)
 
-        filter_func = None
+        operator, term = None, None
         for key, val in request.query.items():
             deconstruct = key.split(":", 1)
             if len(deconstruct) > 1:
                 field = deconstruct[0]
-                operator = deconstruct[1]
+                _operator = deconstruct[1]
             else:
                 field = key
-                operator = None
+                _operator = None
 
-            if field == 'tag' and operator in operators_to_filters:
-                filter_func = operators_to_filters[operator]
+            if field == 'tag' and _operator in operators_to_filters:
+                operator, term = _operator, val
 
-        if filter_func:
-            tags = [tag for tag in self.tags if filter_func(tag, val)][offset:(offset + limit)]
-        else:
-            tags = self.tags[offset:(offset + limit)]
+        # Prefix and contains lookups are indexed, other operators filter all tags
+        tags = self.tags.find(operator, term, limit=limit, offset=offset,
+                              filter_func=operators_to_filters.get(operator))
 
         count = len(tags)
         pagination = DBPagination(limit, offset, count, page)
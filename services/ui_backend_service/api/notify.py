@@ -78,7 +78,17 @@ class ListenNotify(object):
             table_name = payload.get("table")
             operation = payload.get("operation")
             data = payload.get("data")
+        except Exception:
+            self.logger.exception("Exception occurred")
+            return
 
+        # Statement level triggers send the keys of all rows changed by a statement as a list
+        for row in (data if isinstance(data, list) else [data]):
+            await self.handle_trigger_data(table_name, operation, row)
+
+    async def handle_trigger_data(self, table_name: str, operation: str, data: Dict):
+        "Process the change of a single row, as received from the notify trigger of a table"
+        try:
             table = self.db.get_table_by_name(table_name)
             if table is not None:
                 resources = resource_list(table.table_name, data)
@@ -1,3 +1,5 @@
+from typing import Dict, Optional
+
 from ..data.refiner.parameter_refiner import GetParametersFailed
 from services.data.db_utils import DBResponse, translate_run_key
 from services.utils import handle_exceptions
@@ -120,14 +122,16 @@ class RunApi(object):
                                           allowed_group=allowed_group,
                                           allowed_filters=allowed_filters,
                                           enable_joins=True,
-                                          overwrite_select_from=overwrite_select_from
+                                          overwrite_select_from=overwrite_select_from,
+                                          columns=self._final_state_columns(request)
                                           )
 
         return await find_records(request, self._async_table,
                                   allowed_order=allowed_order,
                                   allowed_group=allowed_group,
                                   allowed_filters=allowed_filters,
-                                  enable_joins=True
+                                  enable_joins=True,
+                                  columns=self._final_state_columns(request)
                                   )
 
     @handle_exceptions
@@ -172,9 +176,22 @@ class RunApi(object):
                                   allowed_order=self._async_table.keys + ["user", "run", "finished_at", "duration", "status"],
                                   allowed_group=self._async_table.keys + ["user"],
                                   allowed_filters=self._async_table.keys + ["user", "run", "finished_at", "duration", "status"],
-                                  enable_joins=True
+                                  enable_joins=True,
+                                  columns=self._final_state_columns(request)
                                   )
 
+    def _final_state_columns(self, request) -> Optional[Dict[str, str]]:
+        """
+        Stored columns of the run summary to filter and sort on, when the request only lists completed runs.
+
+        The status of a run is derived from heartbeats unless its end step reported a result. Completed runs
+        always have a stored status, finish time and duration, so their filters and sorts use the indexes of
+        the run summary instead of deriving the columns of every run.
+        """
+        if any(key in ["status", "status:eq"] and value == "completed" for key, value in request.query.items()):
+            return self._async_table.final_state_columns
+        return None
+
     @handle_exceptions
     async def get_run_parameters(self, request):
         """
@@ -5,7 +5,7 @@ class TagApi(object):
     def __init__(self, app, db):
         self.db = db
         app.router.add_route("GET", "/tags", self.get_all_tags)
-        self._async_table = self.db.run_table_postgres
+        self._async_table = self.db.run_tag_table_postgres
 
     @handle_exceptions
     async def get_all_tags(self, request):
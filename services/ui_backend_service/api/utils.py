@@ -1,3 +1,5 @@
+import base64
+import binascii
 import json
 import os
 import re
@@ -91,16 +93,23 @@ def format_response_list(request: web.BaseRequest, db_response: DBResponse, pagi
         nextPage = page + 1 if (pagination.count or 0) >= pagination.limit else None
     prevPage = max(page - 1, 1)
 
+    # Link to the next page with a keyset cursor when available, so that deep pages do not require an OFFSET.
+    nextCursor = encode_cursor(pagination.last_key) if nextPage and pagination.last_key else None
+    nextQuery = {"_page": nextPage, "_cursor": nextCursor} if nextCursor else {"_page": nextPage}
+
+    # The cursor of the request points after the current page only, other pages are linked by page number.
+    pageQuery = {key: value for key, value in query.items() if key != "_cursor"}
+
     baseurl = format_baseurl(request)
     response_object = {
         "data": db_response.body,
         "status": db_response.response_code,
         "links": {
             "self": "{}{}".format(baseurl, format_qs(query)),
-            "first": "{}{}".format(baseurl, format_qs(query, {"_page": 1})),
-            "prev": "{}{}".format(baseurl, format_qs(query, {"_page": prevPage})),
-            "next": "{}{}".format(baseurl, format_qs(query, {"_page": nextPage})) if nextPage else None,
-            "last": "{}{}".format(baseurl, format_qs(query, {"_page": page_count})) if page_count else None
+            "first": "{}{}".format(baseurl, format_qs(pageQuery, {"_page": 1})),
+            "prev": "{}{}".format(baseurl, format_qs(pageQuery, {"_page": prevPage})),
+            "next": "{}{}".format(baseurl, format_qs(pageQuery, nextQuery)) if nextPage else None,
+            "last": "{}{}".format(baseurl, format_qs(pageQuery, {"_page": page_count})) if page_count else None
         },
         "pages": {
             "self": page,
@@ -111,10 +120,39 @@ def format_response_list(request: web.BaseRequest, db_response: DBResponse, pagi
         },
         "query": query,
     }
+    if nextCursor:
+        response_object["cursors"] = {"next": nextCursor}
     return db_response.response_code, response_object
 
 
-def pagination_query(request: web.BaseRequest, allowed_order: List[str] = [], allowed_group: List[str] = []):
+def encode_cursor(last_key: Dict) -> str:
+    """
+    Opaque keyset pagination cursor for the key columns and values of the last row on a page.
+    Returns None if a value can not be used as a cursor, eg. a JSON column.
+    """
+    if not all(value is None or isinstance(value, (str, int, float)) for value in last_key.values()):
+        return None
+    # Padding is left out, as it would need to be escaped in URLs.
+    return base64.urlsafe_b64encode(json.dumps(last_key).encode("utf-8")).decode("utf-8").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Dict:
+    "Key columns and values from a cursor created with encode_cursor(), or None if the cursor is not valid"
+    if not cursor:
+        return None
+    try:
+        padding = "=" * (-len(cursor) % 4)
+        last_key = json.loads(base64.urlsafe_b64decode((cursor + padding).encode("utf-8")))
+    except (ValueError, binascii.Error):
+        return None
+    if not isinstance(last_key, dict) or \
+            not all(value is None or isinstance(value, (str, int, float)) for value in last_key.values()):
+        return None
+    return last_key
+
+
+def pagination_query(request: web.BaseRequest, allowed_order: List[str] = [], allowed_group: List[str] = [],
+                     columns: Dict[str, str] = None):
     # Page
     try:
         page = max(int(request.query.get("_page", 1)), 1)
@@ -155,7 +193,7 @@ def pagination_query(request: web.BaseRequest, allowed_order: List[str] = [], al
                     direction = "DESC"
 
                 if column in allowed_order:
-                    _orders.append("\"{}\" {}".format(column, direction))
+                    _orders.append("\"{}\" {}".format((columns or {}).get(column, column), direction))
 
             order = _orders
         else:
@@ -391,11 +429,12 @@ def filter_from_conditions_query_dict(query: MultiDict, allowed_keys: List[str]
 
 
 # Custom conditions parser (table columns, never prefixed with _)
-def custom_conditions_query(request: web.BaseRequest, allowed_keys: List[str] = []):
-    return custom_conditions_query_dict(request.query, allowed_keys)
+# Fields can be answered from other columns than their own, eg. stored columns instead of derived ones, with columns.
+def custom_conditions_query(request: web.BaseRequest, allowed_keys: List[str] = [], columns: Dict[str, str] = None):
+    return custom_conditions_query_dict(request.query, allowed_keys, columns)
 
 
-def custom_conditions_query_dict(query: MultiDict, allowed_keys: List[str] = []):
+def custom_conditions_query_dict(query: MultiDict, allowed_keys: List[str] = [], columns: Dict[str, str] = None):
     conditions = []
     values = []
 
@@ -418,10 +457,11 @@ def custom_conditions_query_dict(query: MultiDict, allowed_keys: List[str] = [])
             continue
 
         vals = val.split(",")
+        column = (columns or {}).get(field, field)
 
         conditions.append(
             "({})".format(" OR ".join(
-                map(lambda v: operators_to_sql["is" if v == "null" else operator].format(field), vals)
+                map(lambda v: operators_to_sql["is" if v == "null" else operator].format(column), vals)
             ))
         )
         values += map(
@@ -451,16 +491,19 @@ def resource_conditions(fullpath: str = None) -> Tuple[str, MultiDict, List[str]
 async def find_records(request: web.BaseRequest, async_table=None, initial_conditions: List[str] = [], initial_values=[],
                        initial_order: List[str] = [], allowed_order: List[str] = [], allowed_group: List[str] = [],
                        allowed_filters: List[str] = [], postprocess: Callable[[DBResponse], DBResponse] = None,
-                       fetch_single=False, enable_joins=False, overwrite_select_from: str = None):
+                       fetch_single=False, enable_joins=False, overwrite_select_from: str = None,
+                       columns: Dict[str, str] = None):
     page, limit, offset, order, groups, group_limit = pagination_query(
         request,
         allowed_order=allowed_order,
-        allowed_group=allowed_group)
+        allowed_group=allowed_group,
+        columns=columns)
 
     builtin_conditions, builtin_vals = builtin_conditions_query(request)
     custom_conditions, custom_vals = custom_conditions_query(
         request,
-        allowed_keys=allowed_filters)
+        allowed_keys=allowed_filters,
+        columns=columns)
 
     conditions = initial_conditions + builtin_conditions + custom_conditions
     values = initial_values + builtin_vals + custom_vals
@@ -476,7 +519,10 @@ async def find_records(request: web.BaseRequest, async_table=None, initial_condi
         postprocess=postprocess,
         invalidate_cache=invalidate_cache,
         benchmark=benchmark,
-        overwrite_select_from=overwrite_select_from
+        overwrite_select_from=overwrite_select_from,
+        # Keyset pagination is opted into with a _cursor, an empty one starts at the first page
+        keyset=not fetch_single and "_cursor" in request.query,
+        after=decode_cursor(request.query.get("_cursor"))
     )
 
     if fetch_single:
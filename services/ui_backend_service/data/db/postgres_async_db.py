@@ -7,13 +7,16 @@ import aiopg
 import psycopg2
 import psycopg2.extras
 # baselevel classes from shared data adapter to inherit from.
+from services.data.db_utils import LRUCache
 from services.data.postgres_async_db import \
-    _AsyncPostgresDB as BaseAsyncPostgresDB
+    _AsyncPostgresDB as BaseAsyncPostgresDB, AsyncRunSummaryTablePostgres, AsyncTaskAttemptTablePostgres, \
+    ID_CACHE_SIZE
 from services.utils import DBConfiguration, logging
 
 from .tables import (AsyncArtifactTablePostgres, AsyncFlowTablePostgres,
                      AsyncMetadataTablePostgres, AsyncRunTablePostgres,
-                     AsyncStepTablePostgres, AsyncTaskTablePostgres)
+                     AsyncRunTagTablePostgres, AsyncStepTablePostgres,
+                     AsyncTaskTablePostgres)
 
 
 class AsyncPostgresDB(BaseAsyncPostgresDB):
@@ -33,6 +36,9 @@ class AsyncPostgresDB(BaseAsyncPostgresDB):
     task_table_postgres = None
     artifact_table_postgres = None
     metadata_table_postgres = None
+    task_attempt_table_postgres = None
+    run_summary_table_postgres = None
+    run_tag_table_postgres = None
 
     pool = None
     db_conf: DBConfiguration = None
@@ -48,10 +54,23 @@ class AsyncPostgresDB(BaseAsyncPostgresDB):
         self.task_table_postgres = AsyncTaskTablePostgres(self)
         self.artifact_table_postgres = AsyncArtifactTablePostgres(self)
         self.metadata_table_postgres = AsyncMetadataTablePostgres(self)
+        self.task_attempt_table_postgres = AsyncTaskAttemptTablePostgres(self)
+        self.run_summary_table_postgres = AsyncRunSummaryTablePostgres(self)
+        self.run_tag_table_postgres = AsyncRunTagTablePostgres(self)
         tables.append(self.flow_table_postgres)
         tables.append(self.run_table_postgres)
         tables.append(self.step_table_postgres)
         tables.append(self.task_table_postgres)
         tables.append(self.artifact_table_postgres)
         tables.append(self.metadata_table_postgres)
+        tables.append(self.task_attempt_table_postgres)
+        tables.append(self.run_summary_table_postgres)
+        tables.append(self.run_tag_table_postgres)
         self.tables = tables
+
+        self.run_ids_cache = LRUCache(ID_CACHE_SIZE)
+        self.task_ids_cache = LRUCache(ID_CACHE_SIZE)
+
+        self.replica_pools = []
+        self._read_pools = None
+        self.replica_fallback = True
@@ -4,3 +4,4 @@ from .step import AsyncStepTablePostgres
 from .task import AsyncTaskTablePostgres
 from .metadata import AsyncMetadataTablePostgres
 from .artifact import AsyncArtifactTablePostgres
+from .run_tag import AsyncRunTagTablePostgres
@@ -15,6 +15,7 @@ class AsyncArtifactTablePostgres(AsyncPostgresTable):
     keys = MetadataArtifactTable.keys
     primary_keys = MetadataArtifactTable.primary_keys
     trigger_keys = MetadataArtifactTable.trigger_keys
+    partition_key = MetadataArtifactTable.partition_key
     select_columns = keys
     _command = MetadataArtifactTable._command
 
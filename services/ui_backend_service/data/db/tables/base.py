@@ -1,13 +1,15 @@
 import math
 import os
+import re
 from asyncio import iscoroutinefunction
-from typing import Callable, List, Tuple
+from typing import Callable, Dict, List, Tuple
 
 import psycopg2
 import psycopg2.extras
 from services.data.db_utils import (DBPagination, DBResponse,
                                     aiopg_exception_handling)
-from services.data.postgres_async_db import WAIT_TIME
+from services.data.metrics import count_error, instrument
+from services.data.postgres_async_db import WAIT_TIME, with_limit_values
 from services.data.postgres_async_db import \
     AsyncPostgresTable as MetadataAsyncPostgresTable
 
@@ -48,6 +50,14 @@ class AsyncPostgresTable(MetadataAsyncPostgresTable):
     _filters = None
     _row_type = None
 
+    def keyset_keys(self, enable_joins: bool = False) -> List[str]:
+        """
+        Columns that uniquely identify a row of the results, ordered by after the requested ordering
+        so that the last row of a page marks where the next page starts.
+        Defaults to the primary keys, tables that list more than one row per primary key add to them.
+        """
+        return self.primary_keys
+
     async def get_records(self, filter_dict={}, fetch_single=False,
                           ordering: List[str] = None, limit: int = 0, expanded=False) -> DBResponse:
         conditions = []
@@ -65,10 +75,24 @@ class AsyncPostgresTable(MetadataAsyncPostgresTable):
                            group_limit: int = 10, expanded=False, enable_joins=False,
                            postprocess: Callable[[DBResponse], DBResponse] = None,
                            invalidate_cache=False, benchmark: bool = False,
-                           overwrite_select_from: str = None
+                           overwrite_select_from: str = None, keyset: bool = False, after: Dict = None
                            ) -> Tuple[DBResponse, DBPagination]:
+        cursor_keys = None
         # Grouping not enabled
         if groups is None or len(groups) == 0:
+            if keyset:
+                # Order by the unique keys as well, so that the last row of a page identifies
+                # where the next page starts. Continuing after it replaces OFFSET.
+                keys = keyset_columns(order, self.keyset_keys(enable_joins))
+                if keys is not None:
+                    order = ['"{}" {}'.format(column, direction) for column, direction in keys]
+                    cursor_keys = [column for column, _ in keys]
+                    if after is not None and list(after.keys()) == cursor_keys:
+                        after_sql, after_values = keyset_condition(keys, after)
+                        conditions = (conditions or []) + [after_sql]
+                        values = list(values) + after_values
+                        offset = 0
+
             sql_template = """
             SELECT * FROM (
                 SELECT
@@ -82,19 +106,17 @@ class AsyncPostgresTable(MetadataAsyncPostgresTable):
             {offset}
             """
 
-            select_sql = sql_template.format(
-                keys=",".join(
-                    self.select_columns + (self.join_columns if enable_joins and self.join_columns else [])),
+            shape = ("find_records", tuple(conditions or []), tuple(order or []), bool(limit), bool(offset),
+                     enable_joins, overwrite_select_from)
+            select_sql = self.compiled_query(shape, lambda: sql_template.format(
+                **self._select_parts(conditions, enable_joins),
                 table_name=overwrite_select_from if overwrite_select_from else self.table_name,
-                joins=" ".join(
-                    self.joins) if enable_joins and self.joins else "",
-                where="WHERE {}".format(" AND ".join(
-                    conditions)) if conditions else "",
                 order_by="ORDER BY {}".format(
                     ", ".join(order)) if order else "",
-                limit="LIMIT {}".format(limit) if limit else "",
-                offset="OFFSET {}".format(offset) if offset else ""
-            ).strip()
+                limit="LIMIT %s" if limit else "",
+                offset="OFFSET %s" if offset else ""
+            ).strip())
+            values = with_limit_values(values, limit, offset)
         else:  # Grouping enabled
             # NOTE: we are performing a DISTINCT select on the group labels before the actual window function, to limit the set
             # being queried. Without this restriction the query planner kept hitting the whole table contents, resulting in very slow queries.
@@ -113,26 +135,27 @@ class AsyncPostgresTable(MetadataAsyncPostgresTable):
             {offset}
             """
 
-            groups_sql = groups_sql_template.format(
-                keys=",".join(
-                    self.select_columns + (self.join_columns if enable_joins and self.join_columns else [])),
+            groups_shape = ("find_records_groups", tuple(conditions or []), tuple(groups), bool(limit), bool(offset),
+                            enable_joins)
+            groups_sql = self.compiled_query(groups_shape, lambda: groups_sql_template.format(
+                **self._select_parts(conditions, enable_joins),
                 table_name=self.table_name,
-                joins=" ".join(
-                    self.joins) if enable_joins and self.joins is not None else "",
-                where="WHERE {}".format(" AND ".join(
-                    conditions)) if conditions else "",
                 group_by=", ".join(groups),
-                limit="LIMIT {}".format(limit) if limit else "",
-                offset="OFFSET {}".format(offset) if offset else ""
-            ).strip()
+                limit="LIMIT %s" if limit else "",
+                offset="OFFSET %s" if offset else ""
+            ).strip())
 
-            group_results, _ = await self.execute_sql(select_sql=groups_sql, values=values, fetch_single=fetch_single,
-                                                      expanded=expanded, limit=limit, offset=offset)
+            group_results, _ = await self.execute_sql(select_sql=groups_sql, values=with_limit_values(values, limit, offset),
+                                                      fetch_single=fetch_single, expanded=expanded, limit=limit, offset=offset,
+                                                      prepare=True)
             if len(group_results.body) == 0:
                 # Return early if no groups match the query.
                 return group_results, None, None
 
             # construct the group_where clause.
+            values = list(values)
+            if group_limit:
+                values.append(group_limit)
             group_label_selects = []
             for group in groups:
                 _group_values = [row[group.strip("\"")] for row in group_results.body]
@@ -157,24 +180,21 @@ class AsyncPostgresTable(MetadataAsyncPostgresTable):
             {group_where}
             """
 
-            select_sql = sql_template.format(
-                keys=",".join(
-                    self.select_columns + (self.join_columns if enable_joins and self.join_columns else [])),
+            shape = ("find_records_group_content", tuple(conditions or []), tuple(order or []), tuple(groups),
+                     bool(group_limit), tuple(group_label_selects), enable_joins, overwrite_select_from)
+            select_sql = self.compiled_query(shape, lambda: sql_template.format(
+                **self._select_parts(conditions, enable_joins),
                 table_name=overwrite_select_from if overwrite_select_from else self.table_name,
-                joins=" ".join(
-                    self.joins) if enable_joins and self.joins is not None else "",
-                where="WHERE {}".format(" AND ".join(
-                    conditions)) if conditions else "",
                 group_by=", ".join(groups),
                 order_by="ORDER BY {}".format(
                     ", ".join(order)) if order else "",
                 group_where="""
                     WHERE {group_limit} {group_selects}
                 """.format(
-                    group_limit="row_number <= {} AND ".format(group_limit) if group_limit else "",
+                    group_limit="row_number <= %s AND " if group_limit else "",
                     group_selects=" AND ".join(group_label_selects)
                 )
-            ).strip()
+            ).strip())
 
         # Run benchmarking on query if requested
         benchmark_results = None
@@ -185,7 +205,8 @@ class AsyncPostgresTable(MetadataAsyncPostgresTable):
             )
 
         result, pagination = await self.execute_sql(select_sql=select_sql, values=values, fetch_single=fetch_single,
-                                                    expanded=expanded, limit=limit, offset=offset)
+                                                    expanded=expanded, limit=limit, offset=offset, prepare=True,
+                                                    cursor_keys=cursor_keys)
         # Modify the response after the fetch has been executed
         if postprocess is not None:
             if iscoroutinefunction(postprocess):
@@ -195,12 +216,21 @@ class AsyncPostgresTable(MetadataAsyncPostgresTable):
 
         return result, pagination, benchmark_results
 
+    def _select_parts(self, conditions: List[str], enable_joins: bool) -> Dict[str, str]:
+        "SQL fragments for the selected columns, joins and conditions shared by the find_records() templates"
+        return {
+            "keys": ",".join(
+                self.select_columns + (self.join_columns if enable_joins and self.join_columns else [])),
+            "joins": " ".join(self.joins) if enable_joins and self.joins else "",
+            "where": "WHERE {}".format(" AND ".join(conditions)) if conditions else ""
+        }
+
     async def benchmark_sql(self, select_sql: str, values=[], fetch_single=False,
                             expanded=False, limit: int = 0, offset: int = 0):
         "Benchmark and log a given SQL query with EXPLAIN ANALYZE"
         try:
             with (
-                await self.db.pool.cursor(
+                await self.db.read_pool().cursor(
                     cursor_factory=psycopg2.extras.DictCursor
                 )
             ) as cur:
@@ -217,15 +247,20 @@ class AsyncPostgresTable(MetadataAsyncPostgresTable):
             self.db.logger.exception("Query Benchmarking failed")
             return None
 
+    @instrument("execute_sql")
     async def execute_sql(self, select_sql: str, values=[], fetch_single=False,
-                          expanded=False, limit: int = 0, offset: int = 0, serialize: bool = True) -> Tuple[DBResponse, DBPagination]:
+                          expanded=False, limit: int = 0, offset: int = 0, serialize: bool = True,
+                          prepare: bool = False, primary: bool = False,
+                          cursor_keys: List[str] = None) -> Tuple[DBResponse, DBPagination]:
+        # Queries run on a read replica when configured, unless the primary is explicitly requested.
+        pool = self.db.pool if primary else self.db.read_pool()
         try:
             with (
-                await self.db.pool.cursor(
+                await pool.cursor(
                     cursor_factory=psycopg2.extras.DictCursor
                 )
             ) as cur:
-                await cur.execute(select_sql, values)
+                await self._execute(cur, select_sql, values, prepare=prepare)
 
                 rows = []
                 records = await cur.fetchall()
@@ -246,14 +281,22 @@ class AsyncPostgresTable(MetadataAsyncPostgresTable):
                     offset=offset,
                     count=count,
                     page=math.floor(int(offset) / max(int(limit), 1)) + 1,
+                    last_key={key: records[-1][key] for key in cursor_keys} if cursor_keys and records else None
                 )
 
                 cur.close()
                 return DBResponse(response_code=200, body=body), pagination
         except IndexError as error:
+            if pool is not self.db.pool and self.db.replica_fallback:
+                # The row might have been created on the primary but not replicated yet.
+                return await self.execute_sql(
+                    select_sql=select_sql, values=values, fetch_single=fetch_single, expanded=expanded,
+                    limit=limit, offset=offset, serialize=serialize, prepare=prepare, primary=True,
+                    cursor_keys=cursor_keys)
             return aiopg_exception_handling(error), None
         except (Exception, psycopg2.DatabaseError) as error:
             self.db.logger.exception("Exception occured")
+            count_error(self, "execute_sql", error)
             return aiopg_exception_handling(error), None
 
     async def get_tags(self, conditions: List[str] = None, values=[], limit: int = 0, offset: int = 0):
@@ -280,3 +323,83 @@ class AsyncPostgresTable(MetadataAsyncPostgresTable):
         _body = [row[0] for row in res.body]
 
         return DBResponse(res.response_code, _body), pagination
+
+
+order_match = re.compile(r'^"?(\w+)"?(?:\s+(ASC|DESC))?$', re.IGNORECASE)
+
+
+def keyset_columns(order: List[str], unique_keys: List[str]) -> List[Tuple[str, str]]:
+    """
+    Columns and directions for keyset pagination: the columns of the ORDER BY expressions,
+    followed by the unique keys that make the ordering unique.
+    Unique keys are sorted in the direction of the last ORDER BY expression.
+
+    Returns None if an ORDER BY expression is not a plain column reference.
+    """
+    keys = []
+    for expression in order or []:
+        match = order_match.match(expression.strip())
+        if match is None:
+            return None
+        keys.append((match.group(1), (match.group(2) or "ASC").upper()))
+
+    direction = keys[-1][1] if keys else "ASC"
+    ordered_columns = [column for column, _ in keys]
+    for column in unique_keys or []:
+        if column not in ordered_columns:
+            keys.append((column, direction))
+    return keys
+
+
+def keyset_condition(keys: List[Tuple[str, str]], after: Dict) -> Tuple[str, List]:
+    """
+    SQL condition and values for the rows that follow a row with the given key values, when ordered by keys.
+
+    NULL values follow the default ordering of Postgres: last in ascending and first in descending order.
+    The first key is also used as a plain range condition when possible, so that an index on it can be used.
+
+    Parameters
+    ----------
+    keys : List[Tuple[str, str]]
+        column and direction pairs, as returned by keyset_columns()
+    after : Dict
+        values of the key columns of the last row on the previous page
+    """
+    def _follows(column, direction, value):
+        if direction == "ASC":
+            if value is None:
+                return None, []
+            return "(\"{0}\" > %s OR \"{0}\" IS NULL)".format(column), [value]
+        if value is None:
+            return "\"{}\" IS NOT NULL".format(column), []
+        return "\"{}\" < %s".format(column), [value]
+
+    def _equals(column, value):
+        if value is None:
+            return "\"{}\" IS NULL".format(column), []
+        return "\"{}\" = %s".format(column), [value]
+
+    # Built from the last key to the first one:
+    # follows(k1) OR (equals(k1) AND (follows(k2) OR (equals(k2) AND ...)))
+    condition, values = None, []
+    for column, direction in reversed(keys):
+        value = after[column]
+        follows_sql, follows_values = _follows(column, direction, value)
+        if condition is None:
+            condition, values = follows_sql, follows_values
+            continue
+        equals_sql, equals_values = _equals(column, value)
+        tie_sql, tie_values = "{} AND {}".format(equals_sql, condition), equals_values + values
+        if follows_sql is None:
+            condition, values = "({})".format(tie_sql), tie_values
+        else:
+            condition, values = "({} OR ({}))".format(follows_sql, tie_sql), follows_values + tie_values
+
+    if condition is None:
+        return "FALSE", []
+
+    column, direction = keys[0]
+    value = after[column]
+    if direction == "DESC" and value is not None:
+        return "(\"{}\" <= %s AND {})".format(column, condition), [value] + values
+    return "({})".format(condition), values
@@ -1,3 +1,4 @@
+from typing import List
 from .base import AsyncPostgresTable
 from .task import AsyncTaskTablePostgres
 from ..models import MetadataRow
@@ -12,16 +13,15 @@ class AsyncMetadataTablePostgres(AsyncPostgresTable):
     keys = MetaserviceMetadataTable.keys
     primary_keys = MetaserviceMetadataTable.primary_keys
     trigger_keys = MetaserviceMetadataTable.trigger_keys
+    partition_key = MetaserviceMetadataTable.partition_key
     _command = MetaserviceMetadataTable._command
 
+    def keyset_keys(self, enable_joins: bool = False) -> List[str]:
+        # Metadata fields can be recorded more than once per task, f.ex. once per attempt
+        return self.primary_keys + ["id"]
+
     @property
     def select_columns(self):
-        keys = ["{table_name}.{col} AS {col}".format(table_name=self.table_name, col=k) for k in self.keys]
-
-        # Must use SELECT on the regexp matches in order to include non-matches as well, otherwise
-        # we won't be able to fill attempt_id with NULL in case no id has been recorded
-        # (f.ex. run-level metadata)
-        keys.append(
-            "(SELECT regexp_matches(tags::text, 'attempt_id:(\\d+)'))[1]::int as attempt_id"
-        )
-        return keys
+        # attempt_id is parsed from the tags when metadata is recorded, and is NULL for metadata
+        # that does not belong to an attempt (f.ex. run-level metadata)
+        return ["{table_name}.{col} AS {col}".format(table_name=self.table_name, col=k) for k in self.keys]
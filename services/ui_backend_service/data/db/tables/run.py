@@ -7,8 +7,8 @@ from services.data.db_utils import DBResponse, DBPagination, translate_run_key
 # use schema constants from the .data module to keep things consistent
 from services.data.postgres_async_db import (
     AsyncRunTablePostgres as MetadataRunTable,
-    AsyncMetadataTablePostgres as MetaMetadataTable,
-    AsyncArtifactTablePostgres as MetadataArtifactTable,
+    AsyncRunSummaryTablePostgres as MetadataRunSummaryTable,
+    AsyncTaskAttemptTablePostgres as MetadataTaskAttemptTable,
     AsyncTaskTablePostgres as MetadataTaskTable
 )
 
@@ -20,92 +20,51 @@ METAFLOW_ARTIFACT_PREFETCH_RUNS_LIMIT = os.environ.get('PREFETCH_RUNS_LIMIT', 50
 class AsyncRunTablePostgres(AsyncPostgresTable):
     _row_type = RunRow
     table_name = MetadataRunTable.table_name
-    metadata_table = MetaMetadataTable.table_name
-    artifact_table = MetadataArtifactTable.table_name
+    run_summary_table = MetadataRunSummaryTable.table_name
+    task_attempt_table = MetadataTaskAttemptTable.table_name
     task_table = MetadataTaskTable.table_name
     keys = MetadataRunTable.keys
     primary_keys = MetadataRunTable.primary_keys
     trigger_keys = MetadataRunTable.trigger_keys
 
-    # NOTE: OSS Schema has metadata value column as TEXT, but for the time being we also need to support
-    # value columns of type jsonb, which is why there is additional logic when dealing with 'value'
+    # The terminal state of runs is kept up to date by triggers, see
+    # services.data.postgres_async_db.AsyncRunSummaryTablePostgres. Tasks are only looked at for runs that stopped
+    # heartbeating without a result of the end step, to find a task that failed or stopped heartbeating.
     joins = [
         """
-        LEFT JOIN LATERAL (
-            SELECT
-                ts_epoch,
-                (CASE
-                    WHEN pg_typeof(value)='jsonb'::regtype
-                    THEN value::jsonb->>0
-                    ELSE value::text
-                END)::boolean as value
-            FROM {metadata_table} as attempt_ok
-            WHERE
-                {table_name}.flow_id = attempt_ok.flow_id AND
-                {table_name}.run_number = attempt_ok.run_number AND
-                attempt_ok.step_name = 'end' AND
-                attempt_ok.field_name = 'attempt_ok'
-            ORDER BY ts_epoch DESC
-            LIMIT 1
-        ) as end_attempt_ok ON true
-        """.format(
-            table_name=table_name,
-            metadata_table=metadata_table
-        ),
-        """
-        LEFT JOIN LATERAL (
-            SELECT ts_epoch
-            FROM {metadata_table} as attempt
-            WHERE
-                {table_name}.flow_id = attempt.flow_id AND
-                {table_name}.run_number = attempt.run_number AND
-                attempt.step_name = 'end' AND
-                attempt.field_name = 'attempt' AND
-                end_attempt_ok.value IS FALSE
-            ORDER BY ts_epoch DESC
-            LIMIT 1
-        ) as end_attempt ON true
+        LEFT JOIN {run_summary_table} as summary ON
+            {table_name}.flow_id = summary.flow_id AND
+            {table_name}.run_number = summary.run_number
         """.format(
             table_name=table_name,
-            metadata_table=metadata_table
+            run_summary_table=run_summary_table
         ),
         """
         LEFT JOIN LATERAL (
             SELECT 1
-            FROM
-            {task_table} as task
-            LEFT JOIN LATERAL (
-                SELECT
-                    (CASE
-                        WHEN pg_typeof(value)='jsonb'::regtype
-                        THEN value::jsonb->>0
-                        ELSE value::text
-                    END)::boolean as is_ok,
-                    ts_epoch
-                FROM {metadata_table} as attempt_ok
-                WHERE
-                    task.flow_id=attempt_ok.flow_id AND
-                    task.run_number=attempt_ok.run_number AND
-                    task.step_name=attempt_ok.step_name AND
-                    task.task_id=attempt_ok.task_id AND
-                    attempt_ok.field_name='attempt_ok'
-            ) AS attempt_ok ON true
+            FROM {task_table} as task
             WHERE
                 {table_name}.flow_id = task.flow_id
                 AND {table_name}.run_number = task.run_number
                 AND @(extract(epoch from now())-{table_name}.last_heartbeat_ts)>{heartbeat_threshold}
-                AND end_attempt_ok IS NULL
-                AND end_attempt is NULL
-                AND attempt_ok.is_ok IS NOT TRUE
+                AND summary.end_attempt_ok IS NULL
                 AND @(extract(epoch from now())-task.last_heartbeat_ts)>{heartbeat_threshold}
-            GROUP BY task.flow_id, task.run_number, task.step_name, task.task_id, attempt_ok.ts_epoch
-            ORDER BY attempt_ok.ts_epoch DESC
+                -- failed when an attempt is not ok, or when no attempt reported attempt_ok at all
+                AND (
+                    SELECT bool_and(attempt.attempt_ok)
+                    FROM {task_attempt_table} as attempt
+                    WHERE
+                        task.flow_id = attempt.flow_id
+                        AND task.run_number = attempt.run_number
+                        AND task.step_name = attempt.step_name
+                        AND task.task_id = attempt.task_id
+                ) IS NOT TRUE
             LIMIT 1
         ) as latest_failed_task ON true
         """.format(
             table_name=table_name,
             task_table=task_table,
-            metadata_table=metadata_table,
+            task_attempt_table=task_attempt_table,
             heartbeat_threshold=HEARTBEAT_THRESHOLD
         ),
     ]
@@ -126,14 +85,22 @@ class AsyncRunTablePostgres(AsyncPostgresTable):
                 COALESCE({table_name}.run_id, {table_name}.run_number::text) AS run
                 """.format(table_name=self.table_name)]
 
+    # Stored columns of the run summary, that filters and sorts on completed runs are answered from,
+    # see services.ui_backend_service.api.run. Runs are serialized without them.
+    final_state_columns = {
+        "status": "final_status",
+        "finished_at": "final_finished_at",
+        "duration": "final_duration",
+    }
+
     join_columns = [
+        "summary.{col} AS {final_col}".format(col=col, final_col=final_col)
+        for col, final_col in final_state_columns.items()
+    ] + [
         """
         (CASE
-            WHEN end_attempt IS NOT NULL
-                AND end_attempt_ok.ts_epoch < end_attempt.ts_epoch
-            THEN NULL
-            WHEN end_attempt_ok IS NOT NULL
-            THEN end_attempt_ok.ts_epoch
+            WHEN summary.end_attempt_ok IS NOT NULL
+            THEN summary.finished_at
             WHEN {table_name}.last_heartbeat_ts IS NOT NULL
                 AND latest_failed_task IS NOT NULL
                 AND @(extract(epoch from now())-{table_name}.last_heartbeat_ts)>{heartbeat_threshold}
@@ -151,17 +118,14 @@ class AsyncRunTablePostgres(AsyncPostgresTable):
         ),
         """
         (CASE
-            WHEN end_attempt_ok.value IS TRUE
-            THEN 'completed'
+            WHEN summary.status IS NOT NULL
+            THEN summary.status
+            WHEN summary.end_attempt_ok IS FALSE
+            THEN 'running'
             WHEN {table_name}.last_heartbeat_ts IS NOT NULL
                 AND latest_failed_task IS NOT NULL
                 AND @(extract(epoch from now())-{table_name}.last_heartbeat_ts)>{heartbeat_threshold}
             THEN 'failed'
-            WHEN end_attempt_ok.value IS FALSE
-                AND end_attempt.ts_epoch > end_attempt_ok.ts_epoch
-            THEN 'running'
-            WHEN end_attempt_ok.value IS FALSE
-            THEN 'failed'
             WHEN {table_name}.last_heartbeat_ts IS NULL
                 AND @(extract(epoch from now())*1000-{table_name}.ts_epoch)>{cutoff}
             THEN 'failed'
@@ -179,14 +143,8 @@ class AsyncRunTablePostgres(AsyncPostgresTable):
         ),
         """
         (CASE
-            WHEN end_attempt_ok.value IS TRUE
-            THEN end_attempt_ok.ts_epoch - {table_name}.ts_epoch
-            WHEN end_attempt IS NOT NULL
-                AND end_attempt.ts_epoch > end_attempt_ok.ts_epoch
-                AND {table_name}.last_heartbeat_ts IS NOT NULL
-            THEN {table_name}.last_heartbeat_ts*1000-{table_name}.ts_epoch
-            WHEN end_attempt IS NOT NULL
-            THEN end_attempt_ok.ts_epoch - {table_name}.ts_epoch
+            WHEN summary.duration IS NOT NULL
+            THEN summary.duration
             WHEN {table_name}.last_heartbeat_ts IS NOT NULL
             THEN {table_name}.last_heartbeat_ts*1000-{table_name}.ts_epoch
             WHEN {table_name}.last_heartbeat_ts IS NULL
@@ -196,7 +154,6 @@ class AsyncRunTablePostgres(AsyncPostgresTable):
         END) AS duration
         """.format(
             table_name=table_name,
-            heartbeat_threshold=HEARTBEAT_THRESHOLD,
             cutoff=OLD_RUN_FAILURE_CUTOFF_TIME
         )
     ]
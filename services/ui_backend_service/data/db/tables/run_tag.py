@@ -0,0 +1,87 @@
+from typing import List
+from .base import AsyncPostgresTable
+from services.data.db_utils import DBResponse
+# use schema constants from the .data module to keep things consistent
+from services.data.postgres_async_db import (
+    AsyncRunTablePostgres as MetadataRunTable,
+    AsyncRunTagTablePostgres as MetadataRunTagTable
+)
+
+
+class AsyncRunTagTablePostgres(AsyncPostgresTable):
+    table_name = MetadataRunTagTable.table_name
+    keys = MetadataRunTagTable.keys
+    primary_keys = MetadataRunTagTable.primary_keys
+    notify_changes = MetadataRunTagTable.notify_changes
+    select_columns = keys
+    created_by_migrations = MetadataRunTagTable.created_by_migrations
+    run_table_name = MetadataRunTable.table_name
+    _row_type = MetadataRunTagTable._row_type
+
+    async def get_tags(self, conditions: List[str] = None, values=[], limit: int = 0, offset: int = 0):
+        """
+        Get the tags set on runs, ordered by tag, from the tag dictionary instead of the runs themselves.
+
+        Parameters
+        ----------
+        conditions : List[str]
+            list of conditions on the tag column, with %s placeholders for values
+        values : List[str]
+            list of values to be passed for the sql execute.
+        limit : int (optional) (default 0)
+            limit for the number of results
+        offset : int (optional) (default 0)
+            offset for the results.
+
+        Returns
+        -------
+        (DBResponse, DBPagination)
+        """
+        sql_template = """
+        SELECT tag FROM {table_name}
+        {conditions}
+        ORDER BY tag
+        {limit}
+        {offset}
+        """
+        select_sql = sql_template.format(
+            table_name=self.table_name,
+            conditions="WHERE {}".format(" AND ".join(conditions)) if conditions else "",
+            limit="LIMIT {}".format(limit) if limit else "",
+            offset="OFFSET {}".format(offset) if offset else "",
+        )
+
+        res, pagination = await self.execute_sql(select_sql=select_sql, values=values, serialize=False)
+
+        # process the unserialized DBResponse
+        _body = [row[0] for row in res.body]
+
+        return DBResponse(res.response_code, _body), pagination
+
+    async def get_tags_of_run(self, flow_id: str, run_number: int):
+        """
+        Get the distinct tags and system tags of a single run, ordered by tag.
+
+        Parameters
+        ----------
+        flow_id : str
+            Flow id of the run
+        run_number : int
+            Run number of the run
+
+        Returns
+        -------
+        (DBResponse, DBPagination)
+        """
+        select_sql = """
+        SELECT unnest({table_name}_of(tags, system_tags)) AS tag
+        FROM {run_table}
+        WHERE flow_id = %s AND run_number = %s
+        """.format(table_name=self.table_name, run_table=self.run_table_name)
+
+        res, pagination = await self.execute_sql(select_sql=select_sql, values=[flow_id, run_number], serialize=False)
+
+        # process the unserialized DBResponse
+        _body = [row[0] for row in res.body]
+
+        return DBResponse(res.response_code, _body), pagination
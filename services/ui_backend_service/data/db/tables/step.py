@@ -11,6 +11,22 @@ from services.data.postgres_async_db import (
     AsyncMetadataTablePostgres as MetaMetadataTable
 )
 
+# Latest metadata of a field name recorded for a step. Each field name is looked up separately,
+# so that the lookup is served by the partial index of the metadata table for that field name.
+_LATEST_METADATA_JOIN = """
+        LEFT JOIN LATERAL (
+            SELECT ts_epoch as ts_epoch
+            FROM {metadata_table}
+            WHERE {table_name}.flow_id={metadata_table}.flow_id
+            AND {table_name}.run_number={metadata_table}.run_number
+            AND {table_name}.step_name={metadata_table}.step_name
+            AND {metadata_table}.field_name = '{field_name}'
+            ORDER BY
+                ts_epoch DESC
+            LIMIT 1
+        ) AS {alias} ON true
+        """
+
 
 class AsyncStepTablePostgres(AsyncPostgresTable):
     step_dict = {}
@@ -56,24 +72,17 @@ class AsyncStepTablePostgres(AsyncPostgresTable):
             table_name=table_name,
             artifact_table=artifact_table_name
         ),
-        """
-        LEFT JOIN LATERAL (
-            SELECT ts_epoch as ts_epoch
-            FROM {metadata_table}
-            WHERE {table_name}.flow_id={metadata_table}.flow_id
-            AND {table_name}.run_number={metadata_table}.run_number
-            AND {table_name}.step_name={metadata_table}.step_name
-            AND (
-                {metadata_table}.field_name = 'attempt_ok' OR
-                {metadata_table}.field_name = 'attempt-done'
-            )
-            ORDER BY
-                ts_epoch DESC
-            LIMIT 1
-        ) AS latest_metadata_done ON true
-        """.format(
+        _LATEST_METADATA_JOIN.format(
+            table_name=table_name,
+            metadata_table=metadata_table_name,
+            field_name="attempt_ok",
+            alias="latest_attempt_ok"
+        ),
+        _LATEST_METADATA_JOIN.format(
             table_name=table_name,
-            metadata_table=metadata_table_name
+            metadata_table=metadata_table_name,
+            field_name="attempt-done",
+            alias="latest_attempt_done"
         )
     ]
 
@@ -85,10 +94,11 @@ class AsyncStepTablePostgres(AsyncPostgresTable):
     join_columns = [
         """
         (CASE
-            WHEN COALESCE(latest_task_ok, latest_metadata_done, latest_task_hb) IS NOT NULL
+            WHEN COALESCE(latest_task_ok, latest_attempt_ok, latest_attempt_done, latest_task_hb) IS NOT NULL
             THEN GREATEST(
                 latest_task_ok.ts_epoch,
-                latest_metadata_done.ts_epoch,
+                latest_attempt_ok.ts_epoch,
+                latest_attempt_done.ts_epoch,
                 latest_task_hb.heartbeat_ts*1000
             ) - {table_name}.ts_epoch
             WHEN @(extract(epoch from now())::bigint*1000) - {table_name}.ts_epoch > {cutoff}
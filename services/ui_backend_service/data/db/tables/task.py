@@ -5,8 +5,7 @@ from services.data.db_utils import DBPagination, DBResponse, translate_run_key,
 # use schema constants from the .data module to keep things consistent
 from services.data.postgres_async_db import (
     AsyncTaskTablePostgres as MetadataTaskTable,
-    AsyncArtifactTablePostgres as MetadataArtifactTable,
-    AsyncMetadataTablePostgres as MetaMetadataTable
+    AsyncTaskAttemptTablePostgres as MetadataTaskAttemptTable
 )
 from typing import List, Callable, Tuple
 import json
@@ -16,125 +15,35 @@ import datetime
 class AsyncTaskTablePostgres(AsyncPostgresTable):
     _row_type = TaskRow
     table_name = MetadataTaskTable.table_name
-    artifact_table = MetadataArtifactTable.table_name
-    metadata_table = MetaMetadataTable.table_name
+    task_attempt_table = MetadataTaskAttemptTable.table_name
     keys = MetadataTaskTable.keys
     primary_keys = MetadataTaskTable.primary_keys
     trigger_keys = MetadataTaskTable.trigger_keys
-    # NOTE: There is a lot of unfortunate backwards compatibility logic for cases where task metadata,
-    # or artifacts have not been stored correctly.
-    # NOTE: OSS Schema has metadata value column as TEXT, but for the time being we also need to support
-    # value columns of type jsonb, which is why there is additional logic when dealing with 'value'
+    # Attempts are summarized from the task metadata and _task_ok artifacts by triggers,
+    # see services.data.postgres_async_db.AsyncTaskAttemptTablePostgres
     joins = [
         """
-        LEFT JOIN LATERAL (
-            SELECT
-                max(started_at) as started_at,
-                max(attempt_finished_at) as attempt_finished_at,
-                max(task_ok_finished_at) as task_ok_finished_at,
-                max(task_ok_location) as task_ok_location,
-                attempt_id :: int as attempt_id,
-                max(attempt_ok) :: boolean as attempt_ok,
-                task_id
-            FROM (
-                SELECT
-                    task_id,
-                    ts_epoch as started_at,
-                    NULL::bigint as attempt_finished_at,
-                    NULL::bigint as task_ok_finished_at,
-                    NULL::text as task_ok_location,
-                    NULL::text as attempt_ok,
-                    (CASE
-                        WHEN pg_typeof(value)='jsonb'::regtype
-                        THEN value::jsonb->>0
-                        ELSE value::text
-                    END)::int as attempt_id
-                FROM {metadata_table} as meta
-                WHERE
-                    {table_name}.flow_id = meta.flow_id AND
-                    {table_name}.run_number = meta.run_number AND
-                    {table_name}.step_name = meta.step_name AND
-                    {table_name}.task_id = meta.task_id AND
-                    meta.field_name = 'attempt'
-                UNION
-                SELECT
-                    task_id,
-                    NULL as started_at,
-                    ts_epoch as attempt_finished_at,
-                    NULL as task_ok_finished_at,
-                    NULL as task_ok_location,
-                    NULL as attempt_ok,
-                    (CASE
-                        WHEN pg_typeof(value)='jsonb'::regtype
-                        THEN value::json->>0
-                        ELSE value::text
-                    END)::int as attempt_id
-                FROM {metadata_table} as meta
-                WHERE
-                    {table_name}.flow_id = meta.flow_id AND
-                    {table_name}.run_number = meta.run_number AND
-                    {table_name}.step_name = meta.step_name AND
-                    {table_name}.task_id = meta.task_id AND
-                    meta.field_name = 'attempt-done'
-                UNION
-                SELECT
-                    task_id,
-                    NULL as started_at,
-                    ts_epoch as attempt_finished_at,
-                    NULL as task_ok_finished_at,
-                    NULL as task_ok_location,
-                    (CASE
-                        WHEN pg_typeof(value)='jsonb'::regtype
-                        THEN value::jsonb->>0
-                        ELSE value::text
-                    END) as attempt_ok,
-                    (regexp_matches(tags::text, 'attempt_id:(\\d+)'))[1]::int as attempt_id
-                FROM {metadata_table} as meta
-                WHERE
-                    {table_name}.flow_id = meta.flow_id AND
-                    {table_name}.run_number = meta.run_number AND
-                    {table_name}.step_name = meta.step_name AND
-                    {table_name}.task_id = meta.task_id AND
-                    meta.field_name = 'attempt_ok'
-                UNION
-                SELECT
-                    task_id,
-                    NULL as started_at,
-                    NULL as attempt_finished_at,
-                    ts_epoch as task_ok_finished_at,
-                    location as task_ok_location,
-                    NULL as attempt_ok,
-                    attempt_id as attempt_id
-                FROM {artifact_table} as task_ok
-                WHERE
-                    {table_name}.flow_id = task_ok.flow_id AND
-                    {table_name}.run_number = task_ok.run_number AND
-                    {table_name}.step_name = task_ok.step_name AND
-                    {table_name}.task_id = task_ok.task_id AND
-                    task_ok.name = '_task_ok'
-            ) a
-            WHERE a.attempt_id IS NOT NULL
-            GROUP BY a.task_id, a.attempt_id
-        ) as attempt ON true
-        LEFT JOIN LATERAL (
-            SELECT ts_epoch
-            FROM {metadata_table} as next_attempt_start
-            WHERE
-                {table_name}.flow_id = next_attempt_start.flow_id AND
-                {table_name}.run_number = next_attempt_start.run_number AND
-                {table_name}.step_name = next_attempt_start.step_name AND
-                {table_name}.task_id = next_attempt_start.task_id AND
-                next_attempt_start.field_name = 'attempt' AND
-                (attempt.attempt_id + 1) = (next_attempt_start.value::jsonb->>0)::int
-            LIMIT 1
-        ) as next_attempt_start ON true
+        LEFT JOIN {task_attempt_table} as attempt ON
+            {table_name}.flow_id = attempt.flow_id AND
+            {table_name}.run_number = attempt.run_number AND
+            {table_name}.step_name = attempt.step_name AND
+            {table_name}.task_id = attempt.task_id
+        LEFT JOIN {task_attempt_table} as next_attempt ON
+            attempt.flow_id = next_attempt.flow_id AND
+            attempt.run_number = next_attempt.run_number AND
+            attempt.step_name = next_attempt.step_name AND
+            attempt.task_id = next_attempt.task_id AND
+            attempt.attempt_id + 1 = next_attempt.attempt_id
         """.format(
             table_name=table_name,
-            metadata_table=metadata_table,
-            artifact_table=artifact_table
+            task_attempt_table=task_attempt_table
         ),
     ]
 
+    def keyset_keys(self, enable_joins: bool = False) -> List[str]:
+        # Tasks are listed once per attempt when joined with their attempts
+        return self.primary_keys + (["attempt_id"] if enable_joins else [])
+
     @property
     def select_columns(self):
         # NOTE: We must use a function scope in order to be able to access the table_name variable for list comprehension.
@@ -154,7 +63,7 @@ class AsyncTaskTablePostgres(AsyncPostgresTable):
         """.format(
             table_name=table_name,
             heartbeat_threshold=HEARTBEAT_THRESHOLD,
-            finished_at_column="COALESCE(GREATEST(attempt.attempt_finished_at, attempt.task_ok_finished_at), next_attempt_start.ts_epoch)"
+            finished_at_column="COALESCE(GREATEST(attempt.attempt_finished_at, attempt.task_ok_finished_at), next_attempt.started_at)"
         ),
         "attempt.attempt_ok as attempt_ok",
         # If 'attempt_ok' is present, we can leave task_ok NULL since
@@ -174,11 +83,11 @@ class AsyncTaskTablePostgres(AsyncPostgresTable):
             WHEN attempt.attempt_ok IS FALSE
             THEN 'failed'
             WHEN COALESCE(attempt.attempt_finished_at, attempt.task_ok_finished_at) IS NOT NULL
-                AND attempt_ok IS NULL
+                AND attempt.attempt_ok IS NULL
             THEN 'unknown'
             WHEN COALESCE(attempt.attempt_finished_at, attempt.task_ok_finished_at) IS NOT NULL
             THEN 'completed'
-            WHEN next_attempt_start.ts_epoch IS NOT NULL
+            WHEN next_attempt.started_at IS NOT NULL
             THEN 'failed'
             WHEN {table_name}.last_heartbeat_ts IS NOT NULL
                 AND @(extract(epoch from now())-{table_name}.last_heartbeat_ts)>{heartbeat_threshold}
@@ -211,7 +120,7 @@ class AsyncTaskTablePostgres(AsyncPostgresTable):
             ELSE
                 COALESCE(
                     GREATEST(attempt.attempt_finished_at, attempt.task_ok_finished_at),
-                    next_attempt_start.ts_epoch,
+                    next_attempt.started_at,
                     {table_name}.last_heartbeat_ts*1000,
                     @(extract(epoch from now())::bigint*1000)
                 ) - COALESCE(attempt.started_at, {table_name}.ts_epoch)
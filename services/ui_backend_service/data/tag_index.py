@@ -0,0 +1,136 @@
+"""
+In-memory index of run tags for the tag autocomplete of the UI.
+
+Tags are kept in a sorted list, so that tags starting with a prefix (`:sw`) are found with bisect,
+and in an index of their n-grams, so that tags containing a term (`:co`) are found without scanning all tags.
+Lookup latency is recorded per operator in the `metaflow_ui_tag_lookup_duration_seconds` histogram.
+"""
+import bisect
+import sys
+import time
+from collections import defaultdict
+from typing import Callable, Dict, Iterable, List, Set
+
+from prometheus_client import Histogram
+
+# Length of the n-grams that tags are indexed by. Shorter contains terms are matched with a scan.
+NGRAM_SIZE = 3
+
+TAG_LOOKUP_LATENCY = Histogram(
+    "metaflow_ui_tag_lookup_duration_seconds",
+    "Duration of tag autocomplete lookups in the in-memory tag index, per operator",
+    ["operator"],
+    buckets=(0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5))
+
+
+def ngrams(value: str, size: int = NGRAM_SIZE) -> Set[str]:
+    "Distinct substrings of the given size"
+    return {value[i:i + size] for i in range(len(value) - size + 1)}
+
+
+class TagIndex(object):
+    """
+    Sorted, n-gram indexed set of tags.
+
+    Lookups return tags in sorted order, paginated with limit and offset, as slicing the sorted tags would.
+    Tags can be added incrementally. Tags are never removed, build a new index instead.
+
+    Parameters
+    ----------
+    tags : Iterable[str]
+        initial tags, in any order. Sorted input is indexed fastest.
+    """
+
+    def __init__(self, tags: Iterable[str] = ()):
+        self._tags: List[str] = sorted(set(tags))
+        self._ngrams: Dict[str, Set[str]] = defaultdict(set)
+        for tag in self._tags:
+            self._index(tag)
+
+    def __len__(self):
+        return len(self._tags)
+
+    def __iter__(self):
+        return iter(self._tags)
+
+    def size_in_bytes(self) -> int:
+        "Size of the sorted list of tags, not counting the tags themselves and the n-gram index"
+        return sys.getsizeof(self._tags)
+
+    def __contains__(self, tag: str):
+        position = bisect.bisect_left(self._tags, tag)
+        return position < len(self._tags) and self._tags[position] == tag
+
+    def _index(self, tag: str):
+        for ngram in ngrams(tag):
+            self._ngrams[ngram].add(tag)
+
+    def add(self, tags: Iterable[str]) -> int:
+        "Add tags that are not indexed yet. Returns the number of added tags."
+        added = 0
+        for tag in tags:
+            if tag in self:
+                continue
+            bisect.insort(self._tags, tag)
+            self._index(tag)
+            added += 1
+        return added
+
+    def find(self, operator: str = None, term: str = None, limit: int = 0, offset: int = 0,
+             filter_func: Callable[[str, str], bool] = None) -> List[str]:
+        """
+        Tags matching the operator and term, in sorted order.
+
+        Parameters
+        ----------
+        operator : str (optional)
+            'sw' for tags starting with the term, 'co' for tags containing the term. Other operators
+            are matched with filter_func on each tag. Without an operator, all tags are returned.
+        term : str (optional)
+            value to match the tags with. A missing term matches all tags for 'sw' and 'co'.
+        limit : int (optional)
+            maximum number of tags to return, 0 for all
+        offset : int (optional)
+            number of matching tags to skip
+        filter_func : Callable[[str, str], bool] (optional)
+            filter called with a tag and the term, for operators that are not indexed
+        """
+        start = time.perf_counter()
+        try:
+            if operator == "sw":
+                matches = self._starting_with(term or "")
+            elif operator == "co":
+                matches = self._containing(term or "")
+            elif operator is not None and filter_func is not None:
+                matches = (tag for tag in self._tags if filter_func(tag, term))
+            else:
+                matches = iter(self._tags)
+            return _page(matches, limit, offset)
+        finally:
+            TAG_LOOKUP_LATENCY.labels(operator or "all").observe(time.perf_counter() - start)
+
+    def _starting_with(self, prefix: str) -> Iterable[str]:
+        position = bisect.bisect_left(self._tags, prefix)
+        while position < len(self._tags) and self._tags[position].startswith(prefix):
+            yield self._tags[position]
+            position += 1
+
+    def _containing(self, term: str) -> Iterable[str]:
+        if len(term) < NGRAM_SIZE:
+            return (tag for tag in self._tags if term in tag)
+        # Tags with all n-grams of the term are candidates, starting from the rarest n-gram
+        postings = sorted((self._ngrams.get(ngram, set()) for ngram in ngrams(term)), key=len)
+        candidates = set(postings[0]).intersection(*postings[1:])
+        return sorted(tag for tag in candidates if term in tag)
+
+
+def _page(matches: Iterable[str], limit: int, offset: int) -> List[str]:
+    "Slice of the matches, consuming only as many matches as the page needs"
+    page = []
+    for index, tag in enumerate(matches):
+        if index < offset:
+            continue
+        if limit and len(page) >= limit:
+            break
+        page.append(tag)
+    return page
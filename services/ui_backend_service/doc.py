@@ -94,6 +94,16 @@ def response_list(ref_definition: str):
                     }
                 }
             },
+            "cursors": {
+                "type": "object",
+                "description": "Keyset pagination cursors, included when the next page can be fetched with one",
+                "properties": {
+                    "next": {
+                        "type": "string",
+                        "description": "Opaque cursor for the `_cursor` query parameter, continues after the last item of this page"
+                    }
+                }
+            },
             "query": {
                 "type": "object",
                 "description": "Object of query parameters"
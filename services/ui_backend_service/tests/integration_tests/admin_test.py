@@ -83,6 +83,20 @@ async def test_ping(cli, db):
     assert body == "pong"
 
 
+async def test_metrics(cli, db):
+    await cli.get("/flows")
+
+    resp = await cli.get("/metrics")
+    body = await resp.text()
+
+    assert resp.status == 200
+    assert resp.headers["Content-Type"].startswith("text/plain")
+    assert 'metaflow_db_query_duration_seconds_count{operation="execute_sql",pool="api",table="flows_v3"}' in body
+    assert 'metaflow_db_pool_acquire_duration_seconds_count{pool="api"}' in body
+    assert 'metaflow_db_pool_connections_in_use{pool="api"}' in body
+    assert 'metaflow_db_pool_connections_free{pool="api"}' in body
+
+
 async def DISABLED_test_version(cli, db):
     resp = await cli.get("/version")
     body = await resp.text()
@@ -91,6 +91,47 @@ async def test_tags_autocomplete(cli, db):
     await _test_list_resources(cli, db, '/tags/autocomplete?tag:re=tag:.*thing', 200, ['tag:something'])
 
 
+async def test_tags_autocomplete_from_run_notifications(cli, db):
+    await cli.server.app.AutoCompleteApi.update_cached_tags()
+    await add_flow(db, flow_id="HelloFlow")
+    _run = (await add_run(db, flow_id="HelloFlow", tags=["tag:notified"])).body
+
+    # tags of inserted runs are added to the cached tags as they are notified
+    await cli.server.app.AutoCompleteApi.notify_handler(
+        "INSERT", [], {"flow_id": _run["flow_id"], "run_number": _run["run_number"]},
+        db.run_table_postgres.table_name)
+    await _test_list_resources(cli, db, '/tags/autocomplete', 200, ['runtime:dev', 'tag:notified'])
+    await _test_list_resources(cli, db, '/tags/autocomplete?tag:sw=tag:', 200, ['tag:notified'])
+    await _test_list_resources(cli, db, '/tags/autocomplete?tag:co=notif', 200, ['tag:notified'])
+
+
+async def test_tags_dictionary(cli, db):
+    await add_flow(db, flow_id="HelloFlow")
+    first = (await add_run(db, flow_id="HelloFlow", tags=["tag:first", "tag:both"])).body
+    second = (await add_run(db, flow_id="HelloFlow", tags=["tag:second", "tag:both"])).body
+
+    resp = await cli.get("/tags")
+    assert resp.status == 200
+    assert await resp.json() == ["runtime:dev", "tag:both", "tag:first", "tag:second"]
+
+    async def _run_counts():
+        res, _, _ = await db.run_tag_table_postgres.find_records(order=["tag"])
+        return {tag["tag"]: tag["run_count"] for tag in res.body}
+
+    assert await _run_counts() == {"runtime:dev": 2, "tag:both": 2, "tag:first": 1, "tag:second": 1}
+
+    # tags that are no longer set on a run are removed
+    await db.run_table_postgres.execute_sql(
+        select_sql="UPDATE {} SET tags = %s WHERE run_number = %s".format(db.run_table_postgres.table_name),
+        values=['["tag:updated"]', first["run_number"]])
+    assert await _run_counts() == {"runtime:dev": 2, "tag:both": 1, "tag:second": 1, "tag:updated": 1}
+
+    await db.run_table_postgres.execute_sql(
+        select_sql="DELETE FROM {} WHERE run_number = %s".format(db.run_table_postgres.table_name),
+        values=[second["run_number"]])
+    assert await _run_counts() == {"runtime:dev": 1, "tag:updated": 1}
+
+
 async def test_artifacts_autocomplete(cli, db):
     _flow = (await add_flow(db, flow_id="HelloFlow")).body
     _run = (await add_run(db, flow_id=_flow.get("flow_id"))).body
@@ -52,6 +52,44 @@ async def test_list_metadata(cli, db):
     await _test_list_resources(cli, db, "/flows/{flow_id}/runs/{run_number}/steps/{step_name}/tasks/{task_id}/metadata".format(**_metadata), 200, [_metadata])
 
 
+async def test_list_metadata_keyset_pagination(cli, db):
+    _flow = (await add_flow(db, flow_id="HelloFlow")).body
+    _run = (await add_run(db, flow_id=_flow.get("flow_id"))).body
+    _step = (await add_step(db, flow_id=_run.get("flow_id"), step_name="step", run_number=_run.get("run_number"), run_id=_run.get("run_id"))).body
+    _task = (await add_task(db,
+                            flow_id=_step.get("flow_id"),
+                            step_name=_step.get("step_name"),
+                            run_number=_step.get("run_number"),
+                            run_id=_step.get("run_id"))).body
+
+    # metadata of the same field shares the primary key
+    _metadata = []
+    for attempt in range(3):
+        _metadata.append((await add_metadata(db,
+                                             flow_id=_task.get("flow_id"),
+                                             run_number=_task.get("run_number"),
+                                             run_id=_task.get("run_id"),
+                                             step_name=_task.get("step_name"),
+                                             task_id=_task.get("task_id"),
+                                             task_name=_task.get("task_name"),
+                                             metadata={
+                                                 "field_name": "attempt",
+                                                 "value": str(attempt),
+                                                 "type": "attempt"})).body)
+
+    path = "/flows/{flow_id}/runs/{run_number}/steps/{step_name}/tasks/{task_id}/metadata".format(**_task)
+    rows = []
+    next_url = path + "?_limit=1&_cursor="
+    while next_url:
+        body = await (await cli.get(next_url)).json()
+        rows.extend(body["data"])
+        next_url = body["links"]["next"]
+        if next_url:
+            next_url = next_url[next_url.index(path):]
+
+    assert sorted(row["id"] for row in rows) == sorted(row["id"] for row in _metadata)
+
+
 async def test_list_metadata_field_names(cli, db):
     _flow = (await add_flow(db, flow_id="HelloFlow")).body
     _run = (await add_run(db, flow_id=_flow.get("flow_id"))).body
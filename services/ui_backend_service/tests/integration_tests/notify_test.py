@@ -1,3 +1,4 @@
+import json
 import pytest
 from .utils import (
     init_app, init_db, clean_db,
@@ -8,6 +9,7 @@ from typing import List, Dict
 from asyncio import Future, wait_for
 
 from services.ui_backend_service.api.notify import ListenNotify
+from services.data.postgres_async_db import PostgresUtils
 
 pytestmark = [pytest.mark.integration_tests]
 
@@ -387,6 +389,66 @@ async def test_pg_notify_dag_code_package(cli, db, loop):
     assert flow_name == "HelloFlow"
     assert str(run_number) == str(_task.get("run_number"))
 
+
+async def test_pg_notify_statement_level_trigger_batches(cli, db, loop):
+    _flow = (await add_flow(db, flow_id="HelloFlow")).body
+    _run = (await add_run(db, flow_id=_flow.get("flow_id"))).body
+    _step = (await add_step(db, flow_id=_run.get("flow_id"), step_name="step", run_number=_run.get("run_number"), run_id=_run.get("run_id"))).body
+    _task = (await add_task(db,
+                            flow_id=_step.get("flow_id"),
+                            step_name=_step.get("step_name"),
+                            run_number=_step.get("run_number"),
+                            run_id=_step.get("run_id"))).body
+
+    cli.server.app.event_emitter.remove_all_listeners()
+
+    artifact_count = 300
+    _all_received = Future(loop=loop)
+    received = []
+
+    async def _event_handler(operation: str, resources: List[str], result: Dict, table, filter_dict):
+        if table == db.artifact_table_postgres.table_name:
+            received.append([operation, result])
+            if len(received) == artifact_count:
+                _all_received.set_result(True)
+    cli.server.app.event_emitter.on('notify', _event_handler)
+
+    table_name = db.artifact_table_postgres.table_name
+    await PostgresUtils.setup_trigger_notify(
+        db, table_name, keys=db.artifact_table_postgres.trigger_keys, statement_level=True)
+    try:
+        async with db.pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute("LISTEN notify")
+                # Insert all artifacts with a single statement
+                await cur.execute(
+                    """
+                    INSERT INTO {} (flow_id, run_number, step_name, task_id, attempt_id, name, location, ds_type, ts_epoch)
+                    SELECT %s, %s, %s, %s, 0, 'artifact_' || i, ' ', ' ', 0 FROM generate_series(1, %s) AS i
+                    """.format(table_name),
+                    [_task["flow_id"], _task["run_number"], _task["step_name"], _task["task_id"], artifact_count])
+
+                await wait_for(_all_received, 5)
+
+                payloads = []
+                while not conn.notifies.empty():
+                    msg = conn.notifies.get_nowait()
+                    if msg.channel == "notify":
+                        payloads.append(msg.payload)
+    finally:
+        await PostgresUtils.setup_trigger_notify(db, table_name, keys=db.artifact_table_postgres.trigger_keys)
+
+    # keys of the inserted rows are batched in a few notifications that fit in the payload limit
+    assert 1 < len(payloads) < artifact_count
+    assert all(len(payload.encode("utf-8")) < 8000 for payload in payloads)
+    assert sum(len(json.loads(payload)["data"]) for payload in payloads) == artifact_count
+
+    # and are broadcast one row at a time
+    assert all(operation == "INSERT" for operation, _ in received)
+    assert sorted(result["name"] for _, result in received) == \
+        sorted("artifact_{}".format(i) for i in range(1, artifact_count + 1))
+    assert received[0][1] == assertable_artifact(dict(_task, attempt_id=0, name=received[0][1]["name"]))
+
 # Helpers
 
 
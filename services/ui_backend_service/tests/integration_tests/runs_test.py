@@ -401,3 +401,62 @@ async def test_single_run_attempt_ok_failed(cli, db):
     _run["duration"] = _run["finished_at"] - _run["ts_epoch"]
 
     await _test_single_resource(cli, db, "/flows/{flow_id}/runs/{run_number}".format(**_run), 200, _run)
+
+
+async def test_list_runs_completed_from_run_summary(cli, db):
+    _flow = (await add_flow(db, flow_id="HelloFlow")).body
+
+    async def _add_run(attempt_ok=None):
+        _run = (await add_run(db, flow_id=_flow.get("flow_id"))).body
+        if attempt_ok is None:
+            return _run
+        _step = (await add_step(db, flow_id=_run.get("flow_id"), step_name="end", run_number=_run.get("run_number"), run_id=_run.get("run_id"))).body
+        _task = (await add_task(db,
+                                flow_id=_step.get("flow_id"),
+                                step_name=_step.get("step_name"),
+                                run_number=_step.get("run_number"),
+                                run_id=_step.get("run_id"))).body
+        await add_metadata(db,
+                           flow_id=_task.get("flow_id"),
+                           run_number=_task.get("run_number"),
+                           run_id=_task.get("run_id"),
+                           step_name=_task.get("step_name"),
+                           task_id=_task.get("task_id"),
+                           task_name=_task.get("task_name"),
+                           tags=["attempt_id:0"],
+                           metadata={
+                               "field_name": "attempt_ok",
+                               "value": attempt_ok,
+                               "type": "internal_attempt_status"})
+        return _run
+
+    _first = await _add_run("True")
+    await _add_run()
+    await _add_run("False")
+    _second = await _add_run("True")
+
+    _, data = await _test_list_resources(cli, db, "/runs?status=completed&_order=-finished_at", 200, None)
+    assert [run["run_number"] for run in data] == [int(_second["run_number"]), int(_first["run_number"])]
+    assert all(run["status"] == "completed" for run in data)
+    assert all("final_status" not in run for run in data)
+
+    _, data = await _test_list_resources(
+        cli, db, "/runs?status=completed&finished_at:gt={}&_order=+duration".format(data[1]["finished_at"]), 200, None)
+    assert [run["run_number"] for run in data] == [int(_second["run_number"])]
+
+    # pages continue after the stored finish time of the last completed run
+    _, data = await _test_list_resources(cli, db, "/runs?status=completed&_order=-finished_at&_limit=1", 200, None)
+    assert [run["run_number"] for run in data] == [int(_second["run_number"])]
+    _next = (await (await cli.get("/runs?status=completed&_order=-finished_at&_limit=1")).json())["links"]["next"]
+    _, data = await _test_list_resources(cli, db, _next[_next.index("/runs"):], 200, None)
+    assert [run["run_number"] for run in data] == [int(_first["run_number"])]
+
+    # and so do keysets
+    _next = (await (await cli.get("/runs?status=completed&_order=-finished_at&_limit=1&_cursor=")).json())["links"]["next"]
+    assert "_cursor" in _next
+    _, data = await _test_list_resources(cli, db, _next[_next.index("/runs"):], 200, None)
+    assert [run["run_number"] for run in data] == [int(_first["run_number"])]
+
+    # other statuses are derived from heartbeats
+    _, data = await _test_list_resources(cli, db, "/runs?status=completed,failed", 200, None)
+    assert len(data) == 3
@@ -359,3 +359,64 @@ async def test_run_status_failed_with_retrying_task(cli, db):
     _, data = await _test_single_resource(cli, db, "/flows/{flow_id}/runs/{run_number}".format(**_run), 200)
 
     assert data["status"] == "failed"
+
+
+# Run should have "Running" status again when the end step is retried after it failed
+
+
+async def test_run_status_with_retried_end_step(cli, db):
+    _flow = (await add_flow(db, flow_id="HelloFlow")).body
+    _run = (await add_run(db, flow_id=_flow.get("flow_id"))).body
+    _step = (await add_step(db, flow_id=_run.get("flow_id"), step_name="end", run_number=_run.get("run_number"), run_id=_run.get("run_id"))).body
+    _task = (await add_task(db,
+                            flow_id=_step.get("flow_id"),
+                            step_name=_step.get("step_name"),
+                            run_number=_step.get("run_number"),
+                            run_id=_step.get("run_id"))).body
+
+    async def _add_end_metadata(field_name, value, attempt_id):
+        return (await add_metadata(db,
+                                   flow_id=_task.get("flow_id"),
+                                   run_number=_task.get("run_number"),
+                                   run_id=_task.get("run_id"),
+                                   step_name=_task.get("step_name"),
+                                   task_id=_task.get("task_id"),
+                                   task_name=_task.get("task_name"),
+                                   tags=["attempt_id:{}".format(attempt_id)],
+                                   metadata={
+                                       "field_name": field_name,
+                                       "value": value,
+                                       "type": field_name})).body
+
+    async def _summary():
+        return (await db.run_summary_table_postgres.get_records(
+            filter_dict={"flow_id": _run["flow_id"], "run_number": int(_run["run_number"])}, fetch_single=True)).body
+
+    run_path = "/flows/{flow_id}/runs/{run_number}".format(**_run)
+
+    await _add_end_metadata("attempt", "0", 0)
+    _, data = await _test_single_resource(cli, db, run_path, 200, None)
+    assert data["status"] == "running"
+    assert (await _summary())["status"] is None
+
+    _failed = await _add_end_metadata("attempt_ok", "False", 0)
+    _, data = await _test_single_resource(cli, db, run_path, 200, None)
+    assert data["status"] == "failed"
+    assert data["finished_at"] == _failed["ts_epoch"]
+    assert data["duration"] == _failed["ts_epoch"] - _run["ts_epoch"]
+
+    # retrying the end step
+    await _add_end_metadata("attempt", "1", 1)
+    _, data = await _test_single_resource(cli, db, run_path, 200, None)
+    assert data["status"] == "running"
+    assert data["finished_at"] is None
+
+    _ok = await _add_end_metadata("attempt_ok", "True", 1)
+    _, data = await _test_single_resource(cli, db, run_path, 200, None)
+    assert data["status"] == "completed"
+    assert data["finished_at"] == _ok["ts_epoch"]
+    assert data["duration"] == _ok["ts_epoch"] - _run["ts_epoch"]
+
+    _summary_row = await _summary()
+    assert (_summary_row["status"], _summary_row["finished_at"], _summary_row["duration"]) == \
+        ("completed", _ok["ts_epoch"], _ok["ts_epoch"] - _run["ts_epoch"])
@@ -58,6 +58,58 @@ async def test_list_tasks_non_numerical(cli, db):
     assert data[0]['task_id'] != 'bar'
 
 
+async def test_list_tasks_keyset_pagination(cli, db):
+    _task = await create_task(db)
+    for _ in range(4):
+        await create_task(db, step=_task)
+
+    path = "/flows/{flow_id}/runs/{run_number}/steps/{step_name}/tasks".format(**_task)
+    all_tasks = (await (await cli.get(path + "?_order=-ts_epoch&_limit=10&_cursor=")).json())["data"]
+    assert len(all_tasks) == 5
+
+    # requests without a _cursor are paginated by page number only
+    body = await (await cli.get(path + "?_order=-ts_epoch&_limit=2")).json()
+    assert "cursors" not in body
+    assert "_cursor" not in body["links"]["next"]
+
+    # follow the next links, which continue after the last row instead of using an OFFSET
+    pages = []
+    next_url = path + "?_order=-ts_epoch&_limit=2&_cursor="
+    while next_url:
+        body = await (await cli.get(next_url)).json()
+        pages.append(body["data"])
+        next_url = body["links"]["next"]
+        if next_url:
+            assert body["cursors"]["next"] in next_url
+            next_url = next_url[next_url.index(path):]
+
+    assert [len(page) for page in pages] == [2, 2, 1]
+    assert [task["task_id"] for page in pages for task in page] == [task["task_id"] for task in all_tasks]
+
+    # invalid cursors are ignored
+    body = await (await cli.get(path + "?_order=-ts_epoch&_limit=2&_cursor=invalid")).json()
+    assert [task["task_id"] for task in body["data"]] == [task["task_id"] for task in all_tasks[:2]]
+
+
+async def test_list_task_attempts_keyset_pagination(cli, db):
+    _task = await create_task(db)
+    for attempt in range(3):
+        await create_task_attempt_metadata(db, _task, attempt=attempt)
+
+    # rows of the attempts of a task share the primary key of the task
+    path = "/flows/{flow_id}/runs/{run_number}/steps/{step_name}/tasks".format(**_task)
+    rows = []
+    next_url = path + "?_limit=1&_cursor="
+    while next_url:
+        body = await (await cli.get(next_url)).json()
+        rows.extend(body["data"])
+        next_url = body["links"]["next"]
+        if next_url:
+            next_url = next_url[next_url.index(path):]
+
+    assert sorted(task["attempt_id"] for task in rows) == [0, 1, 2]
+
+
 async def test_single_task(cli, db):
     await _test_single_resource(cli, db, "/flows/HelloFlow/runs/404/steps/none/tasks/5", 404, {})
 
@@ -484,6 +536,31 @@ async def test_task_attempt_status_failed_with_existing_subsequent_attempt(cli,
 
 
 
+async def test_task_attempts_summary(cli, db):
+    _task = await create_task(db)
+    task_keys = {"flow_id": _task["flow_id"], "run_number": int(_task["run_number"]),
+                 "step_name": _task["step_name"], "task_id": int(_task["task_id"])}
+
+    # attempts are summarized regardless of the order and encoding of their metadata,
+    # and values that are not attempt ids do not fail the insert of the metadata
+    await create_metadata_for_task(db, _task, metadata={"type": "attempt", "field_name": "attempt", "value": "none"})
+    _attempt_ok = await create_task_attempt_ok_metadata(db, _task, 0, True)
+    _artifact = await create_ok_artifact_for_task(db, _task)
+    _attempt = await create_metadata_for_task(db, _task, metadata={"type": "attempt", "field_name": "attempt", "value": "[0]"})
+    _attempt_done = await create_task_attempt_done_metadata(db, _task)
+
+    _summary = (await db.task_attempt_table_postgres.get_records(filter_dict=task_keys)).body
+    assert _summary == [dict(
+        task_keys,
+        attempt_id=0,
+        started_at=_attempt["ts_epoch"],
+        attempt_finished_at=max(_attempt_ok["ts_epoch"], _attempt_done["ts_epoch"]),
+        attempt_ok=True,
+        task_ok_finished_at=_artifact["ts_epoch"],
+        task_ok_location=_artifact["location"]
+    )]
+
+
 # Resource Helpers / factories
 
 
@@ -8,6 +8,7 @@ import datetime
 import contextlib
 
 from services.ui_backend_service.data.db import AsyncPostgresDB
+from services.data.db_utils import parse_attempt_id
 from services.ui_backend_service.data.cache.store import CacheStore
 from services.utils.tests import get_test_dbconf
 
@@ -49,7 +50,7 @@ def init_app(loop, aiohttp_client, queue_ttl=30):
 
     cache_store = CacheStore(db=db, event_emitter=app.event_emitter)
 
-    app.AutoCompleteApi = AutoCompleteApi(app, db)
+    app.AutoCompleteApi = AutoCompleteApi(app, db, app.event_emitter)
     FlowApi(app, db)
     RunApi(app, db)
     StepApi(app, db)
@@ -88,11 +89,14 @@ async def init_db(cli):
 async def clean_db(db: AsyncPostgresDB):
     # Tables to clean (order is important due to foreign keys)
     tables = [
+        db.run_summary_table_postgres,
+        db.task_attempt_table_postgres,
         db.metadata_table_postgres,
         db.artifact_table_postgres,
         db.task_table_postgres,
         db.step_table_postgres,
         db.run_table_postgres,
+        db.run_tag_table_postgres,
         db.flow_table_postgres
     ]
     for table in tables:
@@ -194,7 +198,8 @@ async def add_metadata(db: AsyncPostgresDB, flow_id="HelloFlow",
         "type": metadata.get("type", " "),
         "user_name": user_name,
         "tags": json.dumps(tags),
-        "system_tags": json.dumps(system_tags)
+        "system_tags": json.dumps(system_tags),
+        "attempt_id": parse_attempt_id(metadata.get("field_name"), metadata.get("value"), tags)
     }
     return await db.metadata_table_postgres.create_record(values)
 
@@ -0,0 +1,49 @@
+import pytest
+
+from services.ui_backend_service.api.utils import operators_to_filters
+from services.ui_backend_service.data.tag_index import TagIndex
+
+pytestmark = [pytest.mark.unit_tests]
+
+TAGS = ["user:dipper", "user:mabel", "project:mystery", "runtime:dev", "env:prod", "env:dev", "stan"]
+
+
+@pytest.mark.parametrize("operator, term", [
+    (None, None),
+    ("sw", "user:"),
+    ("sw", "env"),
+    ("sw", "x"),
+    ("sw", ""),
+    ("co", "dev"),
+    ("co", "e"),
+    ("co", "ab"),
+    ("co", "ystery"),
+    ("co", "nothing"),
+    ("ew", "dev"),
+    ("re", "user:.*p"),
+])
+@pytest.mark.parametrize("limit, offset", [(0, 0), (2, 0), (2, 1), (10, 5)])
+def test_find_matches_scan(operator, term, limit, offset):
+    index = TagIndex(TAGS)
+    expected = [tag for tag in sorted(TAGS) if operator is None or operators_to_filters[operator](tag, term)]
+    expected = expected[offset:(offset + limit) if limit else None]
+
+    assert index.find(operator, term, limit=limit, offset=offset,
+                      filter_func=operators_to_filters.get(operator)) == expected
+
+
+def test_add():
+    index = TagIndex(["user:dipper", "runtime:dev"])
+    assert index.add(["user:mabel", "runtime:dev", "user:mabel"]) == 1
+    assert list(index) == ["runtime:dev", "user:dipper", "user:mabel"]
+    assert "user:mabel" in index and "user:stan" not in index
+
+    assert index.find("sw", "user:") == ["user:dipper", "user:mabel"]
+    assert index.find("co", "abel") == ["user:mabel"]
+
+
+@pytest.mark.parametrize("operator", ["sw", "co"])
+def test_find_without_term(operator):
+    index = TagIndex(TAGS)
+    assert index.find(operator, None) == sorted(TAGS)
+    assert index.find(operator, None, limit=2, offset=1) == sorted(TAGS)[1:3]
@@ -6,6 +6,7 @@ from aiohttp.test_utils import make_mocked_request
 
 from services.ui_backend_service.api.utils import (
     format_response, format_response_list,
+    encode_cursor, decode_cursor,
     pagination_query,
     builtin_conditions_query,
     custom_conditions_query,
@@ -107,6 +108,60 @@ def test_format_response_list_next_page_null():
     assert status == 200
 
 
+def test_format_response_list_next_cursor():
+    request = make_mocked_request(
+        'GET', '/runs?_limit=1&_page=1', headers={'Host': 'test'})
+
+    db_response = DBResponse(response_code=200, body=[{"foo": "bar"}])
+    last_key = {"ts_epoch": 1, "flow_id": "HelloFlow", "run_number": 2}
+    pagination = DBPagination(limit=1, offset=0, count=1, page=1, last_key=last_key)
+
+    status, response = format_response_list(request, db_response, pagination, 1)
+    cursor = response["cursors"]["next"]
+    assert decode_cursor(cursor) == last_key
+    assert response["links"]["next"] == "http://test/runs?_limit=1&_page=2&_cursor={}".format(cursor)
+    assert response["pages"]["next"] == 2
+    assert status == 200
+
+
+def test_format_response_list_links_with_request_cursor():
+    cursor = encode_cursor({"ts_epoch": 1, "flow_id": "HelloFlow", "run_number": 2})
+    request = make_mocked_request(
+        'GET', '/runs?_limit=1&_page=2&_cursor={}'.format(cursor), headers={'Host': 'test'})
+
+    db_response = DBResponse(response_code=200, body=[{"foo": "bar"}])
+    last_key = {"ts_epoch": 0, "flow_id": "HelloFlow", "run_number": 1}
+    pagination = DBPagination(limit=1, offset=1, count=1, page=2, last_key=last_key)
+
+    status, response = format_response_list(request, db_response, pagination, 2, page_count=3)
+    next_cursor = response["cursors"]["next"]
+    assert response["links"] == {
+        "self": "http://test/runs?_limit=1&_page=2&_cursor={}".format(cursor),
+        "first": "http://test/runs?_limit=1&_page=1",
+        "prev": "http://test/runs?_limit=1&_page=1",
+        "next": "http://test/runs?_limit=1&_page=3&_cursor={}".format(next_cursor),
+        "last": "http://test/runs?_limit=1&_page=3",
+    }
+
+    # Without a cursor for the next page, the next page is linked by page number only
+    pagination = DBPagination(limit=1, offset=1, count=1, page=2)
+    status, response = format_response_list(request, db_response, pagination, 2, page_count=3)
+    assert response["links"]["next"] == "http://test/runs?_limit=1&_page=3"
+    assert status == 200
+
+
+def test_cursor_encoding():
+    last_key = {"ts_epoch": 1, "user": None, "duration": 1.5}
+    assert decode_cursor(encode_cursor(last_key)) == last_key
+
+    # JSON values can not be used as keys
+    assert encode_cursor({"tags": ["foo:bar"]}) is None
+
+    assert decode_cursor(None) is None
+    assert decode_cursor("invalid") is None
+    assert decode_cursor(encode_cursor({"ts_epoch": 1})[:-2]) is None
+
+
 def test_pagination_query_defaults():
     request = make_mocked_request('GET', '/runs')
 
@@ -145,6 +200,15 @@ def test_pagination_query_custom_order_asc():
     assert order == ["\"foo\" ASC"]
 
 
+def test_pagination_query_columns():
+    request = make_mocked_request('GET', '/runs?_order=%2Bfoo,bar')
+
+    _, _, _, order, _, _ = pagination_query(
+        request=request, allowed_order=["foo", "bar"], columns={"foo": "stored_foo"})
+
+    assert order == ["\"stored_foo\" ASC", "\"bar\" DESC"]
+
+
 def test_pagination_query_not_allowed():
     request = make_mocked_request(
         'GET', '/runs?_limit=5&_page=3&_order=none&_group=none')
@@ -275,6 +339,17 @@ def test_custom_conditions_query_allow_any_key():
     assert values[1] == "completed"
 
 
+def test_custom_conditions_query_columns():
+    request = make_mocked_request(
+        "GET", "/runs?flow_id=HelloFlow&status=completed,failed")
+
+    conditions, values = custom_conditions_query(
+        request, allowed_keys=["flow_id", "status"], columns={"status": "final_status"})
+
+    assert conditions == ["(\"flow_id\" = %s)", "(\"final_status\" = %s OR \"final_status\" = %s)"]
+    assert values == ["HelloFlow", "completed", "failed"]
+
+
 def test_resource_conditions():
     path, query, _ = resource_conditions(
         "/runs?flow_id=HelloFlow&status=running")
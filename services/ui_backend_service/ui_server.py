@@ -53,33 +53,34 @@ def app(loop=None, db_conf: DBConfiguration = None):
     app = web.Application(loop=loop) if len(PATH_PREFIX) > 0 else _app
 
     async_db = AsyncPostgresDB('ui')
-    loop.run_until_complete(async_db._init(db_conf=db_conf, create_triggers=DB_TRIGGER_CREATE))
+    async_db_cache = AsyncPostgresDB('ui:cache')
+    async_db_notify = AsyncPostgresDB('ui:notify') if FEATURE_DB_LISTEN_ENABLE else None
+    async_db_heartbeat = AsyncPostgresDB('ui:heartbeat') if FEATURE_HEARTBEAT_ENABLE else None
+    async_db_ws = AsyncPostgresDB('ui:websocket') if FEATURE_WS_ENABLE else None
+
+    # Connect all pools concurrently. Tables and triggers are set up once, the other pools skip
+    # the setup when they find the same schema fingerprint.
+    loop.run_until_complete(asyncio.gather(
+        async_db._init(db_conf=db_conf, create_triggers=DB_TRIGGER_CREATE),
+        *[db._init(db_conf) for db in [async_db_cache, async_db_notify, async_db_heartbeat, async_db_ws] if db]))
 
     event_emitter = AsyncIOEventEmitter()
 
-    async_db_cache = AsyncPostgresDB('ui:cache')
-    loop.run_until_complete(async_db_cache._init(db_conf))
     cache_store = CacheStore(db=async_db_cache, event_emitter=event_emitter)
     app.on_startup.append(cache_store.start_caches)
     app.on_cleanup.append(cache_store.stop_caches)
 
     if FEATURE_DB_LISTEN_ENABLE:
-        async_db_notify = AsyncPostgresDB('ui:notify')
-        loop.run_until_complete(async_db_notify._init(db_conf))
         ListenNotify(app, db=async_db_notify, event_emitter=event_emitter)
 
     if FEATURE_HEARTBEAT_ENABLE:
-        async_db_heartbeat = AsyncPostgresDB('ui:heartbeat')
-        loop.run_until_complete(async_db_heartbeat._init(db_conf))
         RunHeartbeatMonitor(event_emitter, db=async_db_heartbeat)
         TaskHeartbeatMonitor(event_emitter, db=async_db_heartbeat, cache=cache_store)
 
     if FEATURE_WS_ENABLE:
-        async_db_ws = AsyncPostgresDB('ui:websocket')
-        loop.run_until_complete(async_db_ws._init(db_conf))
         Websocket(app, db=async_db_ws, event_emitter=event_emitter, cache=cache_store)
 
-    AutoCompleteApi(app, async_db)
+    AutoCompleteApi(app, async_db, event_emitter if FEATURE_DB_LISTEN_ENABLE else None)
     FlowApi(app, async_db)
     RunApi(app, async_db, cache_store)
     StepApi(app, async_db)
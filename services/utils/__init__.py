@@ -7,7 +7,7 @@ from multidict import MultiDict
 from urllib.parse import urlencode, quote
 from aiohttp import web
 from functools import wraps
-from typing import Dict
+from typing import Dict, List
 import logging
 import psycopg2
 from distutils.version import LooseVersion
@@ -156,6 +156,10 @@ def has_heartbeat_capable_version_tag(system_tags):
 #
 
 
+# Supported database drivers. asyncpg is an optional dependency.
+DB_ENGINES = ["aiopg", "asyncpg"]
+
+
 class DBConfiguration(object):
     host: str = None
     port: int = None
@@ -170,6 +174,15 @@ class DBConfiguration(object):
 
     timeout: int = None  # aiopg default: 60 (seconds)
 
+    # Database driver used for the connection pool, one of DB_ENGINES.
+    engine: str = None
+
+    # Read replicas used for queries. Empty list when all queries go to the primary.
+    replica_dsns: List[str] = None
+
+    # Retry single row lookups on the primary when a replica has not replicated the row yet.
+    replica_fallback: bool = None
+
     _dsn: str = None
 
     def __init__(self,
@@ -182,7 +195,10 @@ class DBConfiguration(object):
                  prefix="MF_METADATA_DB_",
                  pool_min: int = 1,
                  pool_max: int = 10,
-                 timeout: int = 60):
+                 timeout: int = 60,
+                 engine: str = "aiopg",
+                 replica_dsns: List[str] = None,
+                 replica_fallback: bool = True):
 
         self._dsn = os.environ.get(prefix + "DSN", dsn)
         # Check if it is a BAD DSN String.
@@ -222,6 +238,25 @@ class DBConfiguration(object):
 
         self.timeout = int(os.environ.get(prefix + "TIMEOUT", timeout))
 
+        self.engine = os.environ.get(prefix + "ENGINE", engine)
+        if self.engine not in DB_ENGINES:
+            raise Exception(
+                f"Unsupported database engine '{self.engine}' in {prefix}ENGINE. "
+                f"Supported engines are: {', '.join(DB_ENGINES)}"
+            )
+
+        # Replica DSN strings are separated by semicolons in the environment variable.
+        env_replica_dsns = os.environ.get(prefix + "REPLICA_DSNS")
+        if env_replica_dsns is not None:
+            replica_dsns = [dsn.strip() for dsn in env_replica_dsns.split(";") if dsn.strip()]
+        self.replica_dsns = list(replica_dsns or [])
+        for replica_dsn in self.replica_dsns:
+            if not self._is_valid_dsn(replica_dsn):
+                raise Exception(f"Invalid replica DSN string in {prefix}REPLICA_DSNS")
+
+        self.replica_fallback = os.environ.get(
+            prefix + "REPLICA_FALLBACK", "1" if replica_fallback else "0") == "1"
+
     @staticmethod
     def _is_valid_dsn(dsn):
         try:
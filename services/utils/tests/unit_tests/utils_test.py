@@ -139,6 +139,45 @@ def test_db_conf_timeout():
         db_conf = DBConfiguration(timeout=5)
         assert db_conf.timeout == 5
 
+
+def test_db_conf_engine():
+    with set_env():
+        assert DBConfiguration().engine == "aiopg"
+        assert DBConfiguration(engine="asyncpg").engine == "asyncpg"
+
+    with set_env({'MF_METADATA_DB_ENGINE': 'asyncpg'}):
+        assert DBConfiguration().engine == "asyncpg"
+
+    with set_env({'MF_METADATA_DB_ENGINE': 'unknown'}):
+        with pytest.raises(Exception):
+            DBConfiguration()
+
+
+def test_db_conf_replicas():
+    replica_1 = "dbname=foo user=bar host=replica1 port=5432 password=password"
+    replica_2 = "dbname=foo user=bar host=replica2 port=5432 password=password"
+    with set_env():
+        db_conf = DBConfiguration()
+        assert db_conf.replica_dsns == []
+        assert db_conf.replica_fallback is True
+
+        db_conf = DBConfiguration(replica_dsns=[replica_1], replica_fallback=False)
+        assert db_conf.replica_dsns == [replica_1]
+        assert db_conf.replica_fallback is False
+
+    with set_env({
+        'MF_METADATA_DB_REPLICA_DSNS': "{}; {};".format(replica_1, replica_2),
+        'MF_METADATA_DB_REPLICA_FALLBACK': '0'
+    }):
+        db_conf = DBConfiguration()
+        assert db_conf.replica_dsns == [replica_1, replica_2]
+        assert db_conf.replica_fallback is False
+
+    with set_env({'MF_METADATA_DB_REPLICA_DSNS': 'host=replica1 port=5432 password'}):
+        with pytest.raises(Exception):
+            DBConfiguration()
+
+
 async def test_handle_exceptions():
     class FakeException(Exception):
         def __init__(self, id, trace):